@@ -1,60 +1,78 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
-from PIL import Image, ImageTk
+from PIL import Image
 # from spellchecker import SpellChecker
 
-from components import process
-from util import upscale_to_300_dpi
+from components import Pipeline
+from ocr_cache import get_ocr_cache
+from viewer import ImagePyramid, TiledCanvas
+from worker import JobRunner
+
+POLL_INTERVAL_MS = 50
 
 # Replace this with your image processing function
-def process_image(image):
-    # Your image processing logic here
-    processed_image, s, tesserect_article = process(
-        image, 
-        indent_check=indent_check_var.get() > 0, 
-        spell_check=spell_check_var.get() > 0, 
-    )
-    return processed_image, s.as_str()
+def process_image(pipeline: Pipeline):
+    """
+    Runs the pipeline on the background thread with the current settings. A
+    newer call cancels this one, results arrive in `poll_events`.
+    """
+    # NOTE: Tk variables are read here, on the main thread
+    indent_check = indent_check_var.get() > 0
+    spell_check = spell_check_var.get() > 0
+    new_image = canvas.original_image is not pipeline.image
+    canvas.pipeline = pipeline
+
+    def work(job):
+        # NOTE: OCR and the tree are memoized in the pipeline, toggling a check only re-runs what depends on it
+        board, s, tesserect_article, diagnostics = pipeline.run(
+            indent_check=indent_check, 
+            spell_check=spell_check, 
+            progress=job.progress,
+        )
+        # NOTE: the pyramid is built once per image, here rather than on the main thread
+        pyramid = ImagePyramid(pipeline.image) if new_image else None
+        return pipeline, pyramid, board, s.as_str()
+
+    runner.submit(work)
+    status_var.set("Starting...")
+    progress_bar["value"] = 0
+
+def poll_events():
+    for event in runner.drain():
+        kind, job_id = event[:2]
+        if not runner.is_latest(job_id):
+            continue
+        if kind == "progress":
+            stage, index, total = event[2:]
+            status_var.set(f"{stage.replace('_', ' ').capitalize()}...")
+            progress_bar["value"] = 100 * index / total
+        elif kind == "done":
+            pipeline, pyramid, board, processed_text = event[2]
+            canvas.board = board  # Store annotations
+            if pyramid is not None:
+                canvas.original_image = pipeline.image  # Store original image
+                viewer.set_image(pyramid, board)
+            else:
+                viewer.set_board(board)
+            display_text(processed_text)
+            status_var.set("Done")
+            progress_bar["value"] = 100
+        elif kind == "error":
+            status_var.set("Failed")
+            progress_bar["value"] = 0
+            messagebox.showerror("Error", f"Failed to process image: {event[2]}")
+    root.after(POLL_INTERVAL_MS, poll_events)
 
 def select_image():
     path = filedialog.askopenfilename(filetypes=[("Image files", "*.jpg *.png *.bmp")])
     if path:
         try:
             image = Image.open(path)
-            original_size = image.size
-            # image = upscale_to_300_dpi(image)
-            # processed_image.resize(original_size, Image.LANCZOS)
-            
-            processed_image, processed_text = process_image(image)
-            canvas.original_image = image  # Store original image
-            canvas.processed_image = processed_image.copy()  # Store processed image
-            update_image_display()  # Initial display
-            display_text(processed_text)
+
+            process_image(Pipeline(image, ocr_cache=get_ocr_cache()))
         except Exception as e:
             messagebox.showerror("Error", f"Failed to process image: {e}")
 
-def update_image_display(event=None):
-    if not hasattr(canvas, 'original_image') or canvas.original_image is None:
-        return
-    if not hasattr(canvas, 'processed_image') or canvas.processed_image is None:
-        canvas.processed_image = canvas.original_image.copy()
-    canvas_width = event.width if event else canvas.winfo_width()
-    processed_image = canvas.processed_image
-    
-    orig_w, orig_h = processed_image.size
-    if orig_w == 0 or orig_h == 0:
-        return
-    scale = canvas_width / orig_w
-    new_height = int(orig_h * scale)
-    # Use Image.LANCZOS instead of Image.ANTIALIAS
-    resized_image = processed_image.resize((canvas_width, new_height), Image.LANCZOS)
-    photo = ImageTk.PhotoImage(resized_image)
-    canvas.delete("all")
-    canvas.create_image(0, 0, anchor=tk.NW, image=photo)
-    canvas.image = photo  # Keep reference
-    canvas.displayed_image = resized_image  # Store for saving
-    canvas.config(scrollregion=canvas.bbox(tk.ALL))
-
 def display_text(text):
     text_widget.config(state=tk.NORMAL)
     text_widget.delete(1.0, tk.END)
@@ -62,11 +80,12 @@ def display_text(text):
     text_widget.config(state=tk.DISABLED)
 
 def save_image():
-    if hasattr(canvas, 'displayed_image'):
+    if canvas.board is not None:
         path = filedialog.asksaveasfilename(defaultextension=".png", filetypes=[("JPEG", "*.jpg"), ("PNG", "*.png")], initialfile="processed.png")
         if path:
             try:
-                canvas.displayed_image.save(path)
+                # NOTE: saved at the scan's resolution, not the zoom it is viewed at
+                canvas.board.render(canvas.original_image).save(path)
                 # messagebox.showinfo("Success", "Image saved successfully.")
             except Exception as e:
                 messagebox.showerror("Error", f"Failed to save image: {e}")
@@ -75,6 +94,18 @@ def save_image():
 
 def on_mousewheel(event):
     canvas.yview_scroll(int(-1 * (event.delta / 120)), "units")
+    viewer.render_visible()
+
+def on_zoom_wheel(event):
+    viewer.zoom_by(1.25 if event.delta > 0 else 0.8, event.x, event.y)
+
+def scroll_y(*args):
+    canvas.yview(*args)
+    viewer.render_visible()
+
+def scroll_x(*args):
+    canvas.xview(*args)
+    viewer.render_visible()
 
 def toggle_wrap():
     if wrap_var.get():
@@ -83,16 +114,16 @@ def toggle_wrap():
         text_widget.config(wrap=tk.NONE)  # No wrapping, enables horizontal scroll
 
 def toggle_checks():
-    if not hasattr(canvas, 'original_image') or canvas.original_image is None:
+    # NOTE: applies to the image being processed, even if it isn't displayed yet
+    if canvas.pipeline is None:
         return
-    new_image, _ = process_image(canvas.original_image)
-    canvas.processed_image = new_image
-    update_image_display()
+    process_image(canvas.pipeline)
 
 
 # Initialize the main window
 root = tk.Tk()
 root.title("BirdNest")
+runner = JobRunner()
 
 indent_check_var = tk.IntVar(value=1)
 spell_check_var = tk.IntVar(value=0)
@@ -108,8 +139,8 @@ notebook.pack(fill=tk.BOTH, expand=True)
 # Image frame (first panel)
 image_frame = tk.Frame(notebook)
 canvas = tk.Canvas(image_frame, width=800, height=600)
-scrollbar_y = tk.Scrollbar(image_frame, orient=tk.VERTICAL, command=canvas.yview)
-scrollbar_x = tk.Scrollbar(image_frame, orient=tk.HORIZONTAL, command=canvas.xview)
+scrollbar_y = tk.Scrollbar(image_frame, orient=tk.VERTICAL, command=scroll_y)
+scrollbar_x = tk.Scrollbar(image_frame, orient=tk.HORIZONTAL, command=scroll_x)
 canvas.config(yscrollcommand=scrollbar_y.set, xscrollcommand=scrollbar_x.set)
 canvas.grid(row=0, column=0, sticky="nsew")
 scrollbar_y.grid(row=0, column=1, sticky="ns")
@@ -117,9 +148,16 @@ scrollbar_x.grid(row=1, column=0, sticky="ew")
 image_frame.grid_rowconfigure(0, weight=1)
 image_frame.grid_columnconfigure(0, weight=1)
 notebook.add(image_frame, text="Image")
-canvas.bind("<Configure>", update_image_display)
+viewer = TiledCanvas(canvas)
 canvas.bind("<MouseWheel>", on_mousewheel)
+canvas.bind("<Control-MouseWheel>", on_zoom_wheel)
+root.bind("<Control-plus>", lambda e: viewer.zoom_by(1.25))
+root.bind("<Control-equal>", lambda e: viewer.zoom_by(1.25))
+root.bind("<Control-minus>", lambda e: viewer.zoom_by(0.8))
+root.bind("<Control-0>", lambda e: viewer.zoom_by(1 / viewer.zoom))
 canvas.original_image = None
+canvas.board = None
+canvas.pipeline = None
 
 # Text frame (second panel)
 text_frame = tk.Frame(notebook)
@@ -180,12 +218,18 @@ toggle_wrap()  # Set initial wrap state
 # Wrap indent check
 indent_check_checkbox = tk.Checkbutton(button_frame, text="Check Indent", variable=indent_check_var, command=toggle_checks)
 indent_check_checkbox.pack(side=tk.LEFT, padx=10, pady=10)
-toggle_checks()  # Set initial wrap state
 
 # Wrap indent check
 spell_check_checkbox = tk.Checkbutton(button_frame, text="Check Spelling", variable=spell_check_var, command=toggle_checks)
 spell_check_checkbox.pack(side=tk.LEFT, padx=10, pady=10)
-toggle_checks()  # Set initial wrap state
 
+# Progress of the current run
+status_var = tk.StringVar(value="")
+progress_bar = ttk.Progressbar(button_frame, orient=tk.HORIZONTAL, length=160, mode="determinate")
+progress_bar.pack(side=tk.RIGHT, padx=10, pady=10)
+status_label = tk.Label(button_frame, textvariable=status_var, width=16, anchor=tk.E)
+status_label.pack(side=tk.RIGHT, pady=10)
+
+root.after(POLL_INTERVAL_MS, poll_events)
 
 root.mainloop()
\ No newline at end of file
@@ -0,0 +1,366 @@
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+import glob
+import json
+import os
+from pathlib import Path
+import time
+from multiprocessing import resource_tracker, shared_memory
+from typing import Iterable, Optional
+
+from PIL import Image
+
+from components import Pipeline
+from diagnostics import ERROR, draw_diagnostics
+from document import Document, iter_frames
+from drawing import DrawingBoard
+from export import document_records, page_records, write_jsonl
+from ocr_backends import get_ocr_backend
+from ocr_cache import get_ocr_cache
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff"}
+
+def expand_inputs(inputs: Iterable[str]) -> list[tuple[Path, Path]]:
+    """
+    Image files named directly, found under directories (recursively) or
+    matched by globs, each with the relative path its outputs are written to:
+    the file's name, or its path under the directory or the part of the glob
+    before its first wildcard.
+    """
+    found = []
+    for spec in inputs:
+        path = Path(spec)
+        if path.is_dir():
+            for p in sorted(path.rglob("*")):
+                if p.suffix.lower() in IMAGE_EXTENSIONS:
+                    found.append((p, p.relative_to(path)))
+        elif path.is_file():
+            found.append((path, Path(path.name)))
+        else:
+            root = glob_root(spec)
+            for p in sorted(glob.glob(spec, recursive=True)):
+                p = Path(p)
+                if p.is_file() and p.suffix.lower() in IMAGE_EXTENSIONS:
+                    found.append((p, p.relative_to(root)))
+    return found
+
+def glob_root(spec: str) -> Path:
+    root = []
+    for part in Path(spec).parts:
+        if glob.has_magic(part):
+            break
+        root.append(part)
+    return Path(*root)
+
+def check_outputs(pages: list[tuple[Path, Path]]):
+    """
+    Raises ValueError if two inputs would be written to the same outputs,
+    which are named after the relative path without its suffix.
+    """
+    seen = {}
+    for path, relative in pages:
+        target = relative.with_suffix("")
+        if target in seen:
+            raise ValueError(f"{seen[target]} and {path} would both be written to {target}.*, pass a directory (or glob) above both instead, or rename one")
+        seen[target] = path
+
+def share_page(path: Path) -> tuple[Optional[shared_memory.SharedMemory], dict]:
+    """
+    Decodes the page into a shared memory block, workers read the pixels from
+    there instead of getting the image pickled through a pipe. Multi-page
+    files aren't decoded here, the worker reads them as a `Document` (no block, None).
+    """
+    with Image.open(path) as image:
+        frames = getattr(image, "n_frames", 1)
+        if frames > 1:
+            return None, {"frames": frames}
+        image.load()
+        if image.mode not in ("1", "L", "RGB", "RGBA"):
+            image = image.convert("RGB")
+        data = image.tobytes()
+        shm = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+        shm.buf[:len(data)] = data
+        return shm, {"shm": shm.name, "mode": image.mode, "size": image.size, "nbytes": len(data)}
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # NOTE: before python 3.13 attaching registers the block again, with the tracker pool workers share with the
+        # parent (under fork, spawn and forkserver alike). That is a no-op, unregistering here would drop the parent's own entry.
+        return shared_memory.SharedMemory(name=name)
+
+def prepare_dictionaries():
+    """
+    Builds the spelling dictionaries (and the SymSpell index, if that engine
+    is used) if they aren't cached yet. The parent runs this before starting
+    workers, so they only ever open finished files.
+    """
+    from spelling import get_dictionary, get_symspell_indexes, _engine
+    get_dictionary()
+    if _engine == "symspell":
+        get_symspell_indexes()
+
+_worker = {}
+
+def init_worker(options: dict):
+    """
+    Runs once per worker process: everything a page needs is loaded before the first one arrives.
+    """
+    # NOTE: one tesseract thread (and refine thread) per process, the pool already uses every core
+    os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+    os.environ.setdefault("BIRDNEST_REFINE_THREADS", "1")
+    _worker["options"] = options
+    _worker["ocr_backend"] = get_ocr_backend(options.get("ocr_backend"))
+    _worker["ocr_cache"] = get_ocr_cache() if options["ocr_cache"] else None
+    if _worker["ocr_backend"].cacheable:
+        _worker["ocr_backend"].version()
+    if options["spell_check"]:
+        prepare_dictionaries()
+
+def process_page(task: dict) -> dict:
+    options = _worker["options"]
+    start = time.perf_counter()
+    shm = _attach(task["shm"])
+    try:
+        with shm.buf[:task["nbytes"]] as pixels:
+            image = Image.frombytes(task["mode"], tuple(task["size"]), pixels)
+    finally:
+        shm.close()
+    # NOTE: replay backends find pages by file name
+    image.filename = task["path"]
+    pipeline = Pipeline(image, ocr_cache=_worker["ocr_cache"], ocr_backend=_worker["ocr_backend"], refine=options["refine"])
+    board, s, article, diagnostics = pipeline.run(
+        indent_check=options["indent_check"],
+        spell_check=options["spell_check"],
+        draw=options["images"],
+        verbose=False,
+        indent_only=options["indent_only"],
+    )
+    if options["images"]:
+        out = Path(options["out"]) / task["relative"]
+        out.parent.mkdir(parents=True, exist_ok=True)
+        board.render(image).save(out.with_suffix(".annotated.png"))
+    return {
+        "path": task["path"],
+        "relative": task["relative"],
+        "text": s.as_str(),
+        "words": len(article.words),
+        "diagnostics": [d.as_dict() for d in diagnostics],
+        "refine": None if pipeline.refine_report is None else pipeline.refine_report.as_dict(),
+        "stages": pipeline.stats.as_dict(),
+        "export": list(page_records(s, article, diagnostics, source=task["path"])) if options["export"] else None,
+        "pages": 1,
+        "seconds": time.perf_counter() - start,
+        "pid": os.getpid(),
+    }
+
+def process_document(task: dict) -> dict:
+    """
+    A multi-page file, checked as one `Document` so numbering carries over
+    its page breaks. Diagnostics get the number of their page.
+    """
+    options = _worker["options"]
+    start = time.perf_counter()
+    document = Document(task["path"], ocr_cache=_worker["ocr_cache"], ocr_backend=_worker["ocr_backend"], refine=options["refine"])
+    result = check_document(document, indent_check=options["indent_check"], spell_check=options["spell_check"], indent_only=options["indent_only"])
+    if options["images"]:
+        out = Path(options["out"]) / task["relative"]
+        out.parent.mkdir(parents=True, exist_ok=True)
+        for index, frame in enumerate(iter_frames(task["path"])):
+            board = DrawingBoard(frame.size)
+            draw_diagnostics(document.diagnostics.get(index, []), board)
+            board.render(frame).save(out.with_name(f"{out.stem}-{index + 1}.annotated.png"))
+    return {
+        "path": task["path"],
+        "relative": task["relative"],
+        **result,
+        "export": list(document_records(document, source=task["path"])) if options["export"] else None,
+        "seconds": time.perf_counter() - start,
+        "pid": os.getpid(),
+    }
+
+def check_document(document: Document, lang="eng", indent_check=True, spell_check=False, indent_only=False) -> dict:
+    """
+    Checks every page of `document`: its tree text, word count, diagnostics
+    tagged with their page number, and the stage timings and refine reports
+    of all pages added up.
+    """
+    words = 0
+    stages = {}
+    refine = None
+    for page in document.pages(lang, indent_check=indent_check, spell_check=spell_check, indent_only=indent_only):
+        words += len(page.article.words)
+        for name, st in page.stats.as_dict().items():
+            total = stages.setdefault(name, {"seconds": 0.0, "calls": 0, "peak": None, "rss": None})
+            total["seconds"] = round(total["seconds"] + st["seconds"], 4)
+            total["calls"] += st["calls"]
+            for k in ("peak", "rss"):
+                if st[k] is not None:
+                    total[k] = max(total[k] or 0, st[k])
+        if page.refine_report is not None:
+            report = page.refine_report.as_dict()
+            if refine is None:
+                refine = report
+            else:
+                for k in ("crops", "improved", "seconds"):
+                    refine[k] = round(refine[k] + report[k], 4)
+                refine["scale"] = max(refine["scale"], report["scale"])
+                if refine["estimated_full_page_seconds"] is not None:
+                    estimate = report["estimated_full_page_seconds"]
+                    refine["estimated_full_page_seconds"] = None if estimate is None else round(refine["estimated_full_page_seconds"] + estimate, 4)
+    return {
+        "text": document.series.as_str(),
+        "words": words,
+        "diagnostics": [dict(d.as_dict(), page=index + 1) for index, found in sorted(document.diagnostics.items()) for d in found],
+        "refine": refine,
+        "stages": stages,
+        "pages": len(document.page_sizes),
+    }
+
+def write_result(out: Path, result: dict, summary_file):
+    target = out / result["relative"]
+    target.parent.mkdir(parents=True, exist_ok=True)
+    target.with_suffix(".txt").write_text(result["text"], encoding="utf-8")
+    with open(target.with_suffix(".diagnostics.json"), "w", encoding="utf-8") as f:
+        json.dump(result["diagnostics"], f)
+    errors = sum(1 for d in result["diagnostics"] if d["severity"] == ERROR)
+    summary_file.write(json.dumps({
+        "path": result["path"],
+        "pages": result["pages"],
+        "words": result["words"],
+        "diagnostics": len(result["diagnostics"]),
+        "errors": errors,
+        "refine": result["refine"],
+        "stages": result["stages"],
+        "seconds": round(result["seconds"], 4),
+    }) + "\n")
+    summary_file.flush()
+    return errors
+
+def run_batch(
+        inputs: Iterable[str],
+        out: str,
+        workers: Optional[int] = None,
+        indent_check=True,
+        spell_check=False,
+        ocr_cache=True,
+        ocr_backend: Optional[str] = None,
+        images=False,
+        indent_only=False,
+        refine: Optional[bool] = None,
+        export: Optional[str] = None,
+        log=print,
+    ) -> dict:
+    """
+    Processes every page in a pool of `workers` processes, multi-page files
+    as one document each (see `process_document`). Each file's tree text and
+    diagnostics are written to `out` as soon as it finishes, along
+    with a line in `results.jsonl` and, if `export` names a file, its
+    records there (see `export`). Returns the throughput summary, which is
+    also saved as `summary.json`. Raises ValueError, before anything is
+    processed, if two inputs would be written to the same outputs.
+    """
+    pages = expand_inputs(inputs)
+    check_outputs(pages)
+    workers = workers or os.cpu_count() or 1
+    out = Path(out)
+    out.mkdir(parents=True, exist_ok=True)
+    options = dict(
+        indent_check=indent_check,
+        spell_check=spell_check,
+        ocr_cache=ocr_cache,
+        ocr_backend=ocr_backend,
+        images=images,
+        indent_only=indent_only,
+        refine=refine,
+        export=export is not None,
+        out=str(out),
+    )
+
+    start = time.perf_counter()
+    done = 0
+    page_count = 0
+    failed = []
+    errors = 0
+    words = 0
+    busy = 0.0
+    stages = {}
+    if spell_check:
+        prepare_dictionaries()
+    # NOTE: workers share the parent's resource tracker only if it runs before they start (see `_attach`),
+    # the first task may be a document that creates no shared memory block
+    resource_tracker.ensure_running()
+    # NOTE: at most this many pages are decoded and waiting in shared memory at once
+    max_in_flight = 2 * workers
+    with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(options,)) as pool, \
+            ThreadPoolExecutor(min(workers, 4)) as decoders, \
+            open(out / "results.jsonl", "w", encoding="utf-8") as summary_file, \
+            (open(export, "w", encoding="utf-8") if export is not None else nullcontext()) as export_file:
+        queued = iter(pages)
+        decoding = {}
+        running = {}
+
+        def fill():
+            while len(decoding) + len(running) < max_in_flight:
+                page = next(queued, None)
+                if page is None:
+                    return
+                decoding[decoders.submit(share_page, page[0])] = page
+
+        fill()
+        while decoding or running:
+            finished, _ = wait(list(decoding) + list(running), return_when=FIRST_COMPLETED)
+            for future in finished:
+                if future in decoding:
+                    path, relative = decoding.pop(future)
+                    try:
+                        shm, task = future.result()
+                    except Exception as e:
+                        failed.append(str(path))
+                        log(f"failed to read {path}: {e}")
+                        continue
+                    task.update(path=str(path), relative=str(relative))
+                    running[pool.submit(process_page if shm is not None else process_document, task)] = (path, shm)
+                    continue
+                path, shm = running.pop(future)
+                if shm is not None:
+                    shm.close()
+                    shm.unlink()
+                try:
+                    result = future.result()
+                except Exception as e:
+                    failed.append(str(path))
+                    log(f"failed to process {path}: {e}")
+                    continue
+                errors += write_result(out, result, summary_file)
+                if export_file is not None:
+                    write_jsonl(result["export"], export_file)
+                done += 1
+                page_count += result["pages"]
+                words += result["words"]
+                busy += result["seconds"]
+                for name, s in result["stages"].items():
+                    stages[name] = stages.get(name, 0.0) + s["seconds"]
+                log(f"[{done + len(failed)}/{len(pages)}] {path} ({result['seconds']:.2f} s)")
+            fill()
+
+    elapsed = time.perf_counter() - start
+    summary = {
+        "files": done,
+        "pages": page_count,
+        "failed": failed,
+        "workers": workers,
+        "words": words,
+        "indent_errors": errors,
+        "seconds": round(elapsed, 3),
+        "pages_per_second": round(page_count / elapsed, 3) if elapsed > 0 else None,
+        "words_per_second": round(words / elapsed, 1) if elapsed > 0 else None,
+        # NOTE: how busy the pool was, 1.0 means every worker was processing pages the whole time
+        "utilization": round(busy / (elapsed * workers), 3) if elapsed > 0 else None,
+        # NOTE: seconds spent in every pipeline stage, summed over all pages and workers
+        "stages": {name: round(seconds, 3) for name, seconds in stages.items()},
+    }
+    with open(out / "summary.json", "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    return summary
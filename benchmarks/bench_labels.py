@@ -0,0 +1,78 @@
+"""
+Series label matching: the combined matcher in `labels` against the previous
+per-pattern `re.search` loop over 99-entry rank tables.
+
+Usage: python -m benchmarks.bench_labels [lines]
+"""
+import random
+import re
+import sys
+import timeit
+
+from benchmarks.synthetic import LABEL_FAMILIES as SYNTHETIC_FAMILIES, VOCABULARY
+from labels import LABEL_FAMILIES, match_label
+from util import to_roman
+
+# NOTE: the matcher as it was before `labels`, kept here as the reference
+_alphabet_lower = [chr(i) for i in range(97, 123)]
+_alphabet_upper = [chr(i) for i in range(65, 91)]
+_numerals = [str(i) for i in range(1, 100)]
+_roman_upper = [to_roman(i, lower=False) for i in range(1, 100)]
+_roman_lower = [to_roman(i, lower=True) for i in range(1, 100)]
+legacy_pattern_map = {
+    r"^\((\d+)\).*": ({v: i for i, v in enumerate(_numerals)}, _numerals),
+    r"^\(([xiv]+)\).*": ({v: i for i, v in enumerate(_roman_lower)}, _roman_lower),
+    r"^\(([XIV]+)\).*": ({v: i for i, v in enumerate(_roman_upper)}, _roman_upper),
+    r"^\(([a-z])\).*": ({v: i for i, v in enumerate(_alphabet_lower)}, _alphabet_lower),
+    r"^\(([A-Z])\).*": ({v: i for i, v in enumerate(_alphabet_upper)}, _alphabet_upper),
+}
+
+def legacy_match(line: str):
+    matches = [(pat, re.search(pat, line)) for pat in legacy_pattern_map]
+    return {pat: m.groups()[0] for pat, m in matches if m is not None}
+
+def legacy_expects(matches: dict):
+    ranks = [legacy_pattern_map[p][0][v] for p, v in matches.items()]
+    rank_maps = [legacy_pattern_map[p][1] for p in matches]
+    return [None if r >= len(m) else list(m)[r + 1] for m, r in zip(rank_maps, ranks)]
+
+def new_expects(matches: dict):
+    return [LABEL_FAMILIES[p].successor(v) for p, v in matches.items()]
+
+def make_lines(n: int, seed=0) -> list[str]:
+    rnd = random.Random(seed)
+    families = list(SYNTHETIC_FAMILIES.values())
+    lines = []
+    for _ in range(n):
+        words = " ".join(rnd.choice(VOCABULARY) for _ in range(rnd.randint(4, 12)))
+        if rnd.random() < 0.4:
+            # NOTE: stay within the legacy tables so both matchers can run
+            label = rnd.choice(families)(rnd.randrange(25))
+            lines.append(f"({label}) {words}")
+        else:
+            lines.append(words)
+    return lines
+
+def run_legacy(lines):
+    for line in lines:
+        m = legacy_match(line)
+        if m:
+            legacy_expects(m)
+
+def run_new(lines):
+    for line in lines:
+        m = match_label(line)
+        if m:
+            new_expects(m)
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    lines = make_lines(n)
+    legacy = min(timeit.repeat(lambda: run_legacy(lines), number=1, repeat=5))
+    new = min(timeit.repeat(lambda: run_new(lines), number=1, repeat=5))
+    print(f"lines:   {n}")
+    print(f"legacy:  {legacy * 1e6 / n:.2f} us/line")
+    print(f"labels:  {new * 1e6 / n:.2f} us/line ({legacy / new:.1f}x)")
+    for label in ["(100)", "(cxx)", "(aa)", "(zz)", "(MMXXV)"]:
+        m = match_label(label)
+        print(f"{label:>8} -> {m}, expects {new_expects(m)}")
@@ -0,0 +1,160 @@
+"""
+Per-word memory footprint of the Tesseract hierarchy: the slotted nodes over
+shared columns in `components` against the previous representation, where
+every node kept its own dict copy of its rows and a metadata object.
+
+Usage: python -m benchmarks.bench_memory [pages]
+"""
+from itertools import chain
+import gc
+import sys
+import tracemalloc
+
+from benchmarks.bench_labels import legacy_match
+from benchmarks.synthetic import make_tesseract_data
+from components import TesseractArticle, Line, Paragraph
+from util import error_correction_map
+
+# NOTE: the hierarchy as it was before the slotted nodes, kept here as the reference (spell check left out)
+def legacy_split(data: dict, rank_type: str) -> list[dict]:
+    splits = []
+    if len(data[rank_type]) == 0:
+        return splits
+    for rank in range(1, max(data[rank_type]) + 1):
+        ids = [i for i in range(len(data[rank_type])) if data[rank_type][i] == rank]
+        splits.append({k: [v[i] for i in ids] for k, v in data.items()})
+    return splits
+
+def legacy_filter(data: dict) -> dict:
+    return {k: v[1:] for k, v in data.items()}
+
+class LegacyMetaData:
+    def __init__(self, data):
+        self.width = data["width"][0]
+        self.height = data["height"][0]
+        self.top = data["top"][0]
+        self.left = data["left"][0]
+
+class LegacyWord:
+    def __init__(self, data):
+        self.text = data["text"][0]
+        self.text = error_correction_map.get(self.text, self.text)
+        self.conf = data["conf"][0]
+        self.meta = LegacyMetaData(data)
+
+    def __len__(self):
+        return 1
+
+    def as_str(self):
+        return self.text
+
+class LegacyNode:
+    # NOTE: page, block, paragraph and line were one class each, differing only in the rank they split by
+    def __init__(self, data, rank_type, child, filter_meta=True):
+        self.meta = LegacyMetaData(data)
+        if filter_meta:
+            data = legacy_filter(data)
+        self.members = [child(d) for d in legacy_split(data, rank_type)]
+        self.data = data
+        self.members = [m for m in self.members if len(m) > 0]
+
+    def __len__(self):
+        return len(self.members)
+
+    @property
+    def lines(self):
+        if self.members and isinstance(self.members[0], LegacyLine):
+            return self.members
+        return list(chain(*[m.lines for m in self.members]))
+
+    @property
+    def words(self):
+        return list(chain(*[m.words for m in self.members]))
+
+class LegacyLine(LegacyNode):
+    def __init__(self, data):
+        meta = LegacyMetaData(data)
+        super().__init__(data, "word_num", LegacyWord)
+        if len(self.members) > 0:
+            left = self.members[0].meta.left
+            meta = LegacyMetaData({
+                "top": [self.members[0].meta.top],
+                "left": [left],
+                "height": [max(m.meta.height for m in self.members)],
+                "width": [max(m.meta.left + m.meta.width for m in self.members) - left],
+            })
+        self.meta = meta
+
+    @property
+    def words(self):
+        return self.members
+
+    def as_str(self):
+        return " ".join(w.as_str() for w in self.members)
+
+def legacy_article(data: dict) -> LegacyNode:
+    par = lambda d: LegacyNode(d, "line_num", LegacyLine)
+    block = lambda d: LegacyNode(d, "par_num", par)
+    page = lambda d: LegacyNode(d, "block_num", block)
+    return LegacyNode(data, "page_num", page, filter_meta=False)
+
+class LegacyParagraph:
+    def __init__(self, lines: list):
+        self.lines = lines
+        first, last = lines[0][1].meta, lines[-1][1].meta
+        self._meta = LegacyMetaData({
+            "width": [max(l.meta.width for _, l in lines)],
+            "height": [last.top + last.height - first.top],
+            "top": [first.top],
+            "left": [first.left],
+        })
+
+def legacy_group_paragraphs(article: LegacyNode) -> list[LegacyParagraph]:
+    # NOTE: a line was its label matches next to the line, with the same first-paragraph fix as `Paragraph.group_paragraphs`
+    pars = []
+    this_par = []
+    for line in article.lines:
+        matches = legacy_match(line.as_str().lstrip())
+        if matches or len(this_par) == 0:
+            if len(this_par) > 0:
+                pars.append(LegacyParagraph(this_par))
+            this_par = [(matches, line)]
+        else:
+            this_par.append((matches, line))
+    if this_par:
+        pars.append(LegacyParagraph(this_par))
+    return pars
+
+def build(data: dict):
+    article = TesseractArticle(data)
+    return article, Paragraph.group_paragraphs([Line(l) for l in article.lines])
+
+def legacy_build(data: dict):
+    article = legacy_article(data)
+    return article, legacy_group_paragraphs(article)
+
+def measure(build, data: dict):
+    gc.collect()
+    tracemalloc.start()
+    article, pars = build(data)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return article, pars, current, peak
+
+if __name__ == "__main__":
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    data = make_tesseract_data(pages=pages, pars_per_page=40)
+    results = {}
+    for name, b in (("legacy", legacy_build), ("slotted", build)):
+        article, pars, current, peak = measure(b, data)
+        n_words = len(article.words)
+        results[name] = (current, peak)
+        del article, pars
+    print(f"pages:            {pages}")
+    print(f"words:            {n_words}")
+    for name, (current, peak) in results.items():
+        print(f"{name}")
+        print(f"  retained:       {current / 2**20:.2f} MiB ({current / n_words:.0f} B/word)")
+        print(f"  peak:           {peak / 2**20:.2f} MiB ({peak / n_words:.0f} B/word)")
+    (old_current, old_peak), (new_current, new_peak) = results["legacy"], results["slotted"]
+    print(f"retained {old_current / new_current:.1f}x smaller, peak {old_peak / new_peak:.1f}x smaller")
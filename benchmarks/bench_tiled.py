@@ -0,0 +1,54 @@
+"""
+Whole-page OCR against `TiledBackend` on one large synthetic page (A3 at 600
+dpi by default): wall-clock time of each, and whether the indent diagnostics
+come out the same. Both read the page as it is, without normalizing (which
+would shrink it before it is split) or the refine pass.
+
+Usage: python -m benchmarks.bench_tiled [--ocr-backend pytesseract] [--bands N] [--scale 2]
+"""
+import argparse
+import time
+
+from benchmarks.synthetic import make_paragraphs, render_page, to_tesseract_data
+from components import Pipeline
+from ocr_backends import TiledBackend, get_ocr_backend
+
+def make_page(scale=2, pars=60, seed=0):
+    # NOTE: A3 at 300 dpi, times `scale`
+    data = to_tesseract_data(
+        make_paragraphs(pages=1, pars_per_page=pars, max_depth=3, seed=seed),
+        page_size=(3508 * scale, 4961 * scale),
+        margin=150 * scale,
+        indent_step=80 * scale,
+        line_height=60 * scale,
+        char_width=18 * scale,
+    )
+    return render_page(data)
+
+def indent_fields(diagnostics) -> list[tuple]:
+    return [(d.severity, d.expected, d.actual) for d in diagnostics if d.kind == "indent"]
+
+def run(backend, image):
+    start = time.perf_counter()
+    _, s, article, diagnostics = Pipeline(image, ocr_backend=backend, normalize=False, refine=False).run(indent_check=True, draw=False, verbose=False)
+    return time.perf_counter() - start, len(article.words), indent_fields(diagnostics)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ocr-backend", default=None)
+    parser.add_argument("--bands", type=int, default=None)
+    parser.add_argument("--scale", type=int, default=2)
+    args = parser.parse_args()
+
+    image = make_page(args.scale)
+    backend = get_ocr_backend(args.ocr_backend)
+    tiled = TiledBackend(backend, bands=args.bands)
+    whole_time, whole_words, whole = run(backend, image)
+    tiled_time, tiled_words, bands = run(tiled, image)
+    print(f"page:   {image.width}x{image.height}")
+    print(f"whole:  {whole_time:7.2f} s  {whole_words} words")
+    print(f"tiled:  {tiled_time:7.2f} s  {tiled_words} words  ({tiled.bands} bands, {whole_time / tiled_time:.2f}x)")
+    print(f"indent diagnostics identical: {whole == bands}")
+
+if __name__ == "__main__":
+    main()
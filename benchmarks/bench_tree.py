@@ -0,0 +1,140 @@
+"""
+Scaling of series tree construction, validation and serialization:
+`Series.from_paragraphs`, the iterative `Series.check` and the streaming
+`Series.as_str` against the previous recursive versions.
+
+Both arms group lines into paragraphs with the current rule, where a
+paragraph's continuation lines stay in it. The original grouping started
+a new paragraph at a document's second line even without a label, so the
+legacy arm here is the old tree code on the corrected grouping, not the
+baseline end to end.
+
+Usage: python -m benchmarks.bench_tree
+"""
+import gc
+import time
+
+from benchmarks.synthetic import SyntheticParagraph, make_paragraphs, to_tesseract_data
+from components import Line, Paragraph, Series, TesseractArticle
+from diagnostics import Diagnostic, OK, ERROR
+from labels import initial_values
+from util import indent_multiline
+
+def legacy_group_paragraphs(lines: list[Line]) -> list[Paragraph]:
+    # NOTE: the original loop, with the same first-paragraph fix as `Paragraph.group_paragraphs`
+    pars = []
+    this_par = []
+    for l in lines:
+        if l.has_series_tag() or len(this_par) == 0:
+            if len(this_par) > 0:
+                pars.append(Paragraph(this_par))
+            this_par = [l]
+        else:
+            this_par.append(l)
+    pars.append(Paragraph(this_par))
+    return pars
+
+def legacy_group_nest(pars: list[Paragraph]):
+    if len(pars) == 0:
+        return []
+    target_indent = min(p.indent for p in pars)
+    nest_members = []
+    head_par = pars[0]
+    sub_pars = []
+    for p in pars[1:]:
+        if p.indent > target_indent:
+            sub_pars.append(p)
+        elif p.indent == target_indent:
+            nest_members.append(Series(head_par, legacy_group_nest(sub_pars)))
+            sub_pars = []
+            head_par = p
+        else:
+            break
+    nest_members.append(Series(head_par, legacy_group_nest(sub_pars)))
+    return nest_members
+
+def legacy_check(series: Series, diagnostics: list):
+    prev_mem = None
+    for mem_idx, mem in enumerate(series.members):
+        legacy_check(mem, diagnostics)
+        prev_mem_expects = initial_values() if prev_mem is None else prev_mem.expects()
+        if len(mem.values) == 0 and (mem_idx == 0 or len(prev_mem_expects) == 0):
+            is_expected = True
+        else:
+            is_expected = any(v in prev_mem_expects for v in mem.values)
+        head = (mem if prev_mem is None else prev_mem).par.lines[0].meta
+        meta = mem.par.meta
+        diagnostics.append(Diagnostic(
+            "indent",
+            OK if is_expected else ERROR,
+            (meta.left, meta.top, meta.width, meta.height),
+            expected=tuple(prev_mem_expects),
+            actual=tuple(mem.values),
+            previous=(head.left, head.top, head.width, head.height),
+        ))
+        prev_mem = mem
+    return diagnostics
+
+def legacy_as_str(series: Series) -> str:
+    if series.par.is_empty:
+        return "\n".join(legacy_as_str(m) for m in series.members)
+    s_members = "\n".join(indent_multiline(legacy_as_str(m)) for m in series.members)
+    return series.par.as_str() + "\n" + s_members
+
+def fields(diagnostics: list[Diagnostic]):
+    return [tuple(getattr(d, f) for f in Diagnostic.__slots__) for d in diagnostics]
+
+def shape(series: Series):
+    # NOTE: preorder of (paragraph, number of children), iterative so it works on staircases too
+    out = []
+    stack = list(reversed(series.members))
+    while stack:
+        s = stack.pop()
+        out.append((tuple(map(id, s.par.lines)), len(s.members)))
+        stack.extend(reversed(s.members))
+    return out
+
+def make_lines(synthetic: list[SyntheticParagraph]) -> list[Line]:
+    article = TesseractArticle(to_tesseract_data(synthetic))
+    return [Line(l) for l in article.lines]
+
+def timed(f, *args):
+    # NOTE: like timeit, the collector is paused so earlier trees don't get billed to the next run
+    gc.collect()
+    gc.disable()
+    start = time.perf_counter()
+    try:
+        result = f(*args)
+    except RecursionError:
+        return None, float("nan")
+    finally:
+        gc.enable()
+    return result, time.perf_counter() - start
+
+def run(name: str, lines: list[Line]):
+    legacy_pars = legacy_group_paragraphs(lines)
+    pars = Paragraph.group_paragraphs(lines)
+    legacy_tree, legacy_build = timed(lambda: Series(Paragraph([]), legacy_group_nest(legacy_pars)))
+    tree, build = timed(Series.from_paragraphs, pars)
+    if legacy_tree is not None:
+        assert shape(legacy_tree) == shape(tree)
+        legacy_diagnostics, legacy_validate = timed(legacy_check, legacy_tree, [])
+    else:
+        legacy_diagnostics, legacy_validate = None, float("nan")
+    diagnostics, validate = timed(tree.check)
+    assert legacy_diagnostics is None or fields(legacy_diagnostics) == fields(diagnostics)
+    legacy_text, legacy_serialize = timed(legacy_as_str, legacy_tree or tree)
+    text, serialize = timed(tree.as_str)
+    assert legacy_text is None or legacy_text == text
+    print(f"{name:>14} {len(pars):>7} | {legacy_build * 1e3:9.1f} {build * 1e3:9.1f} | {legacy_validate * 1e3:9.1f} {validate * 1e3:9.1f}"
+          f" | {legacy_serialize * 1e3:9.1f} {serialize * 1e3:9.1f}")
+
+if __name__ == "__main__":
+    print(f"{'case':>14} {'pars':>7} | {'build ms':>9} {'(new)':>9} | {'check ms':>9} {'(new)':>9} | {'text ms':>9} {'(new)':>9}")
+    for n in [100, 1_000, 10_000]:
+        run("depth 4", make_lines(make_paragraphs(pages=n // 40, pars_per_page=40, max_depth=4)))
+    for n in [100, 1_000, 10_000]:
+        run("depth 12", make_lines(make_paragraphs(pages=n // 40, pars_per_page=40, max_depth=12)))
+    # NOTE: a staircase of ever deeper paragraphs, the recursive versions run out of stack
+    for n in [500, 2_000]:
+        run("staircase", make_lines([SyntheticParagraph(1, d, f"({d + 1})", [["clause"]]) for d in range(n)]))
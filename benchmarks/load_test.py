@@ -0,0 +1,84 @@
+"""
+Load test for `server.py`: `clients` threads each upload pages as fast as the
+service answers, for `requests` requests in total. Refused requests (503) are
+retried after the Retry-After delay and counted.
+
+Usage: python -m benchmarks.load_test <images or directories> [--url http://127.0.0.1:8765]
+       [--requests 200] [--clients 8] [--paths] [--spell-check]
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import json
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from batch import expand_inputs
+
+def percentile(values: list[float], p: float) -> float:
+    values = sorted(values)
+    if not values:
+        return float("nan")
+    return values[min(int(p / 100 * len(values)), len(values) - 1)]
+
+def check(url: str, path, by_path: bool, spell_check: bool, retries: list) -> tuple[float, dict]:
+    query = f"?wait=300&spell_check={int(spell_check)}&name={urllib.parse.quote(path.name)}"
+    if by_path:
+        body = json.dumps({"path": str(path.resolve())}).encode("utf-8")
+        content_type = "application/json"
+    else:
+        body = path.read_bytes()
+        content_type = "application/octet-stream"
+    start = time.perf_counter()
+    while True:
+        request = urllib.request.Request(f"{url}/jobs{query}", data=body, headers={"Content-Type": content_type})
+        try:
+            with urllib.request.urlopen(request) as response:
+                return time.perf_counter() - start, json.load(response)
+        except urllib.error.HTTPError as e:
+            if e.code != 503:
+                raise
+            retries.append(1)
+            time.sleep(float(e.headers.get("Retry-After", 1)))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("inputs", nargs="+")
+    parser.add_argument("--url", default="http://127.0.0.1:8765")
+    parser.add_argument("--requests", "-n", type=int, default=200)
+    parser.add_argument("--clients", "-c", type=int, default=8)
+    parser.add_argument("--paths", action="store_true", help="send file paths instead of uploading the pages")
+    parser.add_argument("--spell-check", action="store_true")
+    args = parser.parse_args()
+
+    pages = [p for p, _ in expand_inputs(args.inputs)]
+    retries = []
+    failed = []
+    lock = threading.Lock()
+
+    def one(i):
+        latency, job = check(args.url, pages[i % len(pages)], args.paths, args.spell_check, retries)
+        if job["status"] != "done":
+            with lock:
+                failed.append(job)
+        return latency
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.clients) as clients:
+        latencies = list(clients.map(one, range(args.requests)))
+    elapsed = time.perf_counter() - start
+    with urllib.request.urlopen(f"{args.url}/status") as response:
+        status = json.load(response)
+
+    print(f"requests:     {args.requests} ({len(failed)} failed, {len(retries)} refused and retried)")
+    print(f"clients:      {args.clients}")
+    print(f"workers:      {status['workers']} (queue {status['max_queue']}, utilization {status['utilization']})")
+    print(f"throughput:   {args.requests / elapsed:.2f} requests/s")
+    print(f"latency p50:  {percentile(latencies, 50) * 1e3:.1f} ms")
+    print(f"latency p99:  {percentile(latencies, 99) * 1e3:.1f} ms")
+    print(f"latency max:  {max(latencies) * 1e3:.1f} ms")
+
+if __name__ == "__main__":
+    main()
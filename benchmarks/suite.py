@@ -0,0 +1,223 @@
+"""
+End-to-end benchmark on synthetic documents (see `synthetic.make_document`)
+with injected numbering, indent and spelling errors. Every size is checked as
+one `Document`: the time of every pipeline stage, and how many of the
+injected errors the indent and spell checks find (recall) among what they
+flag (precision). Results are appended to `<out>/results.jsonl`, one line per
+size, and `--compare` checks them against an earlier results file. Every
+document starts with a blank separator page unless `--blank-pages` says otherwise.
+
+By default the "OCR" replays the generated layout, so the suite runs offline
+without tesseract and measures everything after OCR; pass
+`--ocr-backend pytesseract` (or tesserocr, tiled:...) to read the rendered pages.
+
+Usage: python -m benchmarks.suite [--pages 1 5 20] [--font-size 30] [--depth 3]
+       [--families numeral alpha_lower roman_lower] [--blank-pages 1] [--ocr-backend truth]
+       [--out benchmarks/results] [--compare old/results.jsonl]
+"""
+import argparse
+import hashlib
+import json
+from pathlib import Path
+import platform
+import subprocess
+import sys
+import time
+
+from benchmarks.synthetic import LABEL_FAMILIES, make_document, render_page
+from diagnostics import ERROR, draw_diagnostics
+from document import Document
+from drawing import DrawingBoard
+from ocr_backends import ReplayBackend, get_ocr_backend, to_tsv
+
+# NOTE: a result worse than the baseline by more than this is reported as a regression
+MAX_SLOWDOWN = 0.10
+MAX_ACCURACY_DROP = 0.01
+
+def generate(directory: Path, name: str, **params) -> tuple[list[Path], dict]:
+    """
+    Renders the document's pages to `<name>-<page>.png` next to their layout
+    (`.tsv`, what a perfect OCR would report) and the ground truth
+    (`<name>.truth.json`). A document generated before with the same
+    parameters is reused.
+    """
+    truth_path = directory / f"{name}.truth.json"
+    if truth_path.exists():
+        truth = json.loads(truth_path.read_text(encoding="utf-8"))
+        # NOTE: parameters as the truth file stores them, tuples are lists there
+        if truth["params"] == json.loads(json.dumps(params)):
+            return [directory / f"{name}-{p}.png" for p in range(1, truth["page_count"] + 1)], truth
+    data, truth = make_document(**params)
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for page in range(1, truth["page_count"] + 1):
+        path = directory / f"{name}-{page}.png"
+        render_page(data, page).save(path)
+        rows = [i for i, p in enumerate(data["page_num"]) if p == page]
+        page_data = {k: [v[i] for i in rows] for k, v in data.items()}
+        page_data["page_num"] = [1] * len(rows)
+        (directory / f"{name}-{page}.tsv").write_text(to_tsv(page_data), encoding="utf-8")
+        paths.append(path)
+    truth_path.write_text(json.dumps(truth), encoding="utf-8")
+    return paths, truth
+
+def document_name(params: dict) -> str:
+    """
+    Readable name of the generated document, with a digest of every
+    generation parameter so documents (and results) with different ones never share it.
+    """
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()[:8]
+    families = "".join(str(list(LABEL_FAMILIES).index(f)) for f in params["families"])
+    return f"doc-p{params['pages']}-f{params['font_size']}-d{params['max_depth']}-{families}-s{params['seed']}-{digest}"
+
+def near(found: tuple, expected: tuple, tolerance: tuple) -> bool:
+    """
+    Whether (page, left, top) `found` is `expected`, give or take `tolerance` (left, top).
+    """
+    return found[0] == expected[0] and abs(found[1] - expected[1]) <= tolerance[0] and abs(found[2] - expected[2]) <= tolerance[1]
+
+def score(found: list[tuple], expected: list[tuple], tolerance: tuple) -> dict:
+    matched = set()
+    true_positives = 0
+    for f in found:
+        hit = next((i for i, e in enumerate(expected) if i not in matched and near(f, e, tolerance)), None)
+        if hit is not None:
+            matched.add(hit)
+            true_positives += 1
+    return {
+        "expected": len(expected),
+        "flagged": len(found),
+        "true_positives": true_positives,
+        "precision": round(true_positives / len(found), 4) if found else 1.0,
+        "recall": round(true_positives / len(expected), 4) if expected else 1.0,
+    }
+
+def run(paths: list[Path], truth: dict, backend, spell_check=True) -> dict:
+    document = Document(paths, ocr_backend=backend)
+    size = tuple(truth["params"]["page_size"])
+    stages = {}
+    start = time.perf_counter()
+    for page in document.pages(spell_check=spell_check):
+        # NOTE: documents have no render stage, pages are annotated the way `Pipeline` does it
+        page.stats.measure("render", lambda: draw_diagnostics(page.diagnostics, DrawingBoard(size)))
+        for name, s in page.stats.stages.items():
+            stages[name] = stages.get(name, 0.0) + s.seconds
+    seconds = time.perf_counter() - start
+
+    flagged, misspelled = [], []
+    for index, diagnostics in document.diagnostics.items():
+        for d in diagnostics:
+            if d.kind == "indent" and d.severity == ERROR:
+                flagged.append((index + 1, d.position[0], d.position[1]))
+            elif d.kind == "spelling":
+                misspelled.append((index + 1, d.position[0], d.position[1]))
+    expected = [tuple(f) for e in truth["errors"] for f in e["flags"]]
+    typos = [(m["page"], m["box"][0], m["box"][1]) for m in truth["misspellings"]]
+    return {
+        "seconds": round(seconds, 4),
+        "pages_per_second": round(len(paths) / seconds, 3),
+        "words_per_second": round(truth["words"] / seconds, 1),
+        "stages": {name: round(s, 4) for name, s in stages.items()},
+        "indent": score(flagged, expected, (truth["indent_step"] // 2, truth["line_height"] // 2)),
+        "spelling": score(misspelled, typos, (truth["line_height"], truth["line_height"] // 2)) if spell_check else None,
+    }
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results: list[dict], baseline_path: Path) -> list[str]:
+    """
+    Regressions of `results` against the last result for the same document and OCR backend in `baseline_path`.
+    """
+    baseline = {}
+    for line in baseline_path.read_text(encoding="utf-8").splitlines():
+        if line.strip():
+            r = json.loads(line)
+            baseline[(r["name"], r["backend"])] = r
+    regressions = []
+    for r in results:
+        old = baseline.get((r["name"], r["backend"]))
+        if old is None:
+            continue
+        if r["pages_per_second"] < old["pages_per_second"] * (1 - MAX_SLOWDOWN):
+            regressions.append(f"{r['name']}: {r['pages_per_second']} pages/s, was {old['pages_per_second']}")
+        for check in ("indent", "spelling"):
+            if r[check] is None or old.get(check) is None:
+                continue
+            for metric in ("precision", "recall"):
+                if r[check][metric] < old[check][metric] - MAX_ACCURACY_DROP:
+                    regressions.append(f"{r['name']}: {check} {metric} {r[check][metric]}, was {old[check][metric]}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput and accuracy on synthetic documents.")
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 5, 20], help="document sizes to run")
+    parser.add_argument("--font-size", type=int, default=30, help="text height in pixels (30 is about 10 pt at 300 dpi)")
+    parser.add_argument("--depth", type=int, default=3, help="nesting depth")
+    parser.add_argument("--families", nargs="+", default=["numeral", "alpha_lower", "roman_lower"], choices=list(LABEL_FAMILIES),
+                        help="label family of every nesting level, repeated if there are fewer than levels")
+    parser.add_argument("--numbering-errors", type=float, default=0.03, help="chance of a paragraph skipping a label")
+    parser.add_argument("--indent-errors", type=float, default=0.03, help="chance of a paragraph indented a step too deep")
+    parser.add_argument("--misspellings", type=float, default=0.01, help="chance of a word having a typo")
+    parser.add_argument("--page-size", type=int, nargs=2, default=[2480, 3508], metavar=("WIDTH", "HEIGHT"), help="page size in pixels (A4 at 300 dpi)")
+    parser.add_argument("--blank-pages", type=int, nargs="*", default=[1], metavar="PAGE",
+                        help="page numbers of blank separator pages added to every document (the first by default)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--ocr-backend", default="truth", help="truth (replays the generated layout, no OCR), or any BIRDNEST_OCR_BACKEND")
+    parser.add_argument("--no-spell-check", action="store_true")
+    parser.add_argument("--out", default="benchmarks/results")
+    parser.add_argument("--compare", default=None, help="results.jsonl of an earlier run, exits with 1 on regressions")
+    args = parser.parse_args()
+
+    out = Path(args.out)
+    results = []
+    for pages in args.pages:
+        params = dict(
+            pages=pages,
+            font_size=args.font_size,
+            max_depth=args.depth,
+            families=tuple(args.families),
+            numbering_errors=args.numbering_errors,
+            indent_errors=args.indent_errors,
+            misspellings=args.misspellings,
+            page_size=tuple(args.page_size),
+            blank_pages=tuple(args.blank_pages),
+            seed=args.seed,
+        )
+        name = document_name(params)
+        directory = out / "documents" / name
+        paths, truth = generate(directory, name, **params)
+        backend = ReplayBackend(directory) if args.ocr_backend == "truth" else get_ocr_backend(args.ocr_backend)
+        result = {
+            "name": name,
+            "backend": args.ocr_backend,
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "params": truth["params"],
+            "paragraphs": truth["paragraphs"],
+            "words": truth["words"],
+            **run(paths, truth, backend, spell_check=not args.no_spell_check),
+        }
+        results.append(result)
+        spelling = result["spelling"] or {"precision": "-", "recall": "-"}
+        print(f"{name}: {result['seconds']:.2f} s, {result['pages_per_second']} pages/s, "
+              f"indent P {result['indent']['precision']} R {result['indent']['recall']}, "
+              f"spelling P {spelling['precision']} R {spelling['recall']}")
+        for stage, seconds in result["stages"].items():
+            print(f"    {stage:<14}{seconds * 1e3:10.1f} ms")
+
+    regressions = compare(results, Path(args.compare)) if args.compare else []
+    out.mkdir(parents=True, exist_ok=True)
+    with open(out / "results.jsonl", "a", encoding="utf-8") as f:
+        for result in results:
+            f.write(json.dumps(result) + "\n")
+    for r in regressions:
+        print(f"REGRESSION {r}")
+    sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+import random
+
+from PIL import Image, ImageDraw
+
+from drawing import get_font
+from util import to_roman
+
+LABEL_FAMILIES = {
+    "numeral": lambda i: str(i + 1),
+    "alpha_lower": lambda i: chr(97 + i % 26) * (i // 26 + 1),
+    "roman_lower": lambda i: to_roman(i + 1, lower=True),
+    "alpha_upper": lambda i: chr(65 + i % 26) * (i // 26 + 1),
+    "roman_upper": lambda i: to_roman(i + 1),
+}
+
+VOCABULARY = [
+    "the", "party", "shall", "agreement", "notwithstanding", "herein", "provided",
+    "that", "contract", "terms", "of", "and", "lessee", "lessor", "pursuant", "to",
+    "section", "any", "such", "notice", "in", "writing", "by", "either",
+]
+
+TESSERACT_COLUMNS = [
+    "level", "page_num", "block_num", "par_num", "line_num", "word_num",
+    "left", "top", "width", "height", "conf", "text",
+]
+
+class SyntheticParagraph:
+    def __init__(self, page: int, depth: int, label: str, lines: list[list[str]], offset: int = 0):
+        self.page = page
+        self.depth = depth
+        self.label = label
+        self.lines = lines
+        # NOTE: indent steps added to the paragraph's depth when it is laid out, nonzero for injected indent errors
+        self.offset = offset
+
+def make_paragraphs(
+        pages=1,
+        pars_per_page=40,
+        max_depth=3,
+        families=("numeral", "alpha_lower", "roman_lower"),
+        seed=0,
+    ) -> list[SyntheticParagraph]:
+    rnd = random.Random(seed)
+    counters = [0] * max_depth
+    depth = 0
+    pars = []
+    for page in range(1, pages + 1):
+        for _ in range(pars_per_page):
+            depth = max(0, min(max_depth - 1, depth + rnd.choice([-1, 0, 0, 1])))
+            for d in range(depth + 1, max_depth):
+                counters[d] = 0
+            family = LABEL_FAMILIES[families[depth % len(families)]]
+            label = f"({family(counters[depth])})"
+            counters[depth] += 1
+            lines = [
+                [rnd.choice(VOCABULARY) for _ in range(rnd.randint(4, 10))]
+                for _ in range(rnd.randint(1, 3))
+            ]
+            pars.append(SyntheticParagraph(page, depth, label, lines))
+    return pars
+
+def to_tesseract_data(
+        pars: list[SyntheticParagraph],
+        page_size=(2480, 3508),
+        margin=150,
+        indent_step=80,
+        line_height=40,
+        char_width=12,
+    ) -> dict:
+    """
+    Lay paragraphs out the way `pytesseract.image_to_data(..., output_type='dict')` reports them.
+    """
+    data = {c: [] for c in TESSERACT_COLUMNS}
+
+    def add_row(*values):
+        for c, v in zip(TESSERACT_COLUMNS, values):
+            data[c].append(v)
+
+    page = 0
+    par_num = 0
+    top = margin
+    for par in pars:
+        if par.page != page:
+            page = par.page
+            par_num = 0
+            top = margin
+            add_row(1, page, 0, 0, 0, 0, 0, 0, page_size[0], page_size[1], -1, "")
+            add_row(2, page, 1, 0, 0, 0, margin, margin, page_size[0] - 2 * margin, page_size[1] - 2 * margin, -1, "")
+        par_num += 1
+        left = margin + (par.depth + par.offset) * indent_step
+        add_row(3, page, 1, par_num, 0, 0, left, top, page_size[0] - margin - left, line_height * len(par.lines), -1, "")
+        for line_num, words in enumerate(par.lines, 1):
+            if line_num == 1:
+                words = [par.label] + words
+            add_row(4, page, 1, par_num, line_num, 0, left, top, page_size[0] - margin - left, line_height - 10, -1, "")
+            x = left
+            for word_num, text in enumerate(words, 1):
+                width = char_width * len(text)
+                add_row(5, page, 1, par_num, line_num, word_num, x, top, width, line_height - 10, 95, text)
+                x += width + char_width
+            top += line_height
+    return data
+
+def make_tesseract_data(pages=1, pars_per_page=40, seed=0, **kwargs) -> dict:
+    return to_tesseract_data(make_paragraphs(pages, pars_per_page, seed=seed, **kwargs))
+
+def render_page(data: dict, page=1) -> Image.Image:
+    """
+    Draws the words of one page of `to_tesseract_data` output, each shrunk to fit its box.
+    """
+    size = next((data["width"][i], data["height"][i]) for i, level in enumerate(data["level"]) if level == 1 and data["page_num"][i] == page)
+    image = Image.new("L", size, 255)
+    draw = ImageDraw.Draw(image)
+    for i, level in enumerate(data["level"]):
+        if level == 5 and data["page_num"][i] == page:
+            text = data["text"][i]
+            size = int(data["height"][i] * 0.8)
+            length = get_font(size).getlength(text)
+            if length > data["width"][i]:
+                size = int(size * data["width"][i] / length)
+            draw.text((data["left"][i], data["top"][i]), text, fill=0, font=get_font(size))
+    return image
+
+def misspell(word: str, rnd: random.Random) -> str:
+    """
+    `word` with two neighboring letters swapped or one doubled, never another word of the vocabulary.
+    """
+    for _ in range(10):
+        i = rnd.randrange(1, len(word) - 1)
+        if rnd.random() < 0.5:
+            typo = word[:i] + word[i + 1] + word[i] + word[i + 2:]
+        else:
+            typo = word[:i] + word[i] + word[i:]
+        if typo != word and typo not in VOCABULARY:
+            return typo
+    return word + word[-1]
+
+def make_document(
+        pages=1,
+        font_size=30,
+        max_depth=3,
+        families=("numeral", "alpha_lower", "roman_lower"),
+        numbering_errors=0.0,
+        indent_errors=0.0,
+        misspellings=0.0,
+        page_size=(2480, 3508),
+        blank_pages=(),
+        seed=0,
+    ) -> tuple[dict, dict]:
+    """
+    A legal-style document filling `pages` pages, as `image_to_data` output,
+    with numbering that runs on across pages. Text is `font_size` pixels tall
+    (30 is about 10 pt at 300 dpi). Each paragraph has a `numbering_errors`
+    chance of skipping a label and an `indent_errors` chance of being indented
+    one step too deep, each word a `misspellings` chance of a typo. Returns
+    the data and the ground truth: every injected error with the paragraphs
+    (page, left, top) an indent check should flag for it, and every typo.
+    `blank_pages` are the page numbers of empty separator pages added to the
+    `pages` pages of text, the way a scanner reports them: only the page itself, no text.
+    """
+    page_count = pages + len(blank_pages)
+    if any(not 1 <= b <= page_count for b in blank_pages) or len(set(blank_pages)) != len(blank_pages):
+        raise ValueError(f"blank pages must be distinct page numbers from 1 to {page_count}")
+    text_pages = [p for p in range(1, page_count + 1) if p not in blank_pages]
+    rnd = random.Random(seed)
+    margin = 150
+    line_height = round(font_size * 4 / 3)
+    char_width = round(font_size * 0.4)
+    indent_step = round(font_size * 8 / 3)
+    lines_per_page = (page_size[1] - 2 * margin) // line_height
+
+    # NOTE: the outline first, errors are injected knowing what comes after each paragraph
+    outline = []
+    counters = [0] * max_depth
+    depth = 0
+    page, used = 1, 0
+    while True:
+        n_lines = rnd.randint(1, 3)
+        if used + n_lines > lines_per_page:
+            page, used = page + 1, 0
+            if page > pages:
+                break
+        used += n_lines
+        # NOTE: documents start at the top level, a deeper first paragraph would head everything up to the first top-level one
+        if outline:
+            depth = max(0, min(max_depth - 1, depth + rnd.choice([-1, 0, 0, 1])))
+        for d in range(depth + 1, max_depth):
+            counters[d] = 0
+        skipped = len(outline) > 0 and rnd.random() < numbering_errors
+        if skipped:
+            counters[depth] += 1
+        family = families[depth % len(families)]
+        label = f"({LABEL_FAMILIES[family](counters[depth])})"
+        counters[depth] += 1
+        lines = [
+            [rnd.choice(VOCABULARY) for _ in range(rnd.randint(4, 10))]
+            for _ in range(n_lines)
+        ]
+        outline.append((SyntheticParagraph(page, depth, label, lines), skipped))
+    pars = [p for p, _ in outline]
+    for par in pars:
+        par.page = text_pages[par.page - 1]
+
+    errors = []
+    for k, (par, skipped) in enumerate(outline):
+        if skipped:
+            errors.append({"kind": "numbering", "paragraph": k, "label": par.label, "flags": [k]})
+    injected = {e["paragraph"] for e in errors}
+    for k, par in enumerate(pars):
+        if rnd.random() >= indent_errors or k == 0 or k + 1 == len(pars):
+            continue
+        d = par.depth
+        # NOTE: only leaves with a previous sibling, in a family their new parent's members can't continue,
+        # so exactly this paragraph and its next sibling are flagged
+        siblings = [j for j in range(k - 1, -1, -1) if pars[j].depth <= d]
+        if not siblings or pars[siblings[0]].depth != d or pars[k + 1].depth > d:
+            continue
+        if families[d % len(families)] == families[(d + 1) % len(families)]:
+            continue
+        following = next((j for j in range(k + 1, len(pars)) if pars[j].depth <= d), None)
+        flags = [k] if following is None or pars[following].depth < d else [k, following]
+        if injected & set(range(k - 1, (following or k) + 2)):
+            continue
+        par.offset = 1
+        injected.update(flags)
+        errors.append({"kind": "indent", "paragraph": k, "label": par.label, "flags": flags})
+
+    typos = []
+    for k, par in enumerate(pars):
+        for l, words in enumerate(par.lines):
+            for w, word in enumerate(words):
+                if len(word) >= 4 and rnd.random() < misspellings:
+                    words[w] = misspell(word, rnd)
+                    typos.append((k, l, w, word))
+
+    data = to_tesseract_data(pars, page_size, margin, indent_step, line_height, char_width)
+    for b in blank_pages:
+        for c, v in zip(TESSERACT_COLUMNS, (1, b, 0, 0, 0, 0, 0, 0, page_size[0], page_size[1], -1, "")):
+            data[c].append(v)
+
+    # NOTE: rows come out in paragraph, line and word order, the label first
+    par_rows = [i for i, level in enumerate(data["level"]) if level == 3]
+    word_rows = {}
+    k = l = -1
+    for i, level in enumerate(data["level"]):
+        if level == 3:
+            k, l = k + 1, -1
+        elif level == 4:
+            l += 1
+            w = -1 if l == 0 else 0
+        elif level == 5:
+            word_rows[(k, l, w)] = i
+            w += 1
+
+    def box(i):
+        return [data["page_num"][i], data["left"][i], data["top"][i], data["width"][i], data["height"][i]]
+
+    for e in errors:
+        e["flags"] = [box(par_rows[j])[:3] for j in e["flags"]]
+        e["page"], *e["box"] = box(par_rows[e["paragraph"]])
+    misspelled = []
+    for k, l, w, original in typos:
+        i = word_rows[(k, l, w)]
+        page, *position = box(i)
+        misspelled.append({"page": page, "box": position, "text": data["text"][i], "original": original})
+
+    truth = {
+        "params": {
+            "pages": pages, "font_size": font_size, "max_depth": max_depth, "families": list(families),
+            "numbering_errors": numbering_errors, "indent_errors": indent_errors, "misspellings": misspellings,
+            "page_size": list(page_size), "blank_pages": list(blank_pages), "seed": seed,
+        },
+        "page_count": page_count,
+        "paragraphs": len(pars),
+        "words": sum(1 for level in data["level"] if level == 5),
+        "line_height": line_height,
+        "indent_step": indent_step,
+        "errors": errors,
+        "misspellings": misspelled,
+    }
+    return data, truth
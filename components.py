@@ -1,36 +1,53 @@
 from itertools import chain
-import re
 import math
-from typing import Optional, Union
-import pytesseract
+from pathlib import Path
+import time
+from typing import Iterator, Optional, TextIO, Union
 from PIL import Image
 
 from util import (
     indent_multiline,
-    filter_meta_data,
-    split_data_by_rank,
+    SERIES_INDENTS,
     error_correction_map,
-    pattern_map,
+    next_smaller_or_equal,
+    RangeArgmin,
     INDENT_ROUNDING,
 )
-from drawing import DrawingBoard, get_current_drawing_board, set_current_drawing_board
-from spellchecker import SpellChecker
-
-spell = SpellChecker("en")
-_do_spell_check = False
-_do_indent_check = False
+from labels import LABEL_FAMILIES, initial_values, match_label
+from table import TesseractTable
+from drawing import DrawingBoard, set_current_drawing_board
+from spelling import candidate_cache, find_misspellings
+from ocr_cache import OCRCache
+from ocr_backends import OCRBackend, get_ocr_backend
+from margins import MarginBackend
+from preprocess import NormalizedBackend, normalize_enabled
+from refine import REFINE_CONFIG, cached_report, refine_enabled, refine_words
+from profiling import PipelineStats, profiled
+from diagnostics import Diagnostic, OK, WARNING, ERROR, draw_diagnostics, print_diagnostics
 
 class TesseractMetaData:
-    def __init__(self, data):
-        self.width = data["width"][0]
-        self.height = data["height"][0]
-        self.top = data["top"][0]
-        self.left = data["left"][0]
+    __slots__ = ("left", "top", "width", "height")
+
+    def __init__(self, left: int, top: int, width: int, height: int):
+        self.left = left
+        self.top = top
+        self.width = width
+        self.height = height
+
+    @classmethod
+    def from_table(cls, table: TesseractTable, i: int):
+        return cls(
+            int(table["left"][i]),
+            int(table["top"][i]),
+            int(table["width"][i]),
+            int(table["height"][i]),
+        )
         
     def __str__(self):
         return f"X={self.left}|Y={self.top}|W={self.width}|H={self.height}"
 
 class TesseractBase:
+    __slots__ = ("members", "meta")
     members: list
     meta: TesseractMetaData
 
@@ -49,51 +66,28 @@ class TesseractBase:
     def filter_empty(self):
         self.members = [i for i in self.members if len(i) > 0]
 
+    def _flatten(self, name: str) -> list:
+        return list(chain.from_iterable(getattr(i, name) for i in self.members))
+
     def __repr__(self):
         s_members = [ indent_multiline(repr(i)) for i in self.members]
         s_members = "\n".join(s_members)
         return f"{type(self).__name__}(meta={self.meta}) \n{s_members}"
 
 class TesseractWord:
-    def __init__(self, data):
-        self.text = data["text"][0]
-        self.text = error_correction_map.get(self.text, self.text) # TODO:
-        self.conf = data["conf"][0]
-        self.meta = TesseractMetaData(data)
+    __slots__ = ("text", "conf", "meta")
 
-        # text = re.findall(r"\b[a-zA-Z]+(?:['-][a-zA-Z]+)*\b", self.text.lower())
-        if not _do_spell_check:
-            return
-
-        if not any( re.match(p, self.text) is not None for p in pattern_map ):
-            get_current_drawing_board().set_font_size(self.meta.height * 0.8)
-            text = re.findall(r"\b[a-zA-Z]+(?:['-][a-zA-Z]+)*\.?\b", self.text.lower())
-            misspelled = spell.unknown(text)    
-            for word in misspelled:
-                get_current_drawing_board().add_rounded_rectangle(
-                    self.meta.left - 3,
-                    self.meta.top - 1,
-                    self.meta.width + 6,
-                    self.meta.height + 2,
-                    outline_color="blue",
-                    border_width=2,
-                    radius=5
-                )
-                # corrections = ", ".join(spell.correction(word))
-                candidates = spell.candidates(word)
-                if candidates is not None:
-                    cand_text = ", ".join(list(candidates)[:3])
-                    get_current_drawing_board().add_text(
-                        self.meta.left,
-                        self.meta.top - self.meta.height,
-                        cand_text,
-                        color="blue"
-                    )
-                    # print(word, cand_text)
-        
+    def __init__(self, table: TesseractTable, start: int):
+        self.text = table["text"][start]
+        self.text = error_correction_map.get(self.text, self.text) # TODO:
+        self.conf = int(table["conf"][start])
+        self.meta = TesseractMetaData.from_table(table, start)
 
     def __len__(self):
         return 1
+
+    def is_series_tag(self):
+        return len(match_label(self.text)) > 0
     
     # @staticmethod
     # def split_words(word: "TesseractWord"):
@@ -106,11 +100,12 @@ class TesseractWord:
         return f"TesseractWord(meta={self.meta}, word={self.text}, conf={round(self.conf, 2)})"
 
 class TesseractLine(TesseractBase):
-    def __init__(self, data):
-        meta = TesseractMetaData(data)
-        data = filter_meta_data(data)
-        words = split_data_by_rank(data, "word_num")
-        self.members = [TesseractWord(i) for i in words]
+    __slots__ = ()
+
+    def __init__(self, table: TesseractTable, start: int, stop: int):
+        meta = TesseractMetaData.from_table(table, start)
+        words = table.split_by_rank(start + 1, stop, "word_num")
+        self.members = [TesseractWord(table, i) for i, _ in words]
         
         if len(self.members) == 0:
             self.meta = meta
@@ -119,14 +114,8 @@ class TesseractLine(TesseractBase):
             top = self.members[0].meta.top
             height = max(m.meta.height for m in self.members)
             width = max(m.meta.left + m.meta.width for m in self.members) - left
-            self.meta = TesseractMetaData({
-                "top": [top],
-                "left": [left],
-                "height": [height],
-                "width": [width],
-            })
+            self.meta = TesseractMetaData(left, top, width, height)
             
-        self.data = data
         self.filter_empty()
 
 
@@ -138,12 +127,12 @@ class TesseractLine(TesseractBase):
         return " ".join(w.as_str() for w in self.words)
     
 class TesseractPar(TesseractBase):
-    def __init__(self, data):
-        self.meta = TesseractMetaData(data)
-        data = filter_meta_data(data)
-        lines = split_data_by_rank(data, "line_num")
-        self.members = [TesseractLine(i) for i in lines]
-        self.data = data
+    __slots__ = ()
+
+    def __init__(self, table: TesseractTable, start: int, stop: int):
+        self.meta = TesseractMetaData.from_table(table, start)
+        lines = table.split_by_rank(start + 1, stop, "line_num")
+        self.members = [TesseractLine(table, *i) for i in lines]
         self.filter_empty()
 
     @property
@@ -152,18 +141,18 @@ class TesseractPar(TesseractBase):
     
     @property
     def words(self):
-        return list(chain(*[i.words for i in self.members]))
+        return self._flatten("words")
 
     def as_str(self):
         return "\n".join(w.as_str() for w in self.lines if len(w) > 0)
 
 class TesseractBlock(TesseractBase):
-    def __init__(self, data):
-        self.meta = TesseractMetaData(data)
-        data = filter_meta_data(data)
-        pars = split_data_by_rank(data, "par_num")
-        self.members = [TesseractPar(i) for i in pars]
-        self.data = data
+    __slots__ = ()
+
+    def __init__(self, table: TesseractTable, start: int, stop: int):
+        self.meta = TesseractMetaData.from_table(table, start)
+        pars = table.split_by_rank(start + 1, stop, "par_num")
+        self.members = [TesseractPar(table, *i) for i in pars]
         self.filter_empty()
         
     @property
@@ -172,22 +161,22 @@ class TesseractBlock(TesseractBase):
     
     @property
     def lines(self):
-        return list(chain(*[i.lines for i in self.members]))
+        return self._flatten("lines")
     
     @property
     def words(self):
-        return list(chain(*[i.words for i in self.members]))
+        return self._flatten("words")
 
     def as_str(self):
         return "\n".join(w.as_str() for w in self.pars if len(w) > 0)
 
 class TesseractPage(TesseractBase):
-    def __init__(self, data):
-        self.meta = TesseractMetaData(data)
-        data = filter_meta_data(data)
-        blocks = split_data_by_rank(data, "block_num")
-        self.members = [TesseractBlock(i) for i in blocks]
-        self.data = data
+    __slots__ = ()
+
+    def __init__(self, table: TesseractTable, start: int, stop: int):
+        self.meta = TesseractMetaData.from_table(table, start)
+        blocks = table.split_by_rank(start + 1, stop, "block_num")
+        self.members = [TesseractBlock(table, *i) for i in blocks]
         self.filter_empty()
 
     @property
@@ -196,62 +185,79 @@ class TesseractPage(TesseractBase):
     
     @property
     def pars(self):
-        return list(chain(*[i.pars for i in self.members]))
+        return self._flatten("pars")
     
     @property
     def lines(self):
-        return list(chain(*[i.lines for i in self.members]))
+        return self._flatten("lines")
     
     @property
     def words(self):
-        return list(chain(*[i.words for i in self.members]))
+        return self._flatten("words")
 
     def as_str(self):
         return "\n\n".join(w.as_str() for w in self.blocks if len(w) > 0)
 
 class TesseractArticle(TesseractBase):
-    def __init__(self, data):
-        # print(len(data["text"]))
-        self.meta = TesseractMetaData(data)
-        # data = filter_meta_data(data)
-        # print(data) 
-        pages = split_data_by_rank(data, "page_num")
-        # print(pages)
-        self.members = [TesseractPage(page) for page in pages]
-        self.data = data
+    __slots__ = ("table", "_flat")
+
+    def __init__(self, data: Union[dict, TesseractTable]):
+        table = data if isinstance(data, TesseractTable) else TesseractTable(data)
+        self.meta = TesseractMetaData.from_table(table, 0)
+        pages = table.split_by_rank(0, len(table), "page_num")
+        self.members = [TesseractPage(table, *page) for page in pages]
+        self.table = table
         self.filter_empty()
 
+    def __setitem__(self, i, val):
+        super().__setitem__(i, val)
+        self._flat = {}
+
+    def __delitem__(self, i):
+        super().__delitem__(i)
+        self._flat = {}
+
+    def filter_empty(self):
+        super().filter_empty()
+        self._flat = {}
+
+    def _flatten(self, name: str) -> list:
+        # NOTE: the article-wide flat indexes are built once and shared by every caller,
+        # they are only dropped when the pages themselves change.
+        flat = self._flat.get(name)
+        if flat is None:
+            flat = self._flat[name] = super()._flatten(name)
+        return flat
+
     @property
     def pages(self):
         return self.members
     
     @property
     def blocks(self):
-        return list(chain(*[i.blocks for i in self.members]))
+        return self._flatten("blocks")
     
     @property
     def pars(self):
-        return list(chain(*[i.pars for i in self.members]))
+        return self._flatten("pars")
     
     @property
     def lines(self):
-        return list(chain(*[i.lines for i in self.members]))
+        return self._flatten("lines")
     
     @property
     def words(self):
-        return list(chain(*[i.words for i in self.members]))
+        return self._flatten("words")
 
     def as_str(self):
         return "\n === Page === \n".join(w.as_str() for w in self.pages if len(w) > 0)
 
 class Line:
+    __slots__ = ("matches", "line")
+
     def __init__(self, line: TesseractLine):
         assert isinstance(line, TesseractLine)
-        line_str = line.as_str().lstrip() 
-        matches = [(pat, re.search(pat, line_str)) for pat in pattern_map]
-        matches = [(pat, match.groups()[0]) for pat, match in matches if match is not None]
-        matches = {pat: val for pat, val in matches}
-        self.matches = matches
+        self.matches = match_label(line.as_str().lstrip())
         self.line = line
 
     @property
@@ -276,6 +282,8 @@ class Line:
         return self.line.as_str()
 
 class Paragraph:
+    __slots__ = ("lines", "_meta")
+
     def __init__(self, lines: list[Line]):
         self.lines = lines
 
@@ -288,15 +296,11 @@ class Paragraph:
             width = max(l.meta.width for l in lines)
             top = lines[0].meta.top
             left = lines[0].meta.left
-            last_line_bottom = lines[-1].meta.top + lines[-1].meta.height
-            height = last_line_bottom - top
+            # NOTE: a paragraph continued on the next page has lines above its first one
+            bottom = max(l.meta.top + l.meta.height for l in lines)
+            height = bottom - top
 
-        self._meta = TesseractMetaData({
-            "width": [ width ],
-            "height": [ height ],
-            "top": [ top ],
-            "left": [ left ],
-        })
+        self._meta = TesseractMetaData(left, top, width, height)
 
     @property
     def is_empty(self):
@@ -334,17 +338,26 @@ class Paragraph:
         assert len(self.lines) > 0
         return self.lines[0].has_series_tag()
     
-    def as_str(self):
+    def iter_lines(self) -> Iterator[str]:
         if len(self.lines) == 0:
-            return ""
-        return "\n".join(line.as_str() for line in self.lines)
+            yield ""
+            return
+        for line in self.lines:
+            # NOTE: as_str() of the lines joined, a line's text may span several
+            yield from line.as_str().split("\n")
+
+    def as_str(self):
+        return "\n".join(self.iter_lines())
     
     @staticmethod   
     def group_paragraphs(lines: list[Line]) -> list["Paragraph"]:
+        # NOTE: a blank page has no paragraphs, not one empty paragraph
+        if len(lines) == 0:
+            return []
         pars = []
         this_par = []
         for l in lines:
-            if l.has_series_tag() or len(pars) == 0:
+            if l.has_series_tag() or len(this_par) == 0:
                 if len(this_par) > 0:
                     pars.append(Paragraph(this_par))
                 this_par = [l]
@@ -354,6 +367,8 @@ class Paragraph:
         return pars
 
 class Series:
+    __slots__ = ("par", "members")
+
     def __init__(self, par: Paragraph, members: Optional[list["Series"]] = None):
         self.par = par
         self.members = []
@@ -404,7 +419,7 @@ class Series:
     
     @property
     def ranks(self):
-        return [ pattern_map[p][0][v] for p, v in self.matches.items()]
+        return [ LABEL_FAMILIES[p].rank(v) for p, v in self.matches.items()]
 
     @member_matches.setter
     def member_matches(self, new_member_matches):
@@ -415,124 +430,330 @@ class Series:
             m.matches = n
 
     def expects(self):
-        rank_maps = [pattern_map[p][1] for p in self.patterns]
-        expected = [  None if r >= len(m) else list(m)[r + 1] for m, r in zip(rank_maps, self.ranks)]
-        return expected
-
-    def check(self):
-        if len(self) == 0:
-            return True
-        # if self.par.is_empty:
-        #     return True
-        
-        initial_expects = [v[1][0] for v in pattern_map.values()]
-        # pivot = self.members[0]
-        prev_mem = None
-
-        for mem_idx, mem in enumerate(self.members):
-            mem.check()
-            is_expected = False
-            if prev_mem is None:
-                prev_mem_expects = initial_expects
-            else:
-                prev_mem_expects = prev_mem.expects()
-
-            if len(mem.values) == 0 and (mem_idx == 0 or len(prev_mem_expects) == 0):
-                is_expected = True
-            else:
-                for v in mem.values:
-                    if v in prev_mem_expects:
-                        # pivot expects this thing
-                        is_expected = True
-                        break
-            mem_par = mem.par
-            mem_meta = mem.par.meta
-            if prev_mem is None:
-                prev_mem_meta = mem_meta
-                prev_mem_par = mem_par
-            else:
-                prev_mem_meta = prev_mem.par.meta
-                prev_mem_par = prev_mem.par
-            height = mem_meta.top + mem_meta.height - prev_mem_meta.top
-            db = get_current_drawing_board()
-            if not is_expected:
-                db.add_verticle_line(prev_mem_meta.left, prev_mem_meta.top, height, "red", 6)
-                db.add_horizontal_line(prev_mem_meta.left, mem_meta.top-2, db.width - prev_mem_meta.left, "red", 3)
-                font_size = int(prev_mem_par.lines[0].meta.height * 0.8)
-                db.set_font_size( font_size  )
-                prev_mem_expects_str = ", ".join(f"({str(i)})" for i in prev_mem_expects)
-                mem_values_str = ", ".join( f"({str(i)})" for i in mem.values)
-                if len(prev_mem_expects) == 1:
-                    text = f"expected {prev_mem_expects_str}, but got {mem_values_str}"
-                else:
-                    text = f"expected one of {prev_mem_expects_str}, but got {mem_values_str}"
-                db.add_text(prev_mem_meta.left + 25, mem_meta.top - font_size - 6, text, "red")
-
-                print(f"expected one of {prev_mem_expects_str}, but got {mem.values}")
-            else:
-                db.add_verticle_line(prev_mem_meta.left, prev_mem_meta.top, height, "green", 2)
-                print(f"CONGRATS! expected one of {prev_mem_expects}, got {mem.values}")
-            prev_mem = mem
-
+        return [ LABEL_FAMILIES[p].value(r + 1) for p, r in zip(self.patterns, self.ranks)]
+
+    def walk(self):
+        """
+        Yields (series, member index) for every member in the tree, members
+        after their own members (depth first), without recursion.
+        """
+        # NOTE: frames are [series, member index, member already descended into]
+        stack = [[self, 0, False]]
+        while stack:
+            frame = stack[-1]
+            node, mem_idx, descended = frame
+            if mem_idx == len(node.members):
+                stack.pop()
+                continue
+            mem = node.members[mem_idx]
+            if not descended and len(mem.members) > 0:
+                frame[2] = True
+                stack.append([mem, 0, False])
+                continue
+            frame[1] += 1
+            frame[2] = False
+            yield node, mem_idx
+
+    def check(self) -> list[Diagnostic]:
+        """
+        Checks that every member continues the numbering of the previous one and
+        returns one diagnostic per member, in `walk` order.
+        """
+        initial_expects = tuple(initial_values())
+        return [node.check_member(mem_idx, initial_expects) for node, mem_idx in self.walk()]
+
+    def check_member(self, mem_idx: int, initial_expects: Optional[tuple] = None) -> Diagnostic:
+        """
+        The diagnostic `check` gives `members[mem_idx]`, it only depends on
+        that member and the one before it.
+        """
+        if initial_expects is None:
+            initial_expects = tuple(initial_values())
+        mem = self.members[mem_idx]
+        prev_mem = mem if mem_idx == 0 else self.members[mem_idx - 1]
+        prev_mem_expects = initial_expects if mem_idx == 0 else tuple(prev_mem.expects())
+        values = tuple(mem.values)
+        if len(values) == 0 and (mem_idx == 0 or len(prev_mem_expects) == 0):
+            is_expected = True
+        else:
+            is_expected = not set(prev_mem_expects).isdisjoint(values)
+        head = prev_mem.par.lines[0].meta
+        meta = mem.par.meta
+        return Diagnostic(
+            "indent",
+            OK if is_expected else ERROR,
+            (meta.left, meta.top, meta.width, meta.height),
+            expected=prev_mem_expects,
+            actual=values,
+            previous=(head.left, head.top, head.width, head.height),
+        )
+
+    @classmethod
+    def from_paragraphs(cls, pars: list[Paragraph]) -> "Series":
+        """
+        Nests paragraphs by indent. Within a run of paragraphs the least indented
+        ones are siblings, the first paragraph of a run always heads it, and
+        everything in between belongs to the preceding sibling.
+        Built with an explicit stack in O(n log n), so deep documents can't hit the recursion limit.
+        """
+        root = cls(Paragraph([]))
+        if len(pars) == 0:
+            return root
+        indents = [p.indent for p in pars]
+        argmin = RangeArgmin(indents)
+        next_sibling = next_smaller_or_equal(indents)
+        nodes = [cls(p) for p in pars]
+
+        # NOTE: each entry is a run pars[start:stop] whose members go to `parent`
+        stack = [(root, 0, len(pars))]
+        while stack:
+            parent, start, stop = stack.pop()
+            first_min = argmin(start, stop)
+            heads = [start]
+            # NOTE: the run's first paragraph heads it even if it is indented deeper than the rest
+            i = first_min if first_min > start else next_sibling[start]
+            while i < stop:
+                heads.append(i)
+                i = next_sibling[i]
+            heads.append(stop)
+            for head, next_head in zip(heads[:-1], heads[1:]):
+                parent.members.append(nodes[head])
+                if next_head > head + 1:
+                    stack.append((nodes[head], head + 1, next_head))
+        return root
 
     def add(self, new_member: Union["Series", Paragraph]):
         if isinstance(new_member, Paragraph):
             new_member = Series(new_member)
         self.members.append(new_member)
 
-    def as_str(self):
-        if self.par.is_empty:
-            return "\n".join( m.as_str() for m in self.members )
-        s_members = [ indent_multiline(m.as_str()) for m in self.members]
-        s_members = "\n".join(s_members)
-        s_head = self.par.as_str()
-        return s_head + "\n" + s_members
-
-
-
-def process(image: Image, lang="eng", indent_check=False, spell_check=False):
-    # Perform OCR to get detailed text data as a dictionary
-    set_current_drawing_board(DrawingBoard(image.copy()))
-    data = pytesseract.image_to_data(image, output_type='dict', lang=lang)
+    def iter_lines(self) -> Iterator[str]:
+        """
+        The lines of `as_str`, indented as they are generated in one walk over
+        the tree, instead of re-indenting every subtree's text at each level.
+        Members are indented under their head, a member without members of its
+        own is followed by an (indented) empty line.
+        """
+        # NOTE: frames are (series, depth), members of an empty paragraph (the tree's root) aren't indented under it
+        stack = [(self, 0)]
+        while stack:
+            node, depth = stack.pop()
+            indent = SERIES_INDENTS * depth
+            for line in node.par.lines:
+                # NOTE: a line's text may span several
+                for part in line.as_str().split("\n"):
+                    yield indent + part
+            if len(node.members) == 0:
+                yield indent
+            stack.extend((m, depth + (not node.par.is_empty)) for m in reversed(node.members))
+
+    def write(self, file: TextIO):
+        """
+        Writes `as_str` to `file` a line at a time.
+        """
+        lines = self.iter_lines()
+        file.write(next(lines))
+        file.writelines("\n" + line for line in lines)
 
-    # global _indent_check 
-    global _do_spell_check
-    global _do_indent_check
-    _do_spell_check = spell_check
-    _do_indent_check = indent_check
-
-    article = TesseractArticle(data)    
-    lines = [Line(l) for l in article.lines]
-    pars = Paragraph.group_paragraphs(lines)
-   
-    def group_nest(pars: list[Paragraph]):
-        if len(pars) == 0:
-            return []
-        target_indent = min(p.indent for p in pars)
-        nest_members = []
-        head_par = pars[0]
-        sub_pars = []
-        for p in pars[1:]:
-            if p.indent > target_indent:
-                sub_pars.append(p)
-            elif p.indent == target_indent:
-                member = Series(head_par, group_nest(sub_pars))
-                nest_members.append( member )
-                sub_pars = []
-                head_par = p
-            else:
-                break
-
-        last_member = Series(head_par, group_nest(sub_pars))
-        nest_members.append( last_member )
-
-        return nest_members
-    
-    # NOTE: Recursively group paragraphs into a hierarchy
-    s = Series(Paragraph([]), group_nest(pars))
-        
-    # NOTE: Checking alignment
-    if _do_indent_check:
-        s.check()
-    get_current_drawing_board().image#.show()
-    return get_current_drawing_board().image, s, article
+    def as_str(self):
+        return "\n".join(self.iter_lines())
+
+
+
+def check_spelling(article: TesseractArticle) -> list[Diagnostic]:
+    """
+    One diagnostic per misspelled token, suggestions are in `expected`.
+    """
+    words = [w for w in article.words if not w.is_series_tag()]
+    # NOTE: every unique token of the article is looked up in one batch
+    misspellings = find_misspellings(w.text for w in words)
+    diagnostics = []
+    for word, misspelled in zip(words, misspellings):
+        meta = word.meta
+        for token in misspelled:
+            diagnostics.append(Diagnostic(
+                "spelling",
+                WARNING,
+                (meta.left, meta.top, meta.width, meta.height),
+                expected=candidate_cache.get(token) or (),
+                actual=(token,),
+            ))
+    return diagnostics
+
+class PipelineCancelled(Exception):
+    pass
+
+class Pipeline:
+    """
+    `process` split into stages. Every stage's output is memoized under the
+    options it depends on, so changing an option re-runs only the stages
+    after it. OCR runs once per image and language, checks that are switched
+    off keep their last result for when they are switched back on.
+    OCR goes through `ocr_backend` (BIRDNEST_OCR_BACKEND by default), with an
+    `OCRCache` the result is also kept on disk across runs. Pages are
+    rescaled to the text size tesseract reads best and binarized first
+    unless `normalize` is off (see `preprocess`, BIRDNEST_NORMALIZE), and
+    words tesseract was unsure of are read again, upscaled, if `refine` is
+    on (see `refine`, BIRDNEST_REFINE, off by default). With
+    `indent_only` only the labels at the start of every line are OCR'd
+    (see `margins`), which is enough for the indent check but not for the
+    spell check.
+    """
+    # NOTE: stage -> options its output depends on, in run order
+    STAGES = {
+        "ocr": ("lang", "indent_only"),
+        "refine": ("lang", "indent_only"),
+        "hierarchy": ("lang", "indent_only"),
+        "labels": ("lang", "indent_only"),
+        "paragraphs": ("lang", "indent_only"),
+        "tree": ("lang", "indent_only"),
+        "spell_check": ("lang", "indent_only"),
+        "indent_check": ("lang", "indent_only"),
+        "render": ("lang", "indent_only", "indent_check", "spell_check"),
+    }
+
+    def __init__(
+            self,
+            image: Image,
+            ocr_cache: Optional[OCRCache] = None,
+            ocr_backend: Optional[OCRBackend] = None,
+            normalize: Optional[bool] = None,
+            refine: Optional[bool] = None,
+        ):
+        self.image = image
+        self.ocr_cache = ocr_cache
+        self.ocr_backend = ocr_backend or get_ocr_backend()
+        self.normalize = normalize_enabled() if normalize is None else normalize
+        self.refine = refine_enabled() if refine is None else refine
+        # NOTE: how long the last OCR pass took, None when it came from the cache
+        self.ocr_seconds = None
+        # NOTE: OCR cache key of the last OCR pass, None if it isn't cached
+        self._ocr_key = None
+        self.refine_report = None
+        # NOTE: timings of the stages computed by the last `run`
+        self.stats = PipelineStats()
+        self._memo = {}
+        self._progress = None
+
+    def stage(self, name: str, options: dict, compute):
+        if self._progress is not None:
+            self._progress(name, list(self.STAGES).index(name), len(self.STAGES))
+        key = tuple(options[o] for o in self.STAGES[name])
+        memo = self._memo.get(name)
+        if memo is None or memo[0] != key:
+            memo = (key, self.stats.measure(name, compute))
+            self._memo[name] = memo
+        return memo[1]
+
+    def invalidate(self, name: str):
+        """
+        Forgets `name` and every stage after it.
+        """
+        stages = list(self.STAGES)
+        for later in stages[stages.index(name):]:
+            self._memo.pop(later, None)
+
+    def run(self, lang="eng", indent_check=False, spell_check=False, draw=True, verbose=True, progress=None, indent_only=False):
+        """
+        `progress(stage, index, total)` is called before every stage. It may
+        raise `PipelineCancelled` to abandon the run, stages that already
+        finished stay memoized. Stage timings are left in `stats` (see
+        `profiling`).
+        """
+        if indent_only and spell_check:
+            raise ValueError("spell check needs the full text, it can't run in indent-only mode")
+        self._progress = progress
+        self.stats = PipelineStats()
+        try:
+            with profiled(Path(getattr(self.image, "filename", "") or "page").name):
+                return self._run(lang, indent_check, spell_check, draw, verbose, indent_only)
+        finally:
+            self._progress = None
+
+    def read(self, lang="eng", indent_only=False) -> dict:
+        """
+        The page's OCR output after the refine pass, the first two stages of `run`.
+        """
+        options = dict(lang=lang, indent_only=indent_only)
+        data = self.stage("ocr", options, lambda: self._ocr(lang, indent_only))
+        data, self.refine_report = self.stage("refine", options, lambda: self._refine(data, lang))
+        return data
+
+    def _run(self, lang, indent_check, spell_check, draw, verbose, indent_only):
+        options = dict(lang=lang, indent_check=indent_check, spell_check=spell_check, indent_only=indent_only)
+        data = self.read(lang, indent_only)
+        article = self.stage("hierarchy", options, lambda: TesseractArticle(data))
+        lines = self.stage("labels", options, lambda: [Line(l) for l in article.lines])
+        pars = self.stage("paragraphs", options, lambda: Paragraph.group_paragraphs(lines))
+        # NOTE: group paragraphs into a hierarchy
+        s = self.stage("tree", options, lambda: Series.from_paragraphs(pars))
+
+        diagnostics = []
+        if spell_check:
+            diagnostics += self.stage("spell_check", options, lambda: check_spelling(article))
+        # NOTE: Checking alignment
+        if indent_check:
+            diagnostics += self.stage("indent_check", options, s.check)
+
+        if verbose:
+            if self.refine_report is not None and self.refine_report.crops:
+                print(self.refine_report)
+            print_diagnostics(d for d in diagnostics if d.kind == "indent")
+        if not draw:
+            return None, s, article, diagnostics
+        board = self.stage("render", options, lambda: self._render(diagnostics))
+        set_current_drawing_board(board)
+        return board, s, article, diagnostics
+
+    def _ocr(self, lang: str, indent_only=False) -> dict:
+        # Perform OCR to get detailed text data as a dictionary
+        backend = self.ocr_backend
+        if self.normalize and backend.normalizable:
+            backend = NormalizedBackend(backend)
+        if indent_only:
+            # NOTE: lines are found on the page as it is, only the strip of their starts is normalized
+            backend = MarginBackend(backend)
+        self.ocr_seconds = None
+        key = None
+        if self.ocr_cache is not None and backend.cacheable:
+            key = self.ocr_cache.key(self.image, backend, lang)
+        self._ocr_key = key
+        if key is not None:
+            data = self.ocr_cache.get(key)
+            if data is not None:
+                return data
+        start = time.perf_counter()
+        data = backend.image_to_data(self.image, lang=lang)
+        self.ocr_seconds = time.perf_counter() - start
+        if key is not None:
+            self.ocr_cache.put(key, data)
+        return data
+
+    def _refine(self, data: dict, lang: str) -> tuple:
+        # NOTE: saved output can't read crops it has never seen
+        if not self.refine or not self.ocr_backend.normalizable:
+            return data, None
+        key = None
+        if self._ocr_key is not None:
+            backend = self.ocr_backend
+            key = self.ocr_cache.derived_key(self._ocr_key, f"{REFINE_CONFIG} {backend.name} {backend.version()}")
+            refined = self.ocr_cache.get(key)
+            if refined is not None:
+                return refined, cached_report(data, refined)
+        refined, report = refine_words(self.image, data, self.ocr_backend, lang, self.ocr_seconds)
+        if key is not None and report.crops:
+            self.ocr_cache.put(key, refined)
+        return refined, report
+
+    def _render(self, diagnostics: list[Diagnostic]) -> DrawingBoard:
+        board = DrawingBoard(self.image.size)
+        draw_diagnostics(diagnostics, board)
+        return board
+
+def process(image: Image, lang="eng", indent_check=False, spell_check=False, draw=True, verbose=True, ocr_cache=None, ocr_backend=None, indent_only=False, refine=None):
+    """
+    Returns the annotations as a `DrawingBoard` (None if `draw` is off), the
+    series tree, the article and the diagnostics. Headless runs pass
+    draw=False, verbose=False. Use a `Pipeline` to re-run with other options.
+    """
+    return Pipeline(image, ocr_cache, ocr_backend, refine=refine).run(lang, indent_check, spell_check, draw, verbose, indent_only=indent_only)
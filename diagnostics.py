@@ -0,0 +1,97 @@
+import sys
+from typing import Iterable, Optional
+
+from drawing import DrawingBoard
+
+OK = "ok"
+WARNING = "warning"
+ERROR = "error"
+
+class Diagnostic:
+    """
+    Outcome of one check. `position` is the (left, top, width, height) of the
+    checked paragraph or word. For indent checks `previous` is the head line of
+    the member it was compared against (the member itself for the first one).
+    """
+    __slots__ = ("kind", "severity", "position", "expected", "actual", "previous")
+
+    def __init__(
+            self,
+            kind: str,
+            severity: str,
+            position: tuple[int, int, int, int],
+            expected: tuple[str, ...] = (),
+            actual: tuple[str, ...] = (),
+            previous: Optional[tuple[int, int, int, int]] = None,
+        ):
+        self.kind = kind
+        self.severity = severity
+        self.position = position
+        self.expected = expected
+        self.actual = actual
+        self.previous = previous
+
+    @property
+    def message(self) -> str:
+        if self.kind == "spelling":
+            return f"{', '.join(self.actual)} is misspelled, did you mean {', '.join(self.expected)}"
+        expected = ", ".join(f"({v})" for v in self.expected)
+        actual = ", ".join(f"({v})" for v in self.actual)
+        if self.severity == OK:
+            return f"expected one of {expected}, got {actual}"
+        if len(self.expected) == 1:
+            return f"expected {expected}, but got {actual}"
+        return f"expected one of {expected}, but got {actual}"
+
+    def as_dict(self) -> dict:
+        d = {k: getattr(self, k) for k in self.__slots__}
+        for k in ["position", "expected", "actual", "previous"]:
+            if d[k] is not None:
+                d[k] = list(d[k])
+        return d
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "Diagnostic":
+        previous = d.get("previous")
+        return cls(
+            d["kind"],
+            d["severity"],
+            tuple(d["position"]),
+            expected=tuple(d.get("expected", ())),
+            actual=tuple(d.get("actual", ())),
+            previous=None if previous is None else tuple(previous),
+        )
+
+    def __repr__(self):
+        return f"Diagnostic({self.kind}, {self.severity}, {self.position}, expected={self.expected}, actual={self.actual})"
+
+def has_errors(diagnostics: Iterable[Diagnostic]) -> bool:
+    return any(d.severity == ERROR for d in diagnostics)
+
+def draw_diagnostics(diagnostics: Iterable[Diagnostic], db: DrawingBoard):
+    for d in diagnostics:
+        # NOTE: one layer per kind, so the viewer can hide spelling or indent marks
+        db.set_layer(d.kind)
+        left, top, width, height = d.position
+        if d.kind == "spelling":
+            db.set_font_size(height * 0.8)
+            db.add_rounded_rectangle(left - 3, top - 1, width + 6, height + 2, outline_color="blue", border_width=2, radius=5)
+            if len(d.expected) > 0:
+                db.add_text(left, top - height, ", ".join(d.expected), color="blue")
+            continue
+        prev_left, prev_top, _, prev_height = d.previous
+        span = top + height - prev_top
+        if d.severity == OK:
+            db.add_verticle_line(prev_left, prev_top, span, "green", 2)
+            continue
+        db.add_verticle_line(prev_left, prev_top, span, "red", 6)
+        db.add_horizontal_line(prev_left, top - 2, db.width - prev_left, "red", 3)
+        font_size = int(prev_height * 0.8)
+        db.set_font_size(font_size)
+        db.add_text(prev_left + 25, top - font_size - 6, d.message, "red")
+
+def print_diagnostics(diagnostics: Iterable[Diagnostic], file=None):
+    file = file or sys.stdout
+    for d in diagnostics:
+        prefix = "CONGRATS! " if d.severity == OK else ""
+        print(prefix + d.message, file=file)
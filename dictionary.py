@@ -0,0 +1,251 @@
+import gzip
+import hashlib
+import json
+import os
+from pathlib import Path
+import pkgutil
+import string
+from typing import BinaryIO, Callable, Iterable, Union
+import uuid
+
+import numpy as np
+
+DICTIONARY_VERSION = 2
+ARRAYS = ["words", "offsets", "freqs", "hashes", "hash_ids"]
+
+HASH_BASE = 1099511628211
+
+def hash_keys(words: list[str]) -> np.ndarray:
+    """
+    64-bit polynomial hash of every word, computed over one joined buffer so
+    that hundreds of thousands of edit candidates can be probed at once.
+    """
+    if len(words) == 0:
+        return np.zeros(0, dtype=np.uint64)
+    data = np.frombuffer("\0".join(words).encode("utf-8"), dtype=np.uint8)
+    sep = np.flatnonzero(data == 0)
+    starts = np.concatenate([[0], sep + 1])
+    lengths = np.concatenate([sep, [len(data)]]) - starts
+    pos = np.arange(len(data)) - np.repeat(starts, lengths + 1)[:len(data)]
+    with np.errstate(over="ignore"):
+        powers = np.cumprod(np.full(int(lengths.max()) + 1, HASH_BASE, dtype=np.uint64))
+        terms = (data.astype(np.uint64) + np.uint64(1)) * powers[pos]
+        terms[sep] = 0
+        h = np.add.reduceat(np.append(terms, np.uint64(0)), starts)
+        h ^= lengths.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+        # NOTE: splitmix64 finalizer
+        h ^= h >> np.uint64(30)
+        h *= np.uint64(0xBF58476D1CE4E5B9)
+        h ^= h >> np.uint64(27)
+        h *= np.uint64(0x94D049BB133111EB)
+        h ^= h >> np.uint64(31)
+    return h
+
+def write_atomic(path: Path, write: Callable[[BinaryIO], None]):
+    """
+    Writes the file under a name of its own and renames it into place, so
+    processes building the same cache at once never see (or map) it half written.
+    """
+    tmp = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        with open(tmp, "wb") as f:
+            write(f)
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+def write_meta(path: Path, meta: dict):
+    write_atomic(path, lambda f: f.write(json.dumps(meta).encode("utf-8")))
+
+def should_check(word: str, longest_word_length: int) -> bool:
+    # NOTE: mirrors `SpellChecker._check_if_should_check`
+    if len(word) == 1 and word in string.punctuation:
+        return False
+    if len(word) > longest_word_length + 3:
+        return False
+    if word.lower() == "nan":
+        return True
+    try:
+        float(word)
+        return False
+    except ValueError:
+        pass
+    return True
+
+class CompactDictionary:
+    """
+    Word frequency list stored as a sorted utf-8 string table, a frequency
+    array and a sorted hash index. `load` memory-maps the arrays, so the pages
+    are shared by every process that opens the same dictionary.
+    """
+    def __init__(
+            self,
+            words: np.ndarray,
+            offsets: np.ndarray,
+            freqs: np.ndarray,
+            hashes: np.ndarray,
+            hash_ids: np.ndarray,
+            letters: str,
+            longest_word_length: int,
+            path=None,
+        ):
+        self.words = words
+        self.offsets = offsets
+        self.freqs = freqs
+        self.hashes = hashes
+        self.hash_ids = hash_ids
+        self.letters = letters
+        self.longest_word_length = longest_word_length
+        self.path = path
+
+    @property
+    def checksum(self) -> int:
+        # NOTE: identifies the exact word list, indexes built on top of it store this
+        return int(np.bitwise_xor.reduce(self.hashes, initial=np.uint64(len(self))))
+
+    def __len__(self):
+        return len(self.freqs)
+
+    def __contains__(self, word: str):
+        return self.find([word])[0] >= 0
+
+    def word(self, i: int) -> str:
+        return self.words[self.offsets[i]:self.offsets[i + 1]].tobytes().decode("utf-8")
+
+    def items(self):
+        for i in range(len(self)):
+            yield self.word(i), int(self.freqs[i])
+
+    def find(self, words: list[str]) -> np.ndarray:
+        """
+        Returns the index of every word in the string table, or -1 if it is missing.
+        """
+        found = np.full(len(words), -1, dtype=np.int64)
+        if len(words) == 0 or len(self) == 0:
+            return found
+        keys = hash_keys(words)
+        pos = np.minimum(np.searchsorted(self.hashes, keys), len(self.hashes) - 1)
+        for i in np.flatnonzero(self.hashes[pos] == keys).tolist():
+            # NOTE: a hash hit is confirmed against the string table (collisions are possible but rare)
+            p = int(pos[i])
+            while p < len(self.hashes) and self.hashes[p] == keys[i]:
+                j = int(self.hash_ids[p])
+                if self.word(j) == words[i]:
+                    found[i] = j
+                    break
+                p += 1
+        return found
+
+    def frequencies(self, words: list[str]) -> np.ndarray:
+        ids = self.find(words)
+        found = ids >= 0
+        freqs = np.zeros(len(words), dtype=np.int64)
+        freqs[found] = self.freqs[ids[found]]
+        return freqs
+
+    @classmethod
+    def build(cls, frequencies: Iterable[tuple[str, int]]) -> "CompactDictionary":
+        merged = {}
+        for w, f in frequencies:
+            merged[w] = max(int(f), 1)
+        frequencies = sorted(merged.items())
+        encoded = [w.encode("utf-8") for w, _ in frequencies]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(w) for w in encoded])
+        words = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        freqs = np.array([f for _, f in frequencies], dtype=np.int64)
+        hashes = hash_keys([w for w, _ in frequencies])
+        hash_ids = np.argsort(hashes, kind="stable").astype(np.int32)
+        letters = "".join(sorted(set().union(*[w for w, _ in frequencies])))
+        longest = max((len(w) for w, _ in frequencies), default=0)
+        return cls(words, offsets, freqs, hashes[hash_ids], hash_ids, letters, longest)
+
+    def save(self, path: Union[str, Path]):
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        for name in ARRAYS:
+            write_atomic(path / f"{name}.npy", lambda f: np.save(f, getattr(self, name)))
+        # NOTE: meta.json is written last and marks the dictionary as complete
+        write_meta(path / "meta.json", {
+            "version": DICTIONARY_VERSION,
+            "letters": self.letters,
+            "longest_word_length": self.longest_word_length,
+        })
+        self.path = path
+
+    @classmethod
+    def load(cls, path: Union[str, Path], mmap=True) -> "CompactDictionary":
+        path = Path(path)
+        with open(path / "meta.json") as f:
+            meta = json.load(f)
+        if meta["version"] != DICTIONARY_VERSION:
+            raise ValueError(f"Unsupported dictionary version {meta['version']} in {path}")
+        mmap_mode = "r" if mmap else None
+        arrays = {name: np.load(path / f"{name}.npy", mmap_mode=mmap_mode) for name in ARRAYS}
+        return cls(**arrays, letters=meta["letters"], longest_word_length=meta["longest_word_length"], path=path)
+
+    @classmethod
+    def load_or_build(cls, path: Union[str, Path], frequencies) -> "CompactDictionary":
+        try:
+            return cls.load(path)
+        except (FileNotFoundError, ValueError):
+            # NOTE: missing or written by an older version
+            pass
+        cls.build(frequencies() if callable(frequencies) else frequencies).save(path)
+        return cls.load(path)
+
+class MergedDictionary:
+    """
+    Base dictionary plus any number of domain word lists, merged at lookup
+    time: a word is known if any of them has it, and its frequency is the sum.
+    """
+    def __init__(self, dictionaries: list[CompactDictionary]):
+        self.dictionaries = dictionaries
+        self.letters = "".join(sorted(set().union(*[d.letters for d in dictionaries])))
+        self.longest_word_length = max((d.longest_word_length for d in dictionaries), default=0)
+
+    def __contains__(self, word: str):
+        return self.frequencies([word])[0] > 0
+
+    def frequencies(self, words: list[str]) -> np.ndarray:
+        total = np.zeros(len(words), dtype=np.int64)
+        for d in self.dictionaries:
+            total += d.frequencies(words)
+        return total
+
+    def known(self, words: Iterable[str]) -> set[str]:
+        words = list(set(words))
+        found = np.flatnonzero(self.frequencies(words) > 0).tolist()
+        return {words[i] for i in found if should_check(words[i], self.longest_word_length)}
+
+    def unknown(self, words: Iterable[str]) -> set[str]:
+        words = [w for w in set(words) if should_check(w, self.longest_word_length)]
+        return {w for w, f in zip(words, self.frequencies(words).tolist()) if f == 0}
+
+def builtin_frequencies(lang="en") -> list[tuple[str, int]]:
+    # NOTE: the word frequency list shipped with pyspellchecker
+    data = pkgutil.get_data("spellchecker", f"resources/{lang.lower()}.json.gz")
+    return list(json.loads(gzip.decompress(data).decode("utf-8")).items())
+
+def read_word_list(path: Union[str, Path]) -> list[tuple[str, int]]:
+    """
+    One entry per line, optionally followed by a tab and a frequency (default 1).
+    Multi-word entries such as statute names add each of their words. Words are
+    lowercased, blank lines and `#` comments are skipped.
+    """
+    frequencies = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if len(line) == 0 or line.startswith("#"):
+                continue
+            entry, _, freq = line.partition("\t")
+            freq = int(freq) if freq.strip().isdigit() else 1
+            frequencies.extend((w.lower(), freq) for w in entry.split())
+    return frequencies
+
+def word_list_cache_name(path: Union[str, Path]) -> str:
+    with open(path, "rb") as f:
+        digest = hashlib.sha1(f.read()).hexdigest()[:16]
+    return f"{Path(path).stem}-{digest}"
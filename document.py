@@ -0,0 +1,287 @@
+"""
+Multi-page documents: the frames of a multi-page TIFF, or several files read
+as the pages of one document, checked as one series tree while they stream
+in. Frames are decoded one at a time and only a few pages ahead are held in
+memory, OCR of the next pages runs in the background while the tree is
+built for the current one, and every page's diagnostics are handed out as
+soon as it is done.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import time
+from typing import Iterable, Iterator, Optional, Union
+
+from PIL import Image
+
+from components import Line, Paragraph, Pipeline, Series, TesseractArticle, check_spelling
+from diagnostics import Diagnostic
+from labels import initial_values
+from profiling import PipelineStats, profiled
+
+# NOTE: pages OCR'd ahead of the one being checked, also the most decoded pages in memory at once
+LOOKAHEAD = 2
+
+def iter_frames(sources: Union[str, Path, Image.Image, Iterable]) -> Iterator[Image.Image]:
+    """
+    Every frame of every source (a path or an opened image), decoded one at
+    a time. Frames of a multi-page file are named `<stem>-<page>` after it,
+    for replay backends.
+    """
+    if isinstance(sources, (str, Path, Image.Image)):
+        sources = [sources]
+    for source in sources:
+        image = Image.open(source) if isinstance(source, (str, Path)) else source
+        try:
+            filename = getattr(image, "filename", "") or ""
+            frames = getattr(image, "n_frames", 1)
+            for i in range(frames):
+                image.seek(i)
+                # NOTE: copy() decodes this frame only, and stays valid after the next seek
+                frame = image.copy()
+                if filename:
+                    path = Path(filename)
+                    frame.filename = str(path.with_name(f"{path.stem}-{i + 1}{path.suffix}")) if frames > 1 else filename
+                yield frame
+        finally:
+            if image is not source:
+                image.close()
+
+def count_frames(path: Union[str, Path]) -> int:
+    with Image.open(path) as image:
+        return getattr(image, "n_frames", 1)
+
+class PageResult:
+    """
+    One page of a `Document`. `diagnostics` are the page's own, `revised` the
+    indent diagnostics of earlier pages that changed now that this page is
+    known, as (page index, diagnostic).
+    """
+    __slots__ = ("index", "article", "diagnostics", "revised", "refine_report", "seconds", "stats")
+
+    def __init__(self, index: int, article: TesseractArticle, diagnostics: list[Diagnostic], revised: list[tuple[int, Diagnostic]], refine_report, seconds: float, stats: PipelineStats):
+        self.index = index
+        self.article = article
+        self.diagnostics = diagnostics
+        self.revised = revised
+        self.refine_report = refine_report
+        self.seconds = seconds
+        self.stats = stats
+
+class Document:
+    """
+    Checks the pages of `sources` (see `iter_frames`) as one document: a
+    numbered clause continued on the next page stays one paragraph, and
+    numbering carries over page breaks. OCR options are those of `Pipeline`.
+
+    A page only changes the open path of the tree, the last member at every
+    level, so its paragraphs are added there and only they are checked; an
+    earlier page's diagnostics change only when a paragraph continued from
+    it grows, or when a new paragraph is less indented than everything in
+    its run since the run's head (the first paragraph of a run heads it).
+    That regroups the run, which is rebuilt and checked again, so a page
+    costs its own paragraphs plus the runs it regroups, at most the
+    document when it outdents past everything read so far.
+    """
+    def __init__(
+            self,
+            sources,
+            ocr_cache=None,
+            ocr_backend=None,
+            normalize: Optional[bool] = None,
+            refine: Optional[bool] = None,
+            lookahead: int = LOOKAHEAD,
+        ):
+        self.sources = sources
+        self.ocr_cache = ocr_cache
+        self.ocr_backend = ocr_backend
+        self.normalize = normalize
+        self.refine = refine
+        self.lookahead = max(lookahead, 1)
+        self.series = Series.from_paragraphs([])
+        # NOTE: page index -> that page's diagnostics as they stand after the last page
+        self.diagnostics = {}
+        # NOTE: page number (from 1) -> (width, height)
+        self.page_sizes = {}
+        self._page_of = {}
+        # NOTE: keyed by id() of a paragraph's first line, which stays when the paragraph is continued or regrouped:
+        # its number in document order, and its indent diagnostic
+        self._number = {}
+        self._checked = {}
+        # NOTE: page index -> keys of its paragraphs, in `Series.walk` order
+        self._order = {}
+
+    def _read(self, image: Image.Image, index: int, lang: str, indent_only: bool):
+        start = time.perf_counter()
+        pipeline = Pipeline(image, self.ocr_cache, self.ocr_backend, normalize=self.normalize, refine=self.refine)
+        with profiled(page_name(image, index)):
+            data = dict(pipeline.read(lang, indent_only))
+        data["page_num"] = [index + 1] * len(data["page_num"])
+        return data, image.size, pipeline.refine_report, time.perf_counter() - start, pipeline.stats
+
+    def pages(self, lang="eng", indent_check=True, spell_check=False, indent_only=False) -> Iterator[PageResult]:
+        """
+        Yields a `PageResult` per page, in order, as each one is checked.
+        """
+        if indent_only and spell_check:
+            raise ValueError("spell check needs the full text, it can't run in indent-only mode")
+        frames = enumerate(iter_frames(self.sources))
+        pending = []
+        with ThreadPoolExecutor(self.lookahead) as pool:
+            def fill():
+                while len(pending) < self.lookahead:
+                    found = next(frames, None)
+                    if found is None:
+                        return
+                    index, image = found
+                    pending.append((index, page_name(image, index), pool.submit(self._read, image, index, lang, indent_only)))
+
+            fill()
+            while pending:
+                index, name, future = pending.pop(0)
+                data, size, refine_report, seconds, stats = future.result()
+                self.page_sizes[index + 1] = size
+                # NOTE: the next page goes to OCR before this one is checked
+                fill()
+                start = time.perf_counter()
+                # NOTE: profiled apart from the page's OCR, which ran on another thread
+                with profiled(f"{name}.check"):
+                    article = stats.measure("hierarchy", lambda: TesseractArticle(data))
+                    diagnostics = stats.measure("spell_check", lambda: check_spelling(article)) if spell_check else []
+                    revised = []
+                    if indent_check:
+                        indents, revised = self._extend(article, index, stats)
+                        diagnostics = indents + diagnostics
+                self.diagnostics[index] = diagnostics
+                seconds += time.perf_counter() - start
+                yield PageResult(index, article, diagnostics, revised, refine_report, seconds, stats)
+
+    def page_of(self, line: Line) -> int:
+        """
+        Index of the page `line` is on.
+        """
+        return self._page_of[id(line)]
+
+    def _extend(self, article: TesseractArticle, index: int, stats: PipelineStats) -> tuple[list[Diagnostic], list[tuple[int, Diagnostic]]]:
+        """
+        Adds the page's paragraphs to the tree and checks what they can have
+        changed. Returns the page's indent diagnostics and those of earlier
+        pages that changed.
+        """
+        lines = stats.measure("labels", lambda: [Line(l) for l in article.lines])
+        for line in lines:
+            self._page_of[id(line)] = index
+        count = len(self._number)
+        first = count
+        # NOTE: lines before the page's first label continue the previous page's last paragraph
+        continued = next((i for i, l in enumerate(lines) if l.has_series_tag()), len(lines))
+        if continued > 0 and count > 0:
+            last = self.series
+            while last.members:
+                last = last.members[-1]
+            last.par = Paragraph(last.par.lines + lines[:continued])
+            lines = lines[continued:]
+            first = count - 1
+        pars = stats.measure("paragraphs", lambda: Paragraph.group_paragraphs(lines))
+        first = min(first, stats.measure("tree", lambda: self._add(pars)))
+        if first == len(self._number):
+            return [], []
+
+        walked = stats.measure("indent_check", lambda: self._check_from(first))
+        found = {}
+        for key in walked:
+            found.setdefault(self._page_of[key], []).append(key)
+        rechecked = set(walked)
+        revised = []
+        result = []
+        for page, keys in found.items():
+            self._order[page] = [k for k in self._order.get(page, ()) if k not in rechecked] + keys
+            now = [self._checked[k] for k in self._order[page]]
+            if page == index:
+                result = now
+                continue
+            before = [d for d in self.diagnostics.get(page, []) if d.kind == "indent"]
+            if [verdict(d) for d in before] != [verdict(d) for d in now]:
+                known = {verdict(d) for d in before}
+                revised += [(page, d) for d in now if verdict(d) not in known]
+            others = [d for d in self.diagnostics.get(page, []) if d.kind != "indent"]
+            self.diagnostics[page] = now + others
+        return result, sorted(revised, key=lambda r: r[0])
+
+    def _add(self, pars: list[Paragraph]) -> int:
+        """
+        Adds `pars` to the end of the tree the way `Series.from_paragraphs`
+        would have placed them. Returns the number of the first paragraph
+        whose place or check may have changed.
+        """
+        first = len(self._number)
+        for par in pars:
+            self._number[id(par.lines[0])] = len(self._number)
+            node = self.series
+            # NOTE: down the open path, to the run whose heads are as indented as `par` (or the end of it)
+            while node.members:
+                members = node.members
+                low = min(members[0].indent, members[-1].indent)
+                if par.indent > low:
+                    node = members[-1]
+                    continue
+                if par.indent < low and len(members) > 1:
+                    # NOTE: the run's first paragraph now heads everything after it
+                    head = members[0]
+                    head.members = Series.from_paragraphs(list(preorder(members))[1:]).members
+                    del members[1:]
+                    first = min(first, self._number[id(head.par.lines[0])] + 1)
+                break
+            node.members.append(Series(par))
+        return first
+
+    def _check_from(self, first: int) -> list[int]:
+        """
+        Checks every paragraph from number `first` on, returns the keys of
+        those and of the open path above them in `Series.walk` order.
+        """
+        initial_expects = tuple(initial_values())
+        walked = []
+        # NOTE: `Series.walk`, starting every series at the member whose subtree holds `first`
+        stack = [[self.series, self._first_member(self.series, first), False]]
+        while stack:
+            frame = stack[-1]
+            node, mem_idx, descended = frame
+            if mem_idx == len(node.members):
+                stack.pop()
+                continue
+            mem = node.members[mem_idx]
+            if not descended and len(mem.members) > 0:
+                frame[2] = True
+                stack.append([mem, self._first_member(mem, first), False])
+                continue
+            frame[1] += 1
+            frame[2] = False
+            key = id(mem.par.lines[0])
+            if self._number[key] >= first:
+                self._checked[key] = node.check_member(mem_idx, initial_expects)
+            walked.append(key)
+        return walked
+
+    def _first_member(self, node: Series, first: int) -> int:
+        i = len(node.members) - 1
+        while i > 0 and self._number[id(node.members[i].par.lines[0])] > first:
+            i -= 1
+        return max(i, 0)
+
+def preorder(nodes: list[Series]) -> Iterator[Paragraph]:
+    """
+    Paragraphs of `nodes` and their members, in document order.
+    """
+    stack = list(reversed(nodes))
+    while stack:
+        node = stack.pop()
+        yield node.par
+        stack.extend(reversed(node.members))
+
+def page_name(image: Image.Image, index: int) -> str:
+    filename = getattr(image, "filename", "")
+    return Path(filename).name if filename else f"page-{index + 1}"
+
+def verdict(d: Diagnostic) -> tuple:
+    # NOTE: positions of a paragraph continued on the next page change, what it was judged doesn't
+    return d.severity, d.expected, d.actual, d.previous
@@ -1,48 +1,148 @@
+from functools import lru_cache
+from typing import Iterable, Optional
+from xml.sax.saxutils import escape
+
 from PIL import Image, ImageDraw, ImageFont
 
 _drawing_board = None
 
+@lru_cache(maxsize=64)
+def get_font(size) -> ImageFont.ImageFont:
+    # NOTE: font pool, loading the default font is far more expensive than drawing with it
+    return ImageFont.load_default(size)
+
 class DrawingBoard:
-    def __init__(self, image: Image):
-        self.image = image
-        self.canvas = ImageDraw.Draw(image)
-        self.font = ImageFont.load_default(30)
+    """
+    Display list of annotations in page coordinates. Nothing is rasterized
+    until `render_overlay`, `render` or `to_svg` is called, so the page is
+    never copied and overlays can be redrawn at any size or with layers hidden.
+    """
+    def __init__(self, size: tuple[int, int]):
+        self.size = size
+        self.items = []
+        self.font_size = 30
+        self.layer = None
 
     def set_font_size(self, new_size):
-        self.font = ImageFont.load_default(new_size)
+        self.font_size = new_size
+
+    def set_layer(self, layer: Optional[str]):
+        self.layer = layer
+
+    @property
+    def layers(self) -> set:
+        return {item[0] for item in self.items}
 
     def add_verticle_line(self, left, top, height, color="green", line_width=2):
-        self.canvas.line([(left, top), (left, top + height)], fill=color, width=line_width)
+        self.items.append((self.layer, "line", (left, top, left, top + height), color, line_width))
 
     def add_horizontal_line(self, left, top, width, color="green", line_width=2):
-        self.canvas.line([(left, top), (left + width, top)], fill=color, width=line_width)
+        self.items.append((self.layer, "line", (left, top, left + width, top), color, line_width))
 
     def add_text(self, left, top, text, color="red"):
-        self.canvas.text((left, top), text, fill=color, font=self.font)
+        self.items.append((self.layer, "text", (left, top), color, self.font_size, text))
 
     def add_rounded_rectangle(self, left, top, width, height, outline_color="yellow", border_width=2, radius=5):
-        self.canvas.rounded_rectangle(
-            [(left, top), (left+width, top+height)], 
-            radius, 
-            fill=None, 
-            outline=outline_color, 
-            width=border_width
-        )
+        self.items.append((self.layer, "rounded_rectangle", (left, top, left + width, top + height), outline_color, border_width, radius))
 
     @property
     def width(self):
-        return self.image.width
+        return self.size[0]
 
     @property
     def height(self):
-        return self.image.height
+        return self.size[1]
+
+    @staticmethod
+    def _bounds(item) -> tuple:
+        kind, coords, _, weight = item[1:5]
+        if kind == "text":
+            # NOTE: generous estimate, only used to skip items far outside a tile
+            left, top = coords
+            return left, top, left + weight * len(item[5]), top + weight * 1.5
+        pad = weight / 2 + 1
+        return min(coords[0], coords[2]) - pad, min(coords[1], coords[3]) - pad, max(coords[0], coords[2]) + pad, max(coords[1], coords[3]) + pad
+
+    def _visible(self, layers: Optional[Iterable[str]], box: Optional[tuple] = None):
+        items = self.items
+        if layers is not None:
+            layers = set(layers)
+            items = [item for item in items if item[0] in layers]
+        if box is not None:
+            left, top, right, bottom = box
+            items = [item for item, b in ((item, self._bounds(item)) for item in items) if b[0] < right and b[2] > left and b[1] < bottom and b[3] > top]
+        return items
+
+    def render_overlay(self, size: Optional[tuple[int, int]] = None, layers: Optional[Iterable[str]] = None, box: Optional[tuple] = None, skip_bad_items=False) -> Image.Image:
+        """
+        Transparent RGBA image of the annotations, scaled to `size` (the page size by default).
+        With `box` (left, top, right, bottom in page coordinates) only that region is drawn.
+        With `skip_bad_items` an item pillow can't draw is left out instead of failing the whole image.
+        """
+        size = size or self.size
+        box = box or (0, 0, self.width, self.height)
+        sx = size[0] / (box[2] - box[0])
+        sy = size[1] / (box[3] - box[1])
+        overlay = Image.new("RGBA", size, (0, 0, 0, 0))
+        canvas = ImageDraw.Draw(overlay)
+        for item in self._visible(layers, box):
+            try:
+                self._draw_item(canvas, item, box[0], box[1], sx, sy)
+            except (ValueError, TypeError, OSError):
+                if not skip_bad_items:
+                    raise
+        return overlay
+
+    @staticmethod
+    def _draw_item(canvas: ImageDraw.ImageDraw, item: tuple, ox: float, oy: float, sx: float, sy: float):
+        kind, coords, color, weight = item[1:5]
+        scale = min(sx, sy)
+        if kind == "text":
+            left, top = coords
+            canvas.text((round((left - ox) * sx), round((top - oy) * sy)), item[5], fill=color, font=get_font(max(1, weight * scale)))
+            return
+        # NOTE: whole pixels, pillow rejects rounded rectangles whose float corners or radius don't fit after its own rounding
+        left, top, right, bottom = coords
+        x0, y0 = round((left - ox) * sx), round((top - oy) * sy)
+        x1, y1 = round((right - ox) * sx), round((bottom - oy) * sy)
+        width = max(1, round(weight * scale))
+        if kind == "line":
+            canvas.line([(x0, y0), (x1, y1)], fill=color, width=width)
+        else:
+            x0, x1 = sorted((x0, x1))
+            y0, y1 = sorted((y0, y1))
+            radius = max(0, min(round(item[5] * scale), (x1 - x0) // 2, (y1 - y0) // 2))
+            canvas.rounded_rectangle([(x0, y0), (x1, y1)], radius, fill=None, outline=color, width=width)
+
+    def render(self, image: Image.Image, size: Optional[tuple[int, int]] = None, layers: Optional[Iterable[str]] = None) -> Image.Image:
+        """
+        `image` scaled to `size` with the overlay composited on top.
+        """
+        size = size or self.size
+        if image.size != size:
+            image = image.resize(size, Image.LANCZOS)
+        return Image.alpha_composite(image.convert("RGBA"), self.render_overlay(size, layers)).convert("RGB")
+
+    def to_svg(self, layers: Optional[Iterable[str]] = None) -> str:
+        out = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{self.width}" height="{self.height}" viewBox="0 0 {self.width} {self.height}">']
+        for item in self._visible(layers):
+            kind, coords, color, weight = item[1:5]
+            if kind == "text":
+                left, top = coords
+                out.append(f'<text x="{left}" y="{top}" fill="{color}" font-size="{weight}" font-family="sans-serif" dominant-baseline="hanging">{escape(item[5])}</text>')
+            elif kind == "line":
+                x1, y1, x2, y2 = coords
+                out.append(f'<line x1="{x1}" y1="{y1}" x2="{x2}" y2="{y2}" stroke="{color}" stroke-width="{weight}"/>')
+            else:
+                left, top, right, bottom = coords
+                out.append(f'<rect x="{left}" y="{top}" width="{right - left}" height="{bottom - top}" rx="{item[5]}" fill="none" stroke="{color}" stroke-width="{weight}"/>')
+        out.append("</svg>")
+        return "\n".join(out)
 
 def get_current_drawing_board() -> DrawingBoard:
     assert _drawing_board is not None
-    return _drawing_board  
+    return _drawing_board
 
 def set_current_drawing_board(db: DrawingBoard):
     global _drawing_board
     _drawing_board = db
-
-
@@ -0,0 +1,188 @@
+"""
+JSONL export of checked pages and documents, and reading it back without
+OCR. Every tree is a run of records, one JSON object per line:
+
+    {"type": "tree", "version": 1, "source": "scan.png", "pages": 1}
+    {"type": "page", "page": 1, "size": [w, h]}               one per page
+    {"type": "node", "id": 0, "parent": null, "page": 1,     one per paragraph,
+     "label": {"numeral": "1"}, "indent": 150,               parents first
+     "box": [l, t, w, h], "lines": [{"page": 1, "box": [...],
+     "words": [[text, conf, l, t, w, h], ...]}, ...]}
+    {"type": "diagnostic", "page": 1, "node": 0, ...}       `Diagnostic.as_dict()`,
+                                                            node is null for spelling
+
+Records are generated one at a time, so a batch can stream them to disk as
+its pages finish.
+"""
+import itertools
+import json
+from typing import Callable, Iterable, Iterator, Optional, TextIO
+
+from components import Line, Paragraph, Series, TesseractArticle
+from diagnostics import Diagnostic
+from ocr_backends import TSV_COLUMNS
+
+EXPORT_VERSION = 1
+
+def _box(meta) -> list[int]:
+    return [meta.left, meta.top, meta.width, meta.height]
+
+def tree_records(
+        series: Series,
+        diagnostics: dict[int, list[Diagnostic]],
+        page_sizes: dict[int, tuple[int, int]],
+        source: Optional[str] = None,
+        page_of: Callable[[Line], int] = lambda line: 1,
+    ) -> Iterator[dict]:
+    """
+    Records of one tree. `diagnostics` and `page_sizes` are by page number
+    (from 1), `page_of` tells which page a line is on.
+    """
+    yield {"type": "tree", "version": EXPORT_VERSION, "source": source, "pages": len(page_sizes)}
+    for page, size in sorted(page_sizes.items()):
+        yield {"type": "page", "page": page, "size": list(size)}
+
+    # NOTE: indent diagnostics are matched to their paragraph by page and position
+    nodes = {}
+    ids = itertools.count()
+    stack = [(m, None) for m in reversed(series.members)]
+    while stack:
+        node, parent = stack.pop()
+        par = node.par
+        node_id = next(ids)
+        page = page_of(par.lines[0]) if par.lines else None
+        nodes[(page, tuple(_box(par.meta)))] = node_id
+        yield {
+            "type": "node",
+            "id": node_id,
+            "parent": parent,
+            "page": page,
+            "label": dict(par.matches) if par.lines else {},
+            "indent": par.indent,
+            "box": _box(par.meta),
+            "lines": [
+                {
+                    "page": page_of(line),
+                    "box": _box(line.meta),
+                    "words": [[w.text, w.conf, *_box(w.meta)] for w in line.line.words],
+                }
+                for line in par.lines
+            ],
+        }
+        stack.extend((m, node_id) for m in reversed(node.members))
+
+    for page, found in sorted(diagnostics.items()):
+        for d in found:
+            node = nodes.get((page, d.position)) if d.kind == "indent" else None
+            yield {"type": "diagnostic", "page": page, "node": node, **d.as_dict()}
+
+def page_records(series: Series, article: TesseractArticle, diagnostics: list[Diagnostic], source: Optional[str] = None) -> Iterator[dict]:
+    """
+    Records of one page checked by `Pipeline.run`.
+    """
+    page_sizes = {1: (p.meta.width, p.meta.height) for p in article.pages[:1]}
+    return tree_records(series, {1: diagnostics}, page_sizes or {1: (0, 0)}, source)
+
+def document_records(document, source: Optional[str] = None) -> Iterator[dict]:
+    """
+    Records of a `document.Document` whose pages have all been checked.
+    """
+    return tree_records(
+        document.series,
+        {index + 1: found for index, found in document.diagnostics.items()},
+        document.page_sizes,
+        source,
+        page_of=lambda line: document.page_of(line) + 1,
+    )
+
+def write_jsonl(records: Iterable[dict], file: TextIO):
+    for record in records:
+        file.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+        file.write("\n")
+
+class ExportedTree:
+    """
+    A tree read back from an export: the series tree, an article with the
+    words of its pages and the diagnostics, without OCR.
+    """
+    __slots__ = ("source", "page_sizes", "series", "article", "diagnostics")
+
+    def __init__(self, source: Optional[str], page_sizes: dict[int, tuple[int, int]], series: Series, article: TesseractArticle, diagnostics: list[Diagnostic]):
+        self.source = source
+        self.page_sizes = page_sizes
+        self.series = series
+        self.article = article
+        self.diagnostics = diagnostics
+
+def build_tree(nodes: list[dict], page_sizes: dict[int, tuple[int, int]]) -> tuple[Series, TesseractArticle]:
+    """
+    The series tree and article of exported node records, in `image_to_data`
+    form again so lines and labels are made the way OCR output makes them.
+    """
+    data = {k: [] for k in TSV_COLUMNS}
+
+    def add_row(*values):
+        for k, v in zip(TSV_COLUMNS, values):
+            data[k].append(v)
+
+    for page, (width, height) in sorted(page_sizes.items()):
+        add_row(1, page, 0, 0, 0, 0, 0, 0, width, height, -1, "")
+        add_row(2, page, 1, 0, 0, 0, 0, 0, width, height, -1, "")
+    # NOTE: a paragraph continued on the next page is one tesseract paragraph per page
+    par_num = 0
+    for node in nodes:
+        page = None
+        for line in node["lines"]:
+            if line["page"] != page:
+                page = line["page"]
+                par_num += 1
+                line_num = 0
+                add_row(3, page, 1, par_num, 0, 0, *node["box"], -1, "")
+            line_num += 1
+            add_row(4, page, 1, par_num, line_num, 0, *line["box"], -1, "")
+            for word_num, (text, conf, *box) in enumerate(line["words"], 1):
+                add_row(5, page, 1, par_num, line_num, word_num, *box, conf, text)
+    article = TesseractArticle(data)
+
+    lines = iter([Line(l) for l in article.lines])
+    root = Series(Paragraph([]))
+    found = {}
+    for node in nodes:
+        series = Series(Paragraph([next(lines) for _ in node["lines"]]))
+        found[node["id"]] = series
+        (root if node["parent"] is None else found[node["parent"]]).members.append(series)
+    return root, article
+
+def read_jsonl(file: TextIO) -> Iterator[dict]:
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
+
+def read_trees(records: Iterable[dict]) -> Iterator[ExportedTree]:
+    """
+    Every tree in `records` (e.g. `read_jsonl(file)`), one at a time.
+    """
+    tree = None
+
+    def finish():
+        series, article = build_tree(tree["nodes"], tree["pages"])
+        return ExportedTree(tree["source"], tree["pages"], series, article, tree["diagnostics"])
+
+    for record in records:
+        kind = record["type"]
+        if kind == "tree":
+            if record.get("version") != EXPORT_VERSION:
+                raise ValueError(f"unsupported export version {record.get('version')}")
+            if tree is not None:
+                yield finish()
+            tree = {"source": record.get("source"), "pages": {}, "nodes": [], "diagnostics": []}
+        elif tree is None:
+            raise ValueError(f"{kind} record before the first tree record")
+        elif kind == "page":
+            tree["pages"][record["page"]] = tuple(record["size"])
+        elif kind == "node":
+            tree["nodes"].append(record)
+        elif kind == "diagnostic":
+            tree["diagnostics"].append(Diagnostic.from_dict(record))
+    if tree is not None:
+        yield finish()
@@ -1,26 +1,131 @@
+import argparse
+import os
+import sys
+
 from PIL import Image
-from components import process
-from util import upscale_to_300_dpi
+from batch import run_batch
+from components import Pipeline
+from diagnostics import ERROR, print_diagnostics
+from document import Document, count_frames
+from export import document_records, page_records, write_jsonl
+from ocr_backends import get_ocr_backend
+from ocr_cache import get_ocr_cache
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the series numbering and indentation of scanned documents.")
+    parser.add_argument("inputs", nargs="+", help="image files, directories or globs")
+    parser.add_argument("--out", "-o", help="batch mode: write each page's text and diagnostics here")
+    parser.add_argument("--workers", "-j", type=int, default=None, help="batch mode: worker processes (default: all cores)")
+    parser.add_argument("--spell-check", action="store_true", help="also check spelling")
+    parser.add_argument("--no-indent-check", action="store_true", help="skip the indent check, which runs by default in every mode")
+    parser.add_argument("--indent-only", action="store_true", help="only OCR the start of every line, much faster but no spell check or full text")
+    parser.add_argument("--images", action="store_true", help="batch mode: also save annotated pages")
+    parser.add_argument("--document", action="store_true", help="check the inputs as the pages of one document, in order (multi-page TIFFs always are)")
+    parser.add_argument("--ocr-backend", default=None, help="pytesseract, tesserocr, replay:<dir> or record:<dir>")
+    parser.add_argument("--export", default=None, help="write the tree, geometry, labels and diagnostics as JSONL to this file")
+    parser.add_argument("--profile", action="store_true", help="print how long every pipeline stage took")
+    parser.add_argument("--refine", action="store_true", help="read low-confidence words again at a higher resolution (slower, off by default)")
+    # NOTE: --no-cache runs Tesseract even if the page is in the OCR cache
+    parser.add_argument("--no-cache", action="store_true", help="don't read or write the OCR cache")
+    args = parser.parse_args()
+    if args.indent_only and args.spell_check:
+        parser.error("--spell-check needs the full text, it can't be combined with --indent-only")
+
+    single = len(args.inputs) == 1 and is_single_page_spec(args.inputs[0])
+    if args.document or (single and args.out is None and is_multi_page(args.inputs[0])):
+        check_document(args)
+        return
+
+    if args.out is not None or not single:
+        if args.out is None:
+            parser.error("--out is required when processing several inputs, a directory or a glob")
+        try:
+            summary = run_batch(
+                args.inputs,
+                args.out,
+                workers=args.workers,
+                indent_check=not args.no_indent_check,
+                spell_check=args.spell_check,
+                ocr_cache=not args.no_cache,
+                ocr_backend=args.ocr_backend,
+                images=args.images,
+                indent_only=args.indent_only,
+                refine=True if args.refine else None,
+                export=args.export,
+            )
+        except ValueError as e:
+            parser.error(str(e))
+        print(f"{summary['pages']} pages ({len(summary['failed'])} failed) in {summary['seconds']:.1f} s "
+              f"with {summary['workers']} workers: {summary['pages_per_second']} pages/s, "
+              f"{summary['words_per_second']} words/s, {summary['indent_errors']} indent errors")
+        if args.profile:
+            for name, seconds in summary["stages"].items():
+                print(f"{name:<14}{seconds:10.2f} s")
+        return
 
-if __name__ == "__main__":
-    import sys
-    if len(sys.argv) != 2:
-        print("Usage: python script.py <image_path>")
-        sys.exit(1)
-    
     # Get image path from command-line argument
-    image_path = sys.argv[1]
+    image_path = args.inputs[0]
     try:
         # Load the image
         image = Image.open(image_path)
     except FileNotFoundError:
         print(f"Image file not found: {image_path}")
         exit()
-    
+
     # Detect lines
-    # image = upscale_to_300_dpi(image)
-    image, s, article = process(image)
+    pipeline = Pipeline(
+        image,
+        ocr_cache=None if args.no_cache else get_ocr_cache(),
+        ocr_backend=get_ocr_backend(args.ocr_backend),
+        refine=True if args.refine else None,
+    )
+    board, s, article, diagnostics = pipeline.run(indent_check=not args.no_indent_check, spell_check=args.spell_check, indent_only=args.indent_only)
     print(article.as_str())
-    print(s.as_str())
+    s.write(sys.stdout)
+    print()
     print(s)
-    image.show()
\ No newline at end of file
+    if args.profile:
+        print(pipeline.stats)
+    if args.export is not None:
+        with open(args.export, "w", encoding="utf-8") as f:
+            write_jsonl(page_records(s, article, diagnostics, source=image_path), f)
+    board.render(image).show()
+
+def is_single_page_spec(spec: str) -> bool:
+    # NOTE: a directory or a glob is a batch even if it finds one page
+    return not os.path.isdir(spec) and (os.path.exists(spec) or not any(c in spec for c in "*?["))
+
+def is_multi_page(path: str) -> bool:
+    # NOTE: anything that isn't a readable image file is left to the messages further down
+    if not os.path.isfile(path):
+        return False
+    try:
+        return count_frames(path) > 1
+    except OSError:
+        return False
+
+def check_document(args):
+    document = Document(
+        args.inputs,
+        ocr_cache=None if args.no_cache else get_ocr_cache(),
+        ocr_backend=get_ocr_backend(args.ocr_backend),
+        refine=True if args.refine else None,
+    )
+    # NOTE: pages are reported as they are checked, numbering carries over page breaks
+    for page in document.pages(indent_check=not args.no_indent_check, spell_check=args.spell_check, indent_only=args.indent_only):
+        errors = sum(d.severity == ERROR for d in page.diagnostics)
+        print(f"page {page.index + 1}: {errors} errors ({page.seconds:.1f} s)")
+        print_diagnostics(d for d in page.diagnostics if d.severity == ERROR or d.kind == "spelling")
+        for index, d in page.revised:
+            print(f"page {index + 1} (revised): ", end="")
+            print_diagnostics([d])
+        if args.profile:
+            print(page.stats)
+    document.series.write(sys.stdout)
+    print()
+    if args.export is not None:
+        with open(args.export, "w", encoding="utf-8") as f:
+            write_jsonl(document_records(document, source=" ".join(args.inputs)), f)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+from functools import lru_cache
+import re
+from typing import Optional
+
+from util import to_roman
+
+# NOTE: one scan finds the label, its family is then decided from the characters alone
+LABEL_PATTERN = re.compile(r"\((\d+|[a-z]+|[A-Z]+)\)")
+
+ROMAN_VALUES = {"i": 1, "v": 5, "x": 10, "l": 50, "c": 100, "d": 500, "m": 1000}
+
+def from_roman(s: str) -> Optional[int]:
+    """
+    Value of a canonical roman numeral ("xiv", "CXX"), None for anything else ("iiv").
+    """
+    total = 0
+    prev = 0
+    for ch in reversed(s.lower()):
+        v = ROMAN_VALUES.get(ch)
+        if v is None:
+            return None
+        if v < prev:
+            total -= v
+        else:
+            total += v
+            prev = v
+    if total <= 0 or to_roman(total, lower=s.islower()) != s:
+        return None
+    return total
+
+class LabelFamily:
+    """
+    A numbering style such as (1), (a) or (iv). Ranks are 0-based and computed
+    arithmetically, so numbering is unbounded.
+    """
+    name: str
+
+    def rank(self, value: str) -> Optional[int]:
+        raise NotImplementedError
+
+    def value(self, rank: int) -> str:
+        raise NotImplementedError
+
+    @property
+    def first(self) -> str:
+        return self.value(0)
+
+    def successor(self, value: str) -> str:
+        return self.value(self.rank(value) + 1)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.name})"
+
+class Numerals(LabelFamily):
+    name = "numeral"
+
+    def rank(self, value):
+        if not value.isascii() or not value.isdigit():
+            return None
+        n = int(value)
+        return n - 1 if n > 0 else None
+
+    def value(self, rank):
+        return str(rank + 1)
+
+class RomanNumerals(LabelFamily):
+    def __init__(self, lower: bool):
+        self.lower = lower
+        self.name = "roman_lower" if lower else "roman_upper"
+
+    def rank(self, value):
+        if value.islower() != self.lower:
+            return None
+        n = from_roman(value)
+        return None if n is None else n - 1
+
+    def value(self, rank):
+        return to_roman(rank + 1, lower=self.lower)
+
+class Letters(LabelFamily):
+    """
+    (a) ... (z), then (aa), (bb), ... (zz), (aaa), ...
+    """
+    def __init__(self, lower: bool):
+        self.lower = lower
+        self.name = "alpha_lower" if lower else "alpha_upper"
+        self.base = ord("a") if lower else ord("A")
+
+    def rank(self, value):
+        if not value.isascii() or not value.isalpha() or value.islower() != self.lower:
+            return None
+        if value != value[0] * len(value):
+            return None
+        return (len(value) - 1) * 26 + ord(value[0]) - self.base
+
+    def value(self, rank):
+        return chr(self.base + rank % 26) * (rank // 26 + 1)
+
+# NOTE: order matters, it is the order values are reported and expected in
+LABEL_FAMILIES = {
+    f.name: f for f in [
+        Numerals(),
+        RomanNumerals(lower=True),
+        RomanNumerals(lower=False),
+        Letters(lower=True),
+        Letters(lower=False),
+    ]
+}
+
+_FAMILIES_BY_CLASS = {
+    "digit": [LABEL_FAMILIES["numeral"]],
+    "lower": [LABEL_FAMILIES["roman_lower"], LABEL_FAMILIES["alpha_lower"]],
+    "upper": [LABEL_FAMILIES["roman_upper"], LABEL_FAMILIES["alpha_upper"]],
+}
+
+@lru_cache(maxsize=4096)
+def classify(value: str) -> tuple[str, ...]:
+    if value[0].isdigit():
+        families = _FAMILIES_BY_CLASS["digit"]
+    elif value[0].islower():
+        families = _FAMILIES_BY_CLASS["lower"]
+    else:
+        families = _FAMILIES_BY_CLASS["upper"]
+    return tuple(f.name for f in families if f.rank(value) is not None)
+
+def match_label(text: str) -> dict[str, str]:
+    """
+    Families of the series label `text` starts with, mapped to the label value.
+    "(i)" is both a roman numeral and a letter, so it maps to two families.
+    """
+    m = LABEL_PATTERN.match(text)
+    if m is None:
+        return {}
+    value = m.group(1)
+    return {name: value for name in classify(value)}
+
+def initial_values() -> list[str]:
+    return [f.first for f in LABEL_FAMILIES.values()]
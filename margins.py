@@ -0,0 +1,109 @@
+"""
+Indent-only OCR: the indent check only needs where every line starts and
+the label it starts with. Lines are found from the projection profiles of
+the binarized page and only the start of each one is OCR'd, all of them
+stacked into one narrow strip so tesseract runs once per page on a small
+fraction of its pixels.
+"""
+import numpy as np
+from PIL import Image
+
+from ocr_backends import OCRBackend, TSV_COLUMNS
+from projection import find_lines, ink_mask
+
+# NOTE: wide enough for "(xviii)" and the start of the first word after it, in multiples of the line height
+LABEL_CROP_WIDTH = 6
+# NOTE: tesseract treats the strip as one block of text lines
+STRIP_CONFIG = "--psm 6"
+# NOTE: stands in for the part of a line that was never read
+ELIDED_TEXT = "…"
+
+def label_strip(image: Image.Image, lines: list[tuple[int, int, int, int]], pad: int) -> tuple[Image.Image, list[tuple[int, int]]]:
+    """
+    The start of every line pasted under each other, `pad` pixels apart and
+    from the edges. Returns the strip and where each crop went in it: (top,
+    bottom) per line.
+    """
+    gray = image.convert("L")
+    crops = []
+    for left, top, right, bottom in lines:
+        width = min(LABEL_CROP_WIDTH * (bottom - top), right - left)
+        crops.append(gray.crop((left, top, left + width, bottom)))
+    strip = Image.new("L", (max(c.width for c in crops) + 2 * pad, sum(c.height + pad for c in crops) + pad), 255)
+    slots = []
+    y = pad
+    for crop in crops:
+        strip.paste(crop, (pad, y))
+        slots.append((y, y + crop.height))
+        y += crop.height + pad
+    return strip, slots
+
+def margin_to_data(image: Image.Image, backend, lang="eng") -> dict:
+    """
+    `image_to_data` output with every line on the page but only the words at
+    its start, followed by one ELIDED_TEXT word covering the rest of it.
+    """
+    data = {k: [] for k in TSV_COLUMNS}
+
+    def add_row(*values):
+        for k, v in zip(TSV_COLUMNS, values):
+            data[k].append(v)
+
+    add_row(1, 1, 0, 0, 0, 0, 0, 0, image.width, image.height, -1, "")
+    lines = find_lines(ink_mask(image))
+    if not lines:
+        return data
+    # NOTE: a line height of white around every crop, so tesseract sees separate lines
+    pad = int(np.median([bottom - top for _, top, _, bottom in lines]))
+    strip, slots = label_strip(image, lines, pad)
+    ocr = backend.image_to_data(strip, lang=lang, config=STRIP_CONFIG)
+
+    # NOTE: a word belongs to the crop its vertical center falls in, words found between crops are noise
+    centers = np.array([(top + bottom) / 2 for top, bottom in slots])
+    words = [[] for _ in lines]
+    for i, level in enumerate(ocr["level"]):
+        if level != 5 or not str(ocr["text"][i]).strip():
+            continue
+        center = ocr["top"][i] + ocr["height"][i] / 2
+        k = int(np.argmin(np.abs(centers - center)))
+        if not slots[k][0] - pad / 2 <= center < slots[k][1] + pad / 2:
+            continue
+        words[k].append(i)
+
+    add_row(2, 1, 1, 0, 0, 0, 0, 0, image.width, image.height, -1, "")
+    add_row(3, 1, 1, 1, 0, 0, 0, 0, image.width, image.height, -1, "")
+    for line_num, ((left, top, right, bottom), found, (slot_top, _)) in enumerate(zip(lines, words, slots), 1):
+        add_row(4, 1, 1, 1, line_num, 0, left, top, right - left, bottom - top, -1, "")
+        word_num = 0
+        end = left
+        for i in sorted(found, key=lambda i: ocr["left"][i]):
+            word_num += 1
+            word_left = left + ocr["left"][i] - pad
+            word_top = top + ocr["top"][i] - slot_top
+            add_row(5, 1, 1, 1, line_num, word_num, word_left, word_top, ocr["width"][i], ocr["height"][i], ocr["conf"][i], ocr["text"][i])
+            end = word_left + ocr["width"][i]
+        # NOTE: the crop may cut the last word read in half, the elided rest starts after it either way
+        if end < right:
+            add_row(5, 1, 1, 1, line_num, word_num + 1, end, top, right - end, bottom - top, -1, ELIDED_TEXT)
+    return data
+
+class MarginBackend(OCRBackend):
+    """
+    `margin_to_data` as an OCR backend, reading the strip with `inner`. Its
+    name and version keep margin-only results apart from full pages in the
+    OCR cache.
+    """
+    def __init__(self, inner: OCRBackend):
+        self.inner = inner
+        self.name = f"margins-{inner.name}"
+        self.cacheable = inner.cacheable
+        self.normalizable = inner.normalizable
+
+    def version(self):
+        return f"{self.inner.version()}/{LABEL_CROP_WIDTH}"
+
+    def image_to_data(self, image, lang="eng", config=""):
+        return margin_to_data(image, self.inner, lang=lang)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.inner!r})"
@@ -0,0 +1,417 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+from pathlib import Path
+import shlex
+import threading
+from typing import Optional, Union
+
+import numpy as np
+from PIL import Image
+import pytesseract
+
+from dictionary import write_atomic
+from ocr_cache import decode, image_digest
+from projection import gutter_cut, line_height, row_profile
+
+TSV_COLUMNS = [
+    "level", "page_num", "block_num", "par_num", "line_num", "word_num",
+    "left", "top", "width", "height", "conf", "text",
+]
+# NOTE: pages shorter than two bands are not worth splitting
+MIN_BAND_HEIGHT = 1200
+MIN_BAND_OVERLAP = 32
+
+_band_pool = None
+_band_threads = 0
+_band_pool_lock = threading.Lock()
+
+def band_pool(threads: int) -> ThreadPoolExecutor:
+    """
+    One pool for every `TiledBackend` in the process (a backend is made per
+    page), with at least `threads` threads.
+    """
+    global _band_pool, _band_threads
+    with _band_pool_lock:
+        if _band_threads < threads:
+            # NOTE: the smaller pool finishes what it was given, its threads exit once it is collected
+            _band_pool = ThreadPoolExecutor(threads, thread_name_prefix="birdnest-band")
+            _band_threads = threads
+        return _band_pool
+
+def _to_int(v: str):
+    try:
+        return int(float(v))
+    except ValueError:
+        return v
+
+def parse_tsv(tsv: str) -> dict:
+    """
+    Tesseract TSV output as the dict `pytesseract.image_to_data(..., output_type='dict')` returns.
+    """
+    rows = [row.split("\t") for row in tsv.strip("\n").split("\n")]
+    if len(rows) < 2:
+        return {k: [] for k in TSV_COLUMNS}
+    header = rows.pop(0)
+    # NOTE: the text cell of the last row is dropped when it is empty
+    rows[-1] += [""] * (len(header) - len(rows[-1]))
+    data = {}
+    for k, column in zip(header, zip(*rows)):
+        if k == "text":
+            data[k] = list(column)
+            continue
+        try:
+            data[k] = list(map(int, column))
+        except ValueError:
+            # NOTE: confidences are written as floats
+            data[k] = list(map(_to_int, column))
+    return data
+
+def to_tsv(data: dict) -> str:
+    columns = list(data)
+    rows = ["\t".join(columns)]
+    for i in range(len(data["text"])):
+        rows.append("\t".join(str(data[k][i]) for k in columns))
+    return "\n".join(rows) + "\n"
+
+class OCRBackend:
+    """
+    Something that turns a page image into `image_to_data` output. `name` and
+    `version()` are part of the OCR cache key.
+    """
+    name: str
+    # NOTE: False for backends whose output is already stored, there is no point caching it again
+    cacheable = True
+    # NOTE: False for backends that need the page exactly as it was opened
+    normalizable = True
+
+    def version(self) -> str:
+        raise NotImplementedError
+
+    def image_to_data(self, image: Image.Image, lang="eng", config="") -> dict:
+        raise NotImplementedError
+
+    def __repr__(self):
+        return f"{type(self).__name__}()"
+
+class PytesseractBackend(OCRBackend):
+    """
+    Runs the tesseract binary once per page, through temporary files.
+    """
+    name = "pytesseract"
+
+    def __init__(self):
+        self._version = None
+
+    def version(self):
+        if self._version is None:
+            self._version = str(pytesseract.get_tesseract_version())
+        return self._version
+
+    def image_to_data(self, image, lang="eng", config=""):
+        return pytesseract.image_to_data(image, output_type='dict', lang=lang, config=config)
+
+class TesserocrBackend(OCRBackend):
+    """
+    Keeps a tesseract engine loaded in this process (one per thread and
+    language), so there is no subprocess, no temporary files and no model
+    loading per page. Needs the optional `tesserocr` package.
+    """
+    name = "tesserocr"
+
+    def __init__(self, tessdata: Optional[str] = None):
+        import tesserocr
+        self.tesserocr = tesserocr
+        self.tessdata = tessdata
+        self._local = threading.local()
+
+    def version(self):
+        return self.tesserocr.tesseract_version().split()[1]
+
+    def _engine(self, lang: str):
+        engines = self._local.__dict__.setdefault("engines", {})
+        if lang not in engines:
+            kwargs = {} if self.tessdata is None else {"path": self.tessdata}
+            engines[lang] = self.tesserocr.PyTessBaseAPI(lang=lang, **kwargs)
+        return engines[lang]
+
+    def _configure(self, api, config: str) -> dict[str, str]:
+        """
+        Applies `config` to the engine, returns the earlier values of the
+        variables it set. Engines are shared by every call on the thread and
+        `Clear()` keeps both, so the page segmentation mode is always set
+        (tesseract's default when `config` has none) and the variables are put
+        back after the call.
+        """
+        # NOTE: the subset of tesseract command line options that maps onto the API
+        args = shlex.split(config)
+        psm = self.tesserocr.PSM.AUTO
+        changed = {}
+        i = 0
+        try:
+            while i < len(args):
+                if args[i] == "--psm" and i + 1 < len(args):
+                    psm = int(args[i + 1])
+                elif args[i] == "-c" and i + 1 < len(args) and "=" in args[i + 1]:
+                    name, value = args[i + 1].split("=", 1)
+                    changed.setdefault(name, api.GetVariableAsString(name))
+                    api.SetVariable(name, value)
+                else:
+                    raise ValueError(f"Unsupported tesseract option {args[i]} for {self.name}")
+                i += 2
+            api.SetPageSegMode(psm)
+        except BaseException:
+            self._restore(api, changed)
+            raise
+        return changed
+
+    @staticmethod
+    def _restore(api, changed: dict[str, str]):
+        for name, value in changed.items():
+            if value is not None:
+                api.SetVariable(name, value)
+
+    def image_to_data(self, image, lang="eng", config=""):
+        api = self._engine(lang)
+        api.Clear()
+        changed = self._configure(api, config)
+        try:
+            api.SetImage(image)
+            api.Recognize()
+            return parse_tsv("\t".join(TSV_COLUMNS) + "\n" + api.GetTSVText(0))
+        finally:
+            self._restore(api, changed)
+
+class ReplayBackend(OCRBackend):
+    """
+    Reads OCR output saved earlier as `<name>.tsv` (tesseract's own format)
+    or `<name>.npz` (OCR cache format) from `directory`. A page opened by a
+    path is looked up under that path (`vol1/001.tif` as `vol1/001.tsv`),
+    relative to `directory` if it is in there, then any page by its pixel
+    digest, and last by the stem
+    of its file name, which is only replayed for the first page with that
+    stem: `vol2/001.tif` doesn't get the output of `vol1/001.tif`. Misses go
+    to `record_with`, if given, and are saved under the page's relative path
+    (its digest if it has none) for the next run.
+    """
+    name = "replay"
+    cacheable = False
+    # NOTE: output is looked up by file name and pixels, and saved in the coordinates of the page itself
+    normalizable = False
+
+    def __init__(self, directory: Union[str, Path], record_with: Optional[OCRBackend] = None):
+        self.directory = Path(directory)
+        self.record_with = record_with
+        self._root = self.directory.resolve()
+        # NOTE: stem -> digest of the page replayed by that stem alone
+        self._stems = {}
+
+    def version(self):
+        return str(self.directory)
+
+    def load(self, key: str) -> Optional[dict]:
+        tsv = self.directory / f"{key}.tsv"
+        if tsv.exists():
+            return parse_tsv(tsv.read_text(encoding="utf-8"))
+        npz = self.directory / f"{key}.npz"
+        if npz.exists():
+            with np.load(npz, allow_pickle=False) as arrays:
+                return decode(arrays)
+        return None
+
+    def save(self, key: str, data: dict):
+        path = self.directory / f"{key}.tsv"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        write_atomic(path, lambda f: f.write(to_tsv(data).encode("utf-8")))
+
+    def path_key(self, path: Path) -> Optional[str]:
+        resolved = path.resolve()
+        if resolved.is_relative_to(self._root):
+            return resolved.relative_to(self._root).with_suffix("").as_posix()
+        if path.is_absolute() or ".." in path.parts:
+            return None
+        return path.with_suffix("").as_posix()
+
+    def image_to_data(self, image, lang="eng", config=""):
+        filename = getattr(image, "filename", "")
+        path = Path(filename) if filename else None
+        # NOTE: the path is tried first, it doesn't need the pixels to be decoded
+        key = None if path is None else self.path_key(path)
+        data = None if key is None else self.load(key)
+        if data is None:
+            digest = image_digest(image)
+            data = self.load(digest)
+            if data is None and path is not None and self._stems.setdefault(path.stem, digest) == digest:
+                data = self.load(path.stem)
+            key = key or digest
+        if data is None:
+            if self.record_with is None:
+                raise FileNotFoundError(f"No saved OCR output for {filename or key} in {self.directory}")
+            data = self.record_with.image_to_data(image, lang=lang, config=config)
+            self.save(key, data)
+        return data
+
+class Band:
+    __slots__ = ("top", "bottom", "core_top", "core_bottom")
+
+    def __init__(self, top: int, bottom: int, core_top: int, core_bottom: int):
+        # NOTE: the band is OCR'd from top to bottom, but only lines centered in core_top..core_bottom are kept from it
+        self.top = top
+        self.bottom = bottom
+        self.core_top = core_top
+        self.core_bottom = core_bottom
+
+    def margin(self, center: float) -> float:
+        return min(center - self.top, self.bottom - center)
+
+    def __repr__(self):
+        return f"Band({self.top}, {self.bottom}, {self.core_top}, {self.core_bottom})"
+
+def plan_bands(image: Image.Image, bands: int, min_height=MIN_BAND_HEIGHT) -> list[Band]:
+    """
+    Splits the page into up to `bands` horizontal bands, cut at the tallest
+    whitespace gutter near each even split (from the row projection profile),
+    each overlapping its neighbours by about two text lines.
+    """
+    height = image.height
+    bands = max(min(bands, height // min_height), 1)
+    if bands == 1:
+        return [Band(0, height, 0, height)]
+    profile = row_profile(image)
+    # NOTE: a line that could not be cut around still fits into both bands whole
+    overlap = max(2 * line_height(profile), MIN_BAND_OVERLAP)
+    step = height / bands
+    cuts = [0]
+    for k in range(1, bands):
+        middle = int(k * step)
+        cuts.append(gutter_cut(profile, middle - int(step / 4), middle + int(step / 4)))
+    cuts.append(height)
+    return [
+        Band(max(cuts[k] - overlap, 0), min(cuts[k + 1] + overlap, height), cuts[k], cuts[k + 1])
+        for k in range(bands)
+    ]
+
+def merge_bands(results: list[dict], bands: list[Band], size: tuple[int, int]) -> dict:
+    """
+    Stitches the OCR output of every band back into one page. Lines are kept
+    by the band their center falls in, a line found in both bands next to a
+    cut is kept from the band where it is further from the edge, and blocks
+    are renumbered so each band's follow the previous band's.
+    """
+    # NOTE: (band, block, par, line) -> (left, top, width, height) in page coordinates
+    kept = {}
+    for b, (data, band) in enumerate(zip(results, bands)):
+        for i, level in enumerate(data["level"]):
+            if level != 4:
+                continue
+            top = data["top"][i] + band.top
+            center = top + data["height"][i] / 2
+            if band.core_top <= center < band.core_bottom:
+                key = (b, data["block_num"][i], data["par_num"][i], data["line_num"][i])
+                kept[key] = (data["left"][i], top, data["width"][i], data["height"][i])
+
+    def overlaps(a, b):
+        return (
+            min(a[0] + a[2], b[0] + b[2]) - max(a[0], b[0]) > min(a[2], b[2]) / 2
+            and min(a[1] + a[3], b[1] + b[3]) - max(a[1], b[1]) > min(a[3], b[3]) / 2
+        )
+
+    for b in range(len(bands) - 1):
+        above, below = bands[b], bands[b + 1]
+        cut = above.core_bottom
+        near_above = [k for k, box in kept.items() if k[0] == b and box[1] + box[3] > cut - (above.bottom - cut)]
+        near_below = [k for k, box in kept.items() if k[0] == b + 1 and box[1] < cut + (cut - below.top)]
+        for ka in near_above:
+            for kb in near_below:
+                if ka not in kept or kb not in kept or not overlaps(kept[ka], kept[kb]):
+                    continue
+                center_a = kept[ka][1] + kept[ka][3] / 2
+                center_b = kept[kb][1] + kept[kb][3] / 2
+                del kept[kb if above.margin(center_a) >= below.margin(center_b) else ka]
+
+    merged = {k: [] for k in TSV_COLUMNS}
+
+    def add_row(*values):
+        for k, v in zip(TSV_COLUMNS, values):
+            merged[k].append(v)
+
+    def union(boxes):
+        left = min(box[0] for box in boxes)
+        top = min(box[1] for box in boxes)
+        right = max(box[0] + box[2] for box in boxes)
+        bottom = max(box[1] + box[3] for box in boxes)
+        return left, top, right - left, bottom - top
+
+    add_row(1, 1, 0, 0, 0, 0, 0, 0, size[0], size[1], -1, "")
+    block_offset = 0
+    for b, (data, band) in enumerate(zip(results, bands)):
+        lines = {k[1:]: box for k, box in kept.items() if k[0] == b}
+        blocks = {}
+        pars = {}
+        for (block, par, line), box in lines.items():
+            blocks.setdefault(block, []).append(box)
+            pars.setdefault((block, par), []).append(box)
+        for block, boxes in blocks.items():
+            add_row(2, 1, block_offset + block, 0, 0, 0, *union(boxes), -1, "")
+        for (block, par), boxes in pars.items():
+            add_row(3, 1, block_offset + block, par, 0, 0, *union(boxes), -1, "")
+        for i, level in enumerate(data["level"]):
+            if level < 4 or (data["block_num"][i], data["par_num"][i], data["line_num"][i]) not in lines:
+                continue
+            add_row(
+                level, 1, block_offset + data["block_num"][i], data["par_num"][i], data["line_num"][i], data["word_num"][i],
+                data["left"][i], data["top"][i] + band.top, data["width"][i], data["height"][i],
+                data["conf"][i], data["text"][i],
+            )
+        block_offset += max(data["block_num"], default=0)
+    return merged
+
+class TiledBackend(OCRBackend):
+    """
+    OCRs tall pages as horizontal bands in parallel and merges the results,
+    so one large scan keeps every core busy instead of one. Pages shorter
+    than two bands go to `inner` whole. Bands are OCR'd on the threads of
+    `band_pool`, shared by every instance: the tesseract binary and
+    tesserocr's engines both run outside the GIL.
+    """
+    def __init__(self, inner: OCRBackend, bands: Optional[int] = None, min_height=MIN_BAND_HEIGHT):
+        self.inner = inner
+        self.name = f"tiled-{inner.name}"
+        self.cacheable = inner.cacheable
+        self.normalizable = inner.normalizable
+        self.bands = bands or os.cpu_count() or 1
+        self.min_height = min_height
+
+    def version(self):
+        return f"{self.inner.version()}/{self.bands}x{self.min_height}"
+
+    def image_to_data(self, image, lang="eng", config=""):
+        bands = plan_bands(image, self.bands, self.min_height)
+        if len(bands) == 1:
+            return self.inner.image_to_data(image, lang=lang, config=config)
+        crops = [image.crop((0, band.top, image.width, band.bottom)) for band in bands]
+        results = list(band_pool(self.bands).map(lambda crop: self.inner.image_to_data(crop, lang=lang, config=config), crops))
+        return merge_bands(results, bands, image.size)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.inner!r}, bands={self.bands})"
+
+def get_ocr_backend(spec: Optional[str] = None) -> OCRBackend:
+    """
+    "pytesseract" (default), "tesserocr", "replay:<dir>", "record:<dir>"
+    (replay, running pytesseract for pages that were never saved) or
+    "tiled:<backend>" (tall pages OCR'd as bands in parallel). Defaults to
+    BIRDNEST_OCR_BACKEND.
+    """
+    spec = spec or os.environ.get("BIRDNEST_OCR_BACKEND", "pytesseract")
+    name, _, arg = spec.partition(":")
+    if name == "pytesseract":
+        return PytesseractBackend()
+    if name == "tesserocr":
+        return TesserocrBackend(arg or None)
+    if name == "replay":
+        return ReplayBackend(arg)
+    if name == "record":
+        return ReplayBackend(arg, record_with=PytesseractBackend())
+    if name == "tiled":
+        return TiledBackend(get_ocr_backend(arg or "pytesseract"))
+    raise ValueError(f"Unknown OCR backend {spec}")
@@ -0,0 +1,220 @@
+import hashlib
+import io
+import os
+from pathlib import Path
+import threading
+import time
+from typing import Optional, Union
+
+import numpy as np
+from PIL import Image
+
+from dictionary import write_atomic
+from util import CACHE_DIR
+
+OCR_CACHE_DIR = CACHE_DIR / "ocr"
+OCR_CACHE_VERSION = 1
+OCR_CACHE_MAX_BYTES = int(os.environ.get("BIRDNEST_OCR_CACHE_MB", 512)) * 2**20
+# NOTE: the directory is scanned again after this many writes, to count what other processes wrote
+OCR_CACHE_RESCAN_PUTS = 256
+# NOTE: eviction goes down to this share of the limit, so the writes after it don't evict again right away
+OCR_CACHE_LOW_WATER = 0.9
+# NOTE: temporary files this old were left by a writer that died, a live one renames its file within seconds
+OCR_CACHE_STALE_TMP_SECONDS = 3600
+
+def image_digest(image: Image.Image) -> str:
+    # NOTE: hash of the decoded pixels, so the same scan saved as png or tiff hits the same entry
+    h = hashlib.blake2b(digest_size=20)
+    h.update(f"{image.mode}:{image.size[0]}x{image.size[1]}:".encode())
+    h.update(image.tobytes())
+    return h.hexdigest()
+
+def encode(data: dict) -> Optional[dict[str, np.ndarray]]:
+    """
+    `image_to_data` output as arrays: every numeric column in one int32 matrix,
+    the text as a utf-8 string table. None if a column isn't numeric.
+    """
+    names = [k for k in data if k != "text"]
+    try:
+        ints = np.array([data[k] for k in names], dtype=np.int32).reshape(len(names), len(data["text"]))
+    except (TypeError, ValueError):
+        return None
+    encoded = [t.encode("utf-8") for t in data["text"]]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(t) for t in encoded])
+    return {
+        "names": np.array(names),
+        "ints": ints,
+        "text": np.frombuffer(b"".join(encoded), dtype=np.uint8),
+        "offsets": offsets,
+    }
+
+def decode(arrays) -> dict:
+    names = arrays["names"].tolist()
+    ints = arrays["ints"]
+    blob = arrays["text"].tobytes()
+    offsets = arrays["offsets"].tolist()
+    data = {k: ints[i].tolist() for i, k in enumerate(names)}
+    data["text"] = [blob[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+    return data
+
+class OCRCache:
+    """
+    On-disk cache of OCR backend results, one file per page.
+    Entries are written to a temporary file and renamed into place, and reads
+    treat a missing or broken file as a miss, so any number of processes can
+    share the directory. A hit refreshes the entry's mtime, and the least
+    recently used entries are deleted once the directory outgrows `max_bytes`,
+    along with temporary files a killed writer left behind.
+    Its size is kept as a running estimate, so a write doesn't scan the
+    directory unless the estimate goes over.
+    """
+    def __init__(self, path: Union[str, Path] = OCR_CACHE_DIR, max_bytes=OCR_CACHE_MAX_BYTES):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # NOTE: estimated bytes in the directory, None until it is first scanned
+        self._size = None
+        self._puts = 0
+
+    def key(self, image: Image.Image, backend, lang="eng", config="") -> str:
+        engine = f"{backend.name} {backend.version()}"
+        h = hashlib.sha1(f"{OCR_CACHE_VERSION}\0{image_digest(image)}\0{lang}\0{engine}\0{config}".encode())
+        return h.hexdigest()
+
+    def derived_key(self, key: str, config: str) -> str:
+        """
+        Key of output computed from the entry under `key`, with `config`.
+        """
+        return hashlib.sha1(f"{OCR_CACHE_VERSION}\0{key}\0{config}".encode()).hexdigest()
+
+    def entry_path(self, key: str) -> Path:
+        return self.path / key[:2] / f"{key}.npz"
+
+    def get(self, key: str) -> Optional[dict]:
+        path = self.entry_path(key)
+        try:
+            with np.load(path, allow_pickle=False) as arrays:
+                data = decode(arrays)
+        except (OSError, ValueError, KeyError):
+            # NOTE: missing, evicted by another process meanwhile, or a truncated file
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            # NOTE: a read-only cache, or evicted since it was read, the result is still good
+            pass
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key: str, data: dict):
+        arrays = encode(data)
+        if arrays is None:
+            return
+        path = self.entry_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        buffer = io.BytesIO()
+        np.savez(buffer, **arrays)
+        write_atomic(path, lambda f: f.write(buffer.getbuffer()))
+        with self._lock:
+            if self._size is None or self._puts % OCR_CACHE_RESCAN_PUTS == 0:
+                self._size = self.size()
+            else:
+                self._size += buffer.getbuffer().nbytes
+            self._puts += 1
+            over = self._size > self.max_bytes
+        if over:
+            self.evict()
+
+    def entries(self, suffix=".npz") -> list[tuple[str, os.stat_result]]:
+        found = []
+        if not self.path.exists():
+            return found
+        for sub in os.scandir(self.path):
+            if not sub.is_dir():
+                continue
+            for entry in os.scandir(sub.path):
+                if not entry.name.endswith(suffix):
+                    continue
+                try:
+                    found.append((entry.path, entry.stat()))
+                except FileNotFoundError:
+                    pass
+        return found
+
+    def size(self) -> int:
+        # NOTE: temporary files take up the disk too
+        return sum(st.st_size for _, st in self.entries(suffix=(".npz", ".tmp")))
+
+    def sweep(self) -> int:
+        """
+        Deletes temporary files left by writers that died, returns the bytes
+        of those still being written.
+        """
+        kept = 0
+        stale = time.time() - OCR_CACHE_STALE_TMP_SECONDS
+        for path, st in self.entries(suffix=".tmp"):
+            if st.st_mtime >= stale:
+                kept += st.st_size
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        return kept
+
+    def evict(self):
+        writing = self.sweep()
+        entries = self.entries()
+        total = writing + sum(st.st_size for _, st in entries)
+        if total > self.max_bytes:
+            target = self.max_bytes * OCR_CACHE_LOW_WATER
+            for path, st in sorted(entries, key=lambda e: e[1].st_mtime):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    # NOTE: another process evicted it first
+                    pass
+                total -= st.st_size
+                if total <= target:
+                    break
+        with self._lock:
+            self._size = total
+
+    def clear(self):
+        for path, _ in self.entries():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self._size = 0
+
+    def image_to_data(self, image: Image.Image, backend, lang="eng", config="") -> dict:
+        """
+        `backend.image_to_data`, through the cache.
+        """
+        key = self.key(image, backend, lang, config)
+        data = self.get(key)
+        if data is None:
+            data = backend.image_to_data(image, lang=lang, config=config)
+            self.put(key, data)
+        return data
+
+_ocr_cache = None
+
+def get_ocr_cache() -> Optional[OCRCache]:
+    """
+    The shared cache, or None if it is disabled with BIRDNEST_OCR_CACHE=0.
+    """
+    global _ocr_cache
+    if os.environ.get("BIRDNEST_OCR_CACHE", "1") == "0":
+        return None
+    if _ocr_cache is None:
+        _ocr_cache = OCRCache()
+    return _ocr_cache
@@ -0,0 +1,90 @@
+"""
+Rescales pages so their text has the x-height tesseract reads best, from the
+text itself rather than the DPI metadata (often missing or wrong in scans),
+and binarizes them before OCR. Boxes are scaled back to the original page.
+"""
+import os
+
+import numpy as np
+from PIL import Image
+
+from ocr_backends import OCRBackend
+from projection import find_lines, otsu_threshold, x_height
+
+# NOTE: tesseract's accuracy drops below ~10px x-height and it only gets slower above ~30px
+TARGET_X_HEIGHT = 24
+# NOTE: pages this close to the target are left at their size, resampling costs more than it saves
+SCALE_TOLERANCE = 1.25
+MIN_SCALE = 0.25
+MAX_SCALE = 4.0
+# NOTE: pages are binarized after resizing, the gray levels keep the edges of the glyphs smooth
+UPSCALE_FILTER = Image.BICUBIC
+DOWNSCALE_FILTER = Image.BOX
+# NOTE: everything the normalized page depends on, part of its OCR cache key. Bump the revision when
+# normalize_page, or the line finding and x-height measuring it relies on, change how pages come out
+NORMALIZE_CONFIG = (f"normalize 1 {TARGET_X_HEIGHT} {SCALE_TOLERANCE} {MIN_SCALE} {MAX_SCALE} "
+                    f"{Image.Resampling(UPSCALE_FILTER).name} {Image.Resampling(DOWNSCALE_FILTER).name} otsu")
+
+def normalize_page(image: Image.Image) -> tuple[Image.Image, float]:
+    """
+    The page in black and white, scaled so that its text has TARGET_X_HEIGHT,
+    and the scale it was resized by. Pages without text keep their size.
+    """
+    gray = image.convert("L")
+    pixels = np.asarray(gray)
+    threshold = otsu_threshold(pixels)
+    mask = pixels < threshold
+    measured = x_height(mask, find_lines(mask))
+    scale = 1.0
+    if measured > 0:
+        scale = min(max(TARGET_X_HEIGHT / measured, MIN_SCALE), MAX_SCALE)
+        if 1 / SCALE_TOLERANCE <= scale <= SCALE_TOLERANCE:
+            scale = 1.0
+    if scale != 1.0:
+        size = (max(round(image.width * scale), 1), max(round(image.height * scale), 1))
+        gray = gray.resize(size, UPSCALE_FILTER if scale > 1 else DOWNSCALE_FILTER)
+        pixels = np.asarray(gray)
+    # NOTE: a bool times a uint8 scalar stays uint8, no int64 temporaries on pages of tens of megapixels
+    return Image.fromarray((pixels >= threshold) * np.uint8(255)), scale
+
+def scale_boxes(data: dict, scale: float) -> dict:
+    """
+    `image_to_data` output of a page resized by `scale`, in the coordinates of the original page.
+    """
+    if scale == 1.0:
+        return data
+    data = dict(data)
+    left = np.asarray(data["left"], dtype=np.float64)
+    top = np.asarray(data["top"], dtype=np.float64)
+    right = np.rint((left + np.asarray(data["width"])) / scale).astype(int)
+    bottom = np.rint((top + np.asarray(data["height"])) / scale).astype(int)
+    left = np.rint(left / scale).astype(int)
+    top = np.rint(top / scale).astype(int)
+    data["left"] = left.tolist()
+    data["top"] = top.tolist()
+    data["width"] = (right - left).tolist()
+    data["height"] = (bottom - top).tolist()
+    return data
+
+def normalize_enabled() -> bool:
+    return os.environ.get("BIRDNEST_NORMALIZE", "1") != "0"
+
+class NormalizedBackend(OCRBackend):
+    """
+    Runs `inner` on `normalize_page(image)` and maps its boxes back.
+    """
+    def __init__(self, inner: OCRBackend):
+        self.inner = inner
+        self.name = f"normalized-{inner.name}"
+        self.cacheable = inner.cacheable
+        self.normalizable = False
+
+    def version(self):
+        return f"{self.inner.version()}/{NORMALIZE_CONFIG}"
+
+    def image_to_data(self, image, lang="eng", config=""):
+        page, scale = normalize_page(image)
+        return scale_boxes(self.inner.image_to_data(page, lang=lang, config=config), scale)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.inner!r})"
@@ -0,0 +1,195 @@
+"""
+Where a page's time goes. Every `Pipeline` stage that runs is timed into the
+pipeline's `PipelineStats`, with how far it raised the process's peak
+resident memory (and its peak traced memory if tracemalloc is tracing), and
+reported to the hooks added with `add_stage_hook`. Both are process-wide, so
+memory is only recorded for a stage that no other stage ran alongside: not
+for stages that overlap on several threads (a document's lookahead OCR) or
+for one that other stages ran inside.
+
+With BIRDNEST_PROFILE=cprofile or tracemalloc, runs that take longer than
+BIRDNEST_PROFILE_SLOW seconds (default 5) also leave a cProfile dump
+(`.prof`, for `python -m pstats` or snakeviz) or a tracemalloc snapshot
+(`.snapshot`, `tracemalloc.Snapshot.load`) in BIRDNEST_PROFILE_DIR
+(default `<cache dir>/profiles`).
+"""
+import cProfile
+from contextlib import contextmanager
+import os
+from pathlib import Path
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Callable, Optional
+
+from util import CACHE_DIR
+
+try:
+    import resource
+except ImportError:
+    # NOTE: not on Windows, stages are timed without their resident memory there
+    resource = None
+
+PROFILE_DIR = Path(os.environ.get("BIRDNEST_PROFILE_DIR", CACHE_DIR / "profiles"))
+
+# NOTE: hook(stage, seconds, peak bytes or None), called after every stage that ran
+_stage_hooks = []
+
+def add_stage_hook(hook: Callable[[str, float, Optional[int]], None]):
+    _stage_hooks.append(hook)
+
+def remove_stage_hook(hook: Callable[[str, float, Optional[int]], None]):
+    _stage_hooks.remove(hook)
+
+class StageStats:
+    __slots__ = ("seconds", "calls", "peak", "rss")
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.calls = 0
+        # NOTE: most memory allocated while the stage ran, None unless tracemalloc was tracing
+        self.peak = None
+        # NOTE: most the stage raised the process's peak resident memory by, None if it never ran alone
+        self.rss = None
+
+    def as_dict(self) -> dict:
+        return {"seconds": round(self.seconds, 4), "calls": self.calls, "peak": self.peak, "rss": self.rss}
+
+def max_rss() -> Optional[int]:
+    """
+    Peak resident memory of the process so far, in bytes.
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+# NOTE: stages being measured right now in the process, and how many have started
+_measure_lock = threading.Lock()
+_measuring = 0
+_measured = 0
+
+class PipelineStats:
+    """
+    Wall time, number of runs and peak memory of every stage that ran, in
+    run order. Stages answered from the memo don't appear.
+    """
+    def __init__(self):
+        self.stages = {}
+
+    def measure(self, name: str, compute):
+        global _measuring, _measured
+        with _measure_lock:
+            alone = _measuring == 0
+            _measuring += 1
+            _measured += 1
+            ticket = _measured
+            tracing = alone and tracemalloc.is_tracing()
+            # NOTE: the peak is reset only when no other stage is using it
+            if tracing:
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+        rss_before = max_rss()
+        start = time.perf_counter()
+        try:
+            value = compute()
+        finally:
+            seconds = time.perf_counter() - start
+            rss_after = max_rss()
+            with _measure_lock:
+                _measuring -= 1
+                # NOTE: a stage that started meanwhile, on another thread or inside this one, shared the process with it
+                alone = alone and _measured == ticket
+                peak = tracemalloc.get_traced_memory()[1] - before if alone and tracing and tracemalloc.is_tracing() else None
+        rss = rss_after - rss_before if alone and rss_before is not None else None
+
+        stats = self.stages.setdefault(name, StageStats())
+        stats.seconds += seconds
+        stats.calls += 1
+        if peak is not None:
+            stats.peak = max(stats.peak or 0, peak)
+        if rss is not None:
+            stats.rss = max(stats.rss or 0, rss)
+        for hook in _stage_hooks:
+            hook(name, seconds, peak)
+        return value
+
+    @property
+    def seconds(self) -> float:
+        return sum(s.seconds for s in self.stages.values())
+
+    def as_dict(self) -> dict:
+        return {name: s.as_dict() for name, s in self.stages.items()}
+
+    def __str__(self):
+        total = self.seconds
+        rows = []
+        for name, s in self.stages.items():
+            share = s.seconds / total if total > 0 else 0.0
+            rss = "" if s.rss is None else f"  +{s.rss / 2**20:.1f} MB resident"
+            peak = "" if s.peak is None else f"  {s.peak / 2**20:8.1f} MB"
+            rows.append(f"{name:<14}{s.seconds * 1e3:10.1f} ms{share:7.1%}  x{s.calls}{peak}{rss}")
+        rows.append(f"{'total':<14}{total * 1e3:10.1f} ms")
+        return "\n".join(rows)
+
+# NOTE: tracemalloc traces the whole process, pages profiled at once on several threads share it
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+
+def profile_mode() -> Optional[str]:
+    mode = os.environ.get("BIRDNEST_PROFILE", "").lower()
+    return mode if mode in ("cprofile", "tracemalloc") else None
+
+@contextmanager
+def profiled(name: str):
+    """
+    Profiles the block as BIRDNEST_PROFILE says and keeps the result if it
+    was slow. `name` (e.g. the page's file name) goes into the file name.
+    """
+    mode = profile_mode()
+    if mode is None:
+        yield
+        return
+    global _tracing_users
+    slow = float(os.environ.get("BIRDNEST_PROFILE_SLOW", 5))
+    profiler = None
+    started_tracing = False
+    if mode == "cprofile":
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # NOTE: another profiler is already active in this thread
+            profiler = None
+    else:
+        with _tracing_lock:
+            if _tracing_users > 0 or not tracemalloc.is_tracing():
+                if _tracing_users == 0:
+                    tracemalloc.start()
+                _tracing_users += 1
+                started_tracing = True
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        if profiler is not None:
+            profiler.disable()
+        # NOTE: a snapshot holds every live allocation, it is only taken of slow runs
+        keep = seconds >= slow
+        snapshot = tracemalloc.take_snapshot() if keep and mode == "tracemalloc" and tracemalloc.is_tracing() else None
+        if started_tracing:
+            with _tracing_lock:
+                _tracing_users -= 1
+                if _tracing_users == 0:
+                    tracemalloc.stop()
+        if keep and (profiler is not None or snapshot is not None):
+            PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+            stem = re.sub(r"[^\w.-]+", "_", name or "page")
+            base = f"{stem}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+            if profiler is not None:
+                profiler.dump_stats(PROFILE_DIR / f"{base}.prof")
+            else:
+                snapshot.dump(str(PROFILE_DIR / f"{base}.snapshot"))
@@ -0,0 +1,103 @@
+import numpy as np
+from PIL import Image
+
+INK_THRESHOLD = 128
+
+def ink_mask(image: Image.Image, threshold=INK_THRESHOLD) -> np.ndarray:
+    """
+    Boolean array, True where the page has ink (pixels darker than `threshold`).
+    """
+    return np.asarray(image.convert("L")) < threshold
+
+def row_profile(image: Image.Image, threshold=INK_THRESHOLD) -> np.ndarray:
+    """
+    Number of ink pixels in every row of the page.
+    """
+    return np.count_nonzero(ink_mask(image, threshold), axis=1)
+
+def runs(flags: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    (starts, stops) of the runs of True in `flags`.
+    """
+    padded = np.concatenate(([False], flags, [False])).astype(np.int8)
+    edges = np.flatnonzero(np.diff(padded))
+    return edges[0::2], edges[1::2]
+
+def line_height(profile: np.ndarray, tolerance=0) -> int:
+    """
+    Median height of the runs of inked rows, roughly the height of a text line.
+    """
+    starts, stops = runs(profile > tolerance)
+    if len(starts) == 0:
+        return 0
+    return int(np.median(stops - starts))
+
+def gutter_cut(profile: np.ndarray, lo: int, hi: int, tolerance=0) -> int:
+    """
+    A row in profile[lo:hi] to cut the page at: the middle of the tallest run
+    of blank rows (the nearest to the middle of the window on ties), or the
+    row with the least ink if no row is blank.
+    """
+    window = profile[lo:hi]
+    starts, stops = runs(window <= tolerance)
+    if len(starts) == 0:
+        return lo + int(np.argmin(window))
+    heights = stops - starts
+    middles = (starts + stops) // 2
+    # NOTE: lexsort sorts by the last key first: tallest gap, then closest to the middle
+    best = np.lexsort((np.abs(middles - len(window) // 2), -heights))[0]
+    return lo + int(middles[best])
+
+def find_lines(mask: np.ndarray) -> list[tuple[int, int, int, int]]:
+    """
+    (left, top, right, bottom) of every text line on the binarized page,
+    top to bottom. Inked rows separated by less than a sixth of the typical
+    line height (the dot of an "i") are one line, specks much shorter than
+    a line are dropped.
+    """
+    starts, stops = runs(mask.any(axis=1))
+    if len(starts) == 0:
+        return []
+    height = np.median(stops - starts)
+    merged = [[starts[0], stops[0]]]
+    for start, stop in zip(starts[1:], stops[1:]):
+        if start - merged[-1][1] < height / 6:
+            merged[-1][1] = stop
+        else:
+            merged.append([start, stop])
+    lines = []
+    for top, bottom in merged:
+        if bottom - top < height / 3:
+            continue
+        columns = np.flatnonzero(mask[top:bottom].any(axis=0))
+        lines.append((int(columns[0]), int(top), int(columns[-1]) + 1, int(bottom)))
+    return lines
+
+def otsu_threshold(gray: np.ndarray) -> int:
+    """
+    The gray level that best separates ink from paper (Otsu's method).
+    """
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    levels = np.arange(256)
+    weight = np.cumsum(hist)
+    total = weight[-1]
+    mass = np.cumsum(hist * levels)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        between = (mass[-1] * weight - total * mass) ** 2 / (weight * (total - weight))
+    if np.isnan(between).all():
+        # NOTE: a page of a single gray level
+        return INK_THRESHOLD
+    # NOTE: pixels below the threshold are ink
+    return int(np.nanargmax(between)) + 1
+
+def x_height(mask: np.ndarray, lines: list[tuple[int, int, int, int]]) -> float:
+    """
+    Median x-height of the text lines: in every line, the rows with at least
+    half as much ink as its busiest row are the ones between the baseline and
+    the mean line. 0 if there are no lines.
+    """
+    heights = []
+    for left, top, right, bottom in lines:
+        profile = np.count_nonzero(mask[top:bottom, left:right], axis=1)
+        heights.append(np.count_nonzero(profile >= profile.max() / 2))
+    return float(np.median(heights)) if heights else 0.0
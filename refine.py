@@ -0,0 +1,165 @@
+"""
+Second OCR pass over the words tesseract was unsure of. Only those words are
+cropped, upscaled and read again (in parallel), instead of OCRing the whole
+page at a higher resolution to rescue a few of them. A new reading replaces
+the old one if tesseract is more confident about it.
+
+The pass is off unless BIRDNEST_REFINE is set to 1 (or a caller asks for
+it): it changes the OCR text, and with a per-call backend like pytesseract
+every word read again is another tesseract process.
+
+Crops are read on one pool shared by every page in the process, so an
+in-process backend keeps its engines warm on the pool's threads. Its size is
+BIRDNEST_REFINE_THREADS (default: every core, batch and service workers use
+1 since their pool already does).
+"""
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+from PIL import Image, ImageOps
+
+# NOTE: words below this confidence are read again, and labels (the first word of a line) below the higher one
+REFINE_CONF = 60
+REFINE_LABEL_CONF = 90
+# NOTE: crops are scaled up until the word is this tall, at most MAX_REFINE_SCALE times
+REFINE_WORD_HEIGHT = 64
+MAX_REFINE_SCALE = 4.0
+WORD_CONFIG = "--psm 8"
+# NOTE: everything the refined output depends on besides the first pass, part of its OCR cache key
+REFINE_CONFIG = f"refine {REFINE_CONF} {REFINE_LABEL_CONF} {REFINE_WORD_HEIGHT} {MAX_REFINE_SCALE} {WORD_CONFIG}"
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def refine_enabled() -> bool:
+    return os.environ.get("BIRDNEST_REFINE", "0") != "0"
+
+def refine_pool() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            threads = int(os.environ.get("BIRDNEST_REFINE_THREADS", 0)) or os.cpu_count() or 1
+            _pool = ThreadPoolExecutor(threads, thread_name_prefix="birdnest-refine")
+        return _pool
+
+class RefineReport:
+    __slots__ = ("crops", "improved", "seconds", "scale", "full_page_seconds")
+
+    def __init__(self, crops: int, improved: int, seconds: float, scale: float, full_page_seconds: Optional[float]):
+        self.crops = crops
+        self.improved = improved
+        self.seconds = seconds
+        # NOTE: what the whole page would have been upscaled by to read these words as well
+        self.scale = scale
+        # NOTE: an estimate, not measured: the first pass's time times the upscaled page's pixels,
+        # None if the first pass came from the cache
+        self.full_page_seconds = full_page_seconds
+
+    @property
+    def saved(self) -> Optional[float]:
+        if self.full_page_seconds is None:
+            return None
+        return self.full_page_seconds - self.seconds
+
+    def as_dict(self) -> dict:
+        return {
+            "crops": self.crops,
+            "improved": self.improved,
+            "seconds": round(self.seconds, 4),
+            "scale": round(self.scale, 2),
+            "estimated_full_page_seconds": None if self.full_page_seconds is None else round(self.full_page_seconds, 4),
+        }
+
+    def __str__(self):
+        s = f"re-OCR'd {self.crops} words ({self.improved} improved) in {self.seconds:.2f} s"
+        if self.saved is not None:
+            s += f", an estimated {self.saved:.2f} s less than OCRing the page at {self.scale:.1f}x"
+        return s
+
+def select_words(data: dict, conf=REFINE_CONF, label_conf=REFINE_LABEL_CONF) -> list[int]:
+    """
+    Rows of `image_to_data` output worth reading again.
+    """
+    picked = []
+    line = None
+    for i, level in enumerate(data["level"]):
+        if level != 5:
+            continue
+        key = (data["page_num"][i], data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        leading = key != line
+        line = key
+        c = float(data["conf"][i])
+        # NOTE: confidence -1 marks rows that were never read (e.g. elided line ends)
+        if c < 0 or not str(data["text"][i]).strip():
+            continue
+        if c < (label_conf if leading else conf):
+            picked.append(i)
+    return picked
+
+def word_scale(height: int) -> float:
+    return min(max(REFINE_WORD_HEIGHT / max(height, 1), 1.0), MAX_REFINE_SCALE)
+
+def crop_word(image: Image.Image, data: dict, i: int) -> tuple[Image.Image, float]:
+    """
+    The word in row `i` with half its height of context around it, upscaled.
+    """
+    left, top, width, height = (data[k][i] for k in ("left", "top", "width", "height"))
+    pad = max(height // 2, 2)
+    box = (max(left - pad, 0), max(top - pad, 0), min(left + width + pad, image.width), min(top + height + pad, image.height))
+    crop = image.crop(box).convert("L")
+    scale = word_scale(height)
+    if scale > 1:
+        crop = crop.resize((round(crop.width * scale), round(crop.height * scale)), Image.BICUBIC)
+    # NOTE: tesseract reads single words better with a white border
+    return ImageOps.expand(crop, border=round(pad * scale), fill=255), scale
+
+def read_word(backend, crop: Image.Image, lang="eng") -> Optional[tuple[str, float]]:
+    data = backend.image_to_data(crop, lang=lang, config=WORD_CONFIG)
+    words = [
+        (str(text), float(conf))
+        for level, text, conf in zip(data["level"], data["text"], data["conf"])
+        if level == 5 and str(text).strip() and float(conf) >= 0
+    ]
+    if not words:
+        return None
+    return "".join(t for t, _ in words), min(c for _, c in words)
+
+def refine_words(image: Image.Image, data: dict, backend, lang="eng", ocr_seconds: Optional[float] = None, pool: Optional[ThreadPoolExecutor] = None) -> tuple[dict, RefineReport]:
+    """
+    `data` with the words from `select_words` read again by `backend`, on
+    `pool` (`refine_pool()` by default). `ocr_seconds`, the first pass's
+    time, is used to estimate what OCRing the whole page upscaled would have
+    cost instead.
+    """
+    start = time.perf_counter()
+    picked = select_words(data)
+    if not picked:
+        return data, RefineReport(0, 0, 0.0, 1.0, None)
+    crops = [crop_word(image, data, i) for i in picked]
+    readings = list((pool or refine_pool()).map(lambda crop: read_word(backend, crop[0], lang), crops))
+
+    data = dict(data)
+    data["text"] = list(data["text"])
+    data["conf"] = list(data["conf"])
+    improved = 0
+    for i, reading in zip(picked, readings):
+        if reading is not None and reading[1] > float(data["conf"][i]):
+            data["text"][i], data["conf"][i] = reading[0], round(reading[1])
+            improved += 1
+    scale = float(np.median([s for _, s in crops]))
+    full_page_seconds = None if ocr_seconds is None else ocr_seconds * scale ** 2
+    return data, RefineReport(len(picked), improved, time.perf_counter() - start, scale, full_page_seconds)
+
+def cached_report(data: dict, refined: dict) -> RefineReport:
+    """
+    Report of a refine pass whose output came from the OCR cache: nothing
+    was read again this time.
+    """
+    picked = select_words(data)
+    improved = sum(1 for i in picked if refined["text"][i] != data["text"][i] or float(refined["conf"][i]) != float(data["conf"][i]))
+    scale = float(np.median([word_scale(data["height"][i]) for i in picked])) if picked else 1.0
+    return RefineReport(len(picked), improved, 0.0, scale, None)
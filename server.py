@@ -0,0 +1,361 @@
+"""
+Local HTTP service that checks documents without starting a Python process
+(and loading the dictionaries) per page.
+
+    POST /jobs              page as the request body (any image format), or
+                            JSON {"path": "..."} for a file under --root.
+                            Multi-page files are checked as one document,
+                            diagnostics carry their page number.
+                            Query: indent_check=0, spell_check=1,
+                            indent_only=1, refine=1, image=1, lang=eng,
+                            wait=<seconds>, name=<file name of the upload>.
+                            202 {"id", "status", "url"}, or the finished job
+                            with wait=; 503 + Retry-After when the queue is full.
+    GET  /jobs/<id>         {"id", "status", "result" | "error"}
+    GET  /jobs/<id>/image   annotated page (PNG), for jobs submitted with image=1
+    GET  /status            queue and worker statistics
+
+Usage: python server.py [--port 8765] [--workers N] [--max-queue N] [--root DIR]
+"""
+import argparse
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import io
+import itertools
+import json
+import os
+from pathlib import Path
+import threading
+import time
+from typing import Optional
+from urllib.parse import parse_qs, urlsplit
+
+from PIL import Image
+
+from batch import _worker, check_document, init_worker, prepare_dictionaries
+from components import Pipeline
+from document import Document
+
+MAX_UPLOAD_BYTES = 64 * 2**20
+# NOTE: finished jobs are kept for polling until this many newer ones have finished,
+# or their annotated pages add up to more than MAX_FINISHED_BYTES
+MAX_FINISHED_JOBS = 1024
+MAX_FINISHED_BYTES = 256 * 2**20
+MAX_WAIT_SECONDS = 600
+
+def check_page(task: dict) -> dict:
+    """
+    Runs in a pool worker. `task` has either the uploaded file's bytes or a
+    path. A multi-page file is checked as one document (see `batch.check_document`),
+    its diagnostics get the number of their page.
+    """
+    start = time.perf_counter()
+    if task.get("data") is not None:
+        image = Image.open(io.BytesIO(task["data"]))
+    else:
+        image = Image.open(task["path"])
+    if task.get("name"):
+        # NOTE: replay backends find pages by file name
+        image.filename = task["name"]
+    if getattr(image, "n_frames", 1) > 1:
+        if task["image"]:
+            raise ValueError("annotated images are only made for single pages, submit multi-page files without image=1")
+        document = Document(image, ocr_cache=_worker["ocr_cache"], ocr_backend=_worker["ocr_backend"], refine=task["refine"])
+        result = check_document(document, task["lang"], task["indent_check"], task["spell_check"], task["indent_only"])
+        return dict(result, seconds=time.perf_counter() - start, png=None)
+    image.load()
+    pipeline = Pipeline(image, ocr_cache=_worker["ocr_cache"], ocr_backend=_worker["ocr_backend"], refine=task["refine"])
+    board, s, article, diagnostics = pipeline.run(
+        lang=task["lang"],
+        indent_check=task["indent_check"],
+        spell_check=task["spell_check"],
+        draw=task["image"],
+        verbose=False,
+        indent_only=task["indent_only"],
+    )
+    png = None
+    if task["image"]:
+        buffer = io.BytesIO()
+        board.render(image).save(buffer, format="PNG")
+        png = buffer.getvalue()
+    return {
+        "text": s.as_str(),
+        "words": len(article.words),
+        "diagnostics": [d.as_dict() for d in diagnostics],
+        "refine": None if pipeline.refine_report is None else pipeline.refine_report.as_dict(),
+        "stages": pipeline.stats.as_dict(),
+        "pages": 1,
+        "seconds": time.perf_counter() - start,
+        "png": png,
+    }
+
+def job_bytes(job: dict) -> int:
+    png = job.get("result", {}).get("png")
+    return 0 if png is None else len(png)
+
+def _ready():
+    return os.getpid()
+
+class QueueFull(Exception):
+    pass
+
+class CheckService:
+    """
+    A pool of warm worker processes behind a bounded queue. At most
+    `max_queue` jobs are queued or running at once, `submit` raises QueueFull
+    past that instead of letting a burst pile up unbounded work.
+    """
+    def __init__(self, workers: Optional[int] = None, max_queue: Optional[int] = None, ocr_cache=True, ocr_backend: Optional[str] = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = max_queue or 4 * self.workers
+        options = dict(
+            indent_check=True,
+            # NOTE: load the dictionaries up front, so the first spell checked job doesn't pay for it
+            spell_check=True,
+            ocr_cache=ocr_cache,
+            ocr_backend=ocr_backend,
+            images=False,
+        )
+        prepare_dictionaries()
+        self.pool = ProcessPoolExecutor(self.workers, initializer=init_worker, initargs=(options,))
+        self.jobs = OrderedDict()
+        self.in_flight = 0
+        self.started = time.time()
+        self.counts = {"submitted": 0, "done": 0, "failed": 0, "rejected": 0}
+        self.busy = 0.0
+        # NOTE: bytes of the annotated pages of finished jobs still kept
+        self.finished_bytes = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def warm_up(self):
+        # NOTE: the pool starts its processes on the first submit, this makes them run init_worker before any request does
+        for f in [self.pool.submit(_ready) for _ in range(self.workers)]:
+            f.result()
+
+    def submit(self, task: dict) -> dict:
+        """
+        Queues `task`. Raises QueueFull when the queue is, and the pool's
+        RuntimeError (BrokenProcessPool after a worker died) when it can't
+        take work at all; the job is only registered once the pool has it.
+        """
+        with self._lock:
+            if self.in_flight >= self.max_queue:
+                self.counts["rejected"] += 1
+                raise QueueFull()
+            self.in_flight += 1
+        submitted = time.time()
+        try:
+            future = self.pool.submit(check_page, task)
+        except Exception:
+            with self._lock:
+                self.in_flight -= 1
+                self.counts["rejected"] += 1
+            raise
+        with self._lock:
+            self.counts["submitted"] += 1
+            job = {"id": str(next(self._ids)), "status": "queued", "submitted": submitted, "future": future}
+            self.jobs[job["id"]] = job
+        future.add_done_callback(lambda f: self._finished(job, f))
+        return job
+
+    def _finished(self, job: dict, future):
+        with self._lock:
+            self.in_flight -= 1
+            try:
+                job["result"] = future.result()
+                job["status"] = "done"
+                self.counts["done"] += 1
+                self.busy += job["result"]["seconds"]
+            except Exception as e:
+                job["error"] = f"{type(e).__name__}: {e}"
+                job["status"] = "failed"
+                self.counts["failed"] += 1
+            job["finished"] = time.time()
+            self.finished_bytes += job_bytes(job)
+            self.jobs.move_to_end(job["id"])
+            finished = [k for k, j in self.jobs.items() if j["status"] in ("done", "failed")]
+            for i, k in enumerate(finished):
+                if len(finished) - i <= MAX_FINISHED_JOBS and self.finished_bytes <= MAX_FINISHED_BYTES:
+                    break
+                self.finished_bytes -= job_bytes(self.jobs.pop(k))
+
+    def wait(self, job: dict, timeout: float):
+        try:
+            job["future"].exception(timeout=timeout)
+        except TimeoutError:
+            pass
+
+    def describe(self, job: dict) -> dict:
+        status = job["status"]
+        if status == "queued" and job["future"].running():
+            status = "running"
+        found = {"id": job["id"], "status": status, "url": f"/jobs/{job['id']}"}
+        if "result" in job:
+            result = job["result"]
+            found["result"] = {k: v for k, v in result.items() if k != "png"}
+            if result["png"] is not None:
+                found["image_url"] = f"/jobs/{job['id']}/image"
+        if "error" in job:
+            found["error"] = job["error"]
+        if "finished" in job:
+            found["latency"] = round(job["finished"] - job["submitted"], 4)
+        return found
+
+    def status(self) -> dict:
+        with self._lock:
+            uptime = time.time() - self.started
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "in_flight": self.in_flight,
+                "finished_bytes": self.finished_bytes,
+                **self.counts,
+                "uptime": round(uptime, 1),
+                # NOTE: share of the pool's time spent processing pages
+                "utilization": round(self.busy / (uptime * self.workers), 3) if uptime > 0 else None,
+            }
+
+    def shutdown(self):
+        self.pool.shutdown(cancel_futures=True)
+
+def _flag(query: dict, name: str, default: bool) -> bool:
+    if name not in query:
+        return default
+    return query[name][-1].lower() not in ("0", "false", "no")
+
+def _wait(query: dict) -> Optional[float]:
+    if "wait" not in query:
+        return None
+    wait = float(query["wait"][-1] or 60)
+    if not 0 <= wait <= MAX_WAIT_SECONDS:
+        raise ValueError(f"wait of {wait} seconds")
+    return wait
+
+class Handler(BaseHTTPRequestHandler):
+    service: CheckService
+    # NOTE: file paths are only read under this directory
+    root: Path
+
+    def send_json(self, code: int, body: dict, headers=()):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in headers:
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        parts = [p for p in urlsplit(self.path).path.split("/") if p]
+        if parts == ["status"]:
+            return self.send_json(200, self.service.status())
+        if len(parts) in (2, 3) and parts[0] == "jobs":
+            job = self.service.jobs.get(parts[1])
+            if job is None:
+                return self.send_json(404, {"error": "no such job"})
+            if len(parts) == 2:
+                return self.send_json(200, self.service.describe(job))
+            if parts[2] == "image":
+                png = job.get("result", {}).get("png")
+                if png is None:
+                    return self.send_json(404, {"error": "no image for this job"})
+                self.send_response(200)
+                self.send_header("Content-Type", "image/png")
+                self.send_header("Content-Length", str(len(png)))
+                self.end_headers()
+                self.wfile.write(png)
+                return
+        self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path.rstrip("/") != "/jobs":
+            return self.send_json(404, {"error": "not found"})
+        query = parse_qs(url.query, keep_blank_values=True)
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_UPLOAD_BYTES:
+            self.close_connection = True
+            return self.send_json(413, {"error": f"uploads are limited to {MAX_UPLOAD_BYTES} bytes"})
+        body = self.rfile.read(length)
+        task = {
+            "lang": query.get("lang", ["eng"])[-1],
+            "indent_check": _flag(query, "indent_check", True),
+            "spell_check": _flag(query, "spell_check", False),
+            "indent_only": _flag(query, "indent_only", False),
+            # NOTE: BIRDNEST_REFINE decides unless the request does
+            "refine": _flag(query, "refine", False) if "refine" in query else None,
+            "image": _flag(query, "image", False),
+            "data": None,
+            "name": query.get("name", [None])[-1],
+        }
+        if task["indent_only"] and task["spell_check"]:
+            return self.send_json(400, {"error": "spell_check can't be combined with indent_only"})
+        try:
+            wait = _wait(query)
+        except ValueError:
+            return self.send_json(400, {"error": f"wait must be a number of seconds from 0 to {MAX_WAIT_SECONDS}"})
+        if self.headers.get("Content-Type", "").startswith("application/json"):
+            try:
+                path = Path(json.loads(body)["path"]).resolve()
+            except (ValueError, KeyError, TypeError):
+                return self.send_json(400, {"error": "expected {\"path\": ...}"})
+            if not path.is_relative_to(self.root):
+                return self.send_json(403, {"error": f"paths must be under {self.root}"})
+            if not path.is_file():
+                return self.send_json(404, {"error": f"no such file {path}"})
+            task["path"] = str(path)
+        elif body:
+            task["data"] = body
+        else:
+            return self.send_json(400, {"error": "empty request"})
+
+        try:
+            job = self.service.submit(task)
+        except QueueFull:
+            return self.send_json(503, {"error": "queue is full"}, headers=[("Retry-After", "1")])
+        except RuntimeError as e:
+            # NOTE: a broken or shut down pool, retrying won't help until the service is restarted
+            return self.send_json(503, {"error": f"workers unavailable: {type(e).__name__}: {e}"})
+        if wait is not None:
+            self.service.wait(job, wait)
+            found = self.service.describe(job)
+            return self.send_json(200 if found["status"] in ("done", "failed") else 202, found)
+        self.send_json(202, self.service.describe(job), headers=[("Location", f"/jobs/{job['id']}")])
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+def serve(host="127.0.0.1", port=8765, workers=None, max_queue=None, root=None, ocr_cache=True, ocr_backend=None, quiet=False):
+    service = CheckService(workers, max_queue, ocr_cache=ocr_cache, ocr_backend=ocr_backend)
+    service.warm_up()
+    handler = type("BoundHandler", (Handler,), {"service": service, "root": Path(root or ".").resolve()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.quiet = quiet
+    print(f"checking on http://{host}:{server.server_port} with {service.workers} workers (queue {service.max_queue})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+
+def main():
+    parser = argparse.ArgumentParser(description="Local HTTP service for indent and spell diagnostics.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", "-j", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--max-queue", type=int, default=None, help="jobs queued or running before requests are refused (default: 4 per worker)")
+    parser.add_argument("--root", default=".", help="only accept file paths under this directory (default: the current one)")
+    parser.add_argument("--ocr-backend", default=None, help="pytesseract, tesserocr, replay:<dir> or record:<dir>")
+    parser.add_argument("--no-cache", action="store_true", help="don't read or write the OCR cache")
+    parser.add_argument("--quiet", "-q", action="store_true", help="don't log requests")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers, args.max_queue, args.root, not args.no_cache, args.ocr_backend, args.quiet)
+
+if __name__ == "__main__":
+    main()
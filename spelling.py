@@ -0,0 +1,169 @@
+from collections import OrderedDict
+import os
+import re
+import threading
+from typing import Iterable, Optional, Union
+from pathlib import Path
+
+from dictionary import (
+    CompactDictionary,
+    MergedDictionary,
+    builtin_frequencies,
+    read_word_list,
+    should_check,
+    word_list_cache_name,
+)
+from symspell import SymSpellIndex, closest
+from util import CACHE_DIR
+
+TOKEN_PATTERN = re.compile(r"\b[a-zA-Z]+(?:['-][a-zA-Z]+)*\.?\b")
+MAX_SUGGESTIONS = 3
+DICTIONARY_DIR = CACHE_DIR / "dictionaries"
+SPELL_ENGINES = ["edits", "symspell"]
+
+class CandidateCache:
+    """
+    Bounded LRU cache of spelling suggestions, shared by every `process()` call.
+    """
+    def __init__(self, maxsize=50_000):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, token: str) -> Optional[tuple[str, ...]]:
+        with self._lock:
+            if token in self._entries:
+                self._entries.move_to_end(token)
+                self.hits += 1
+                return self._entries[token]
+            self.misses += 1
+
+        candidates = suggest(token)
+
+        with self._lock:
+            self._entries[token] = candidates
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return candidates
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+candidate_cache = CandidateCache()
+
+_lock = threading.RLock()
+_dictionary = None
+_symspell_indexes = None
+_word_lists = [p for p in os.environ.get("BIRDNEST_WORD_LISTS", "").split(os.pathsep) if p]
+_engine = os.environ.get("BIRDNEST_SPELL_ENGINE", "edits")
+
+def load_base_dictionary(lang="en") -> CompactDictionary:
+    return CompactDictionary.load_or_build(DICTIONARY_DIR / lang, lambda: builtin_frequencies(lang))
+
+def load_word_list(path: Union[str, Path]) -> CompactDictionary:
+    # NOTE: compiled once per distinct file content
+    return CompactDictionary.load_or_build(DICTIONARY_DIR / word_list_cache_name(path), lambda: read_word_list(path))
+
+def get_dictionary() -> MergedDictionary:
+    """
+    The dictionary is only opened on the first spell check.
+    """
+    global _dictionary
+    with _lock:
+        if _dictionary is None:
+            _dictionary = MergedDictionary([load_base_dictionary()] + [load_word_list(p) for p in _word_lists])
+        return _dictionary
+
+def add_word_list(path: Union[str, Path]):
+    """
+    Adds a domain word list (statute names, defined terms, ...) next to the base dictionary.
+    """
+    global _dictionary, _symspell_indexes
+    with _lock:
+        _word_lists.append(str(path))
+        _dictionary = None
+        _symspell_indexes = None
+        candidate_cache.clear()
+
+def set_spell_engine(engine: str):
+    global _engine
+    if engine not in SPELL_ENGINES:
+        raise ValueError(f"Unknown spell engine {engine}, expected one of {SPELL_ENGINES}")
+    with _lock:
+        _engine = engine
+        candidate_cache.clear()
+
+def get_symspell_indexes() -> list[SymSpellIndex]:
+    global _symspell_indexes
+    with _lock:
+        if _symspell_indexes is None:
+            _symspell_indexes = [SymSpellIndex.load_or_build(d) for d in get_dictionary().dictionaries]
+        return _symspell_indexes
+
+def edit_distance_1(word: str, letters: str) -> set[str]:
+    splits = [(word[:i], word[i:]) for i in range(len(word) + 1)]
+    deletes = [L + R[1:] for L, R in splits if R]
+    transposes = [L + R[1] + R[0] + R[2:] for L, R in splits if len(R) > 1]
+    replaces = [L + c + R[1:] for L, R in splits if R for c in letters]
+    inserts = [L + c + R for L, R in splits for c in letters]
+    return set(deletes + transposes + replaces + inserts)
+
+def edit_candidates(token: str) -> Optional[list[str]]:
+    """
+    Same search as `SpellChecker.candidates`: known words one edit away,
+    otherwise two edits away.
+    """
+    dictionary = get_dictionary()
+    edits_1 = edit_distance_1(token, dictionary.letters)
+    found = dictionary.known(edits_1)
+    if len(found) > 0:
+        return list(found)
+    edits_2 = set()
+    for e in edits_1:
+        if should_check(e, dictionary.longest_word_length):
+            edits_2 |= edit_distance_1(e, dictionary.letters)
+    found = dictionary.known(edits_2)
+    return list(found) if len(found) > 0 else None
+
+def symspell_candidates(token: str) -> Optional[list[str]]:
+    found = {}
+    for index in get_symspell_indexes():
+        found.update(index.lookup(token))
+    return closest(found)
+
+def suggest(token: str) -> Optional[tuple[str, ...]]:
+    """
+    Up to `MAX_SUGGESTIONS` corrections for a misspelled token, most frequent first.
+    """
+    dictionary = get_dictionary()
+    if token in dictionary or not should_check(token, dictionary.longest_word_length):
+        return (token,)
+    candidates = symspell_candidates(token) if _engine == "symspell" else edit_candidates(token)
+    if candidates is None:
+        return None
+    freqs = dictionary.frequencies(candidates).tolist()
+    ranked = sorted(zip(candidates, freqs), key=lambda c: (-c[1], c[0]))
+    return tuple(w for w, _ in ranked[:MAX_SUGGESTIONS])
+
+def tokenize(text: str) -> list[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+def find_misspellings(texts: Iterable[str]) -> list[list[str]]:
+    """
+    Returns the misspelled tokens of every text. Tokens are collected across
+    all texts and looked up in the dictionary once.
+    """
+    tokens = [list(dict.fromkeys(tokenize(t))) for t in texts]
+    unique = set()
+    for t in tokens:
+        unique.update(t)
+    unknown = get_dictionary().unknown(unique)
+    return [[t for t in ts if t in unknown] for ts in tokens]
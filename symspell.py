@@ -0,0 +1,164 @@
+import json
+from pathlib import Path
+from typing import Optional, Union
+import zlib
+
+import numpy as np
+
+from dictionary import CompactDictionary, should_check, write_atomic, write_meta
+
+INDEX_VERSION = 2
+
+def damerau_levenshtein(a: str, b: str, max_distance: int) -> int:
+    """
+    Unrestricted Damerau-Levenshtein distance, which is what chaining
+    `SpellChecker.edit_distance_1` reaches. Returns `max_distance + 1` once the
+    distance is known to exceed `max_distance`.
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    if a == b:
+        return 0
+    inf = len(a) + len(b)
+    last_row = {}
+    rows = [[inf] * (len(b) + 2), [inf] + list(range(len(b) + 1))]
+    for i in range(1, len(a) + 1):
+        row = [inf, i] + [0] * len(b)
+        last_match = 0
+        for j in range(1, len(b) + 1):
+            k = last_row.get(b[j - 1], 0)
+            l = last_match
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            if cost == 0:
+                last_match = j
+            row[j + 1] = min(
+                rows[i][j] + cost,
+                row[j] + 1,
+                rows[i][j + 1] + 1,
+                rows[k][l] + (i - k - 1) + 1 + (j - l - 1),
+            )
+        rows.append(row)
+        last_row[a[i - 1]] = i
+        if min(row[1:]) > max_distance:
+            return max_distance + 1
+    return rows[len(a) + 1][len(b) + 1]
+
+def deletes(word: str, max_distance: int) -> set[str]:
+    found = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))} - found
+        found |= frontier
+    return found
+
+def delete_key(s: str) -> int:
+    # NOTE: collisions only add candidates that the distance check throws away
+    return zlib.crc32(s.encode("utf-8"))
+
+class SymSpellIndex:
+    """
+    Symmetric-delete candidate index (SymSpell) over a `CompactDictionary`.
+    Every word is indexed under all deletes of its first `prefix_length`
+    characters, so a lookup only has to probe the deletes of the query instead
+    of generating every edit-distance-2 variant.
+    """
+    def __init__(
+            self,
+            dictionary: CompactDictionary,
+            keys: np.ndarray,
+            ids: np.ndarray,
+            max_distance=2,
+            prefix_length=7,
+        ):
+        self.dictionary = dictionary
+        self.keys = keys
+        self.ids = ids
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+
+    @classmethod
+    def build(cls, dictionary: CompactDictionary, max_distance=2, prefix_length=7) -> "SymSpellIndex":
+        keys = []
+        ids = []
+        for i, (w, _) in enumerate(dictionary.items()):
+            # NOTE: only the words `SpellChecker.known` would ever return
+            if not should_check(w, dictionary.longest_word_length):
+                continue
+            for d in deletes(w[:prefix_length], max_distance):
+                keys.append(delete_key(d))
+                ids.append(i)
+        keys = np.array(keys, dtype=np.uint32)
+        ids = np.array(ids, dtype=np.int32)
+        order = np.argsort(keys, kind="stable")
+        return cls(dictionary, keys[order], ids[order], max_distance, prefix_length)
+
+    @staticmethod
+    def default_path(dictionary: CompactDictionary, max_distance=2, prefix_length=7) -> Path:
+        return Path(dictionary.path) / f"symspell-d{max_distance}-p{prefix_length}"
+
+    def save(self, path: Union[str, Path]):
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        write_atomic(path / "keys.npy", lambda f: np.save(f, self.keys))
+        write_atomic(path / "ids.npy", lambda f: np.save(f, self.ids))
+        write_meta(path / "meta.json", {
+            "version": INDEX_VERSION,
+            "max_distance": self.max_distance,
+            "prefix_length": self.prefix_length,
+            "dictionary_checksum": self.dictionary.checksum,
+        })
+
+    @classmethod
+    def load(cls, path: Union[str, Path], dictionary: CompactDictionary, mmap=True) -> "SymSpellIndex":
+        path = Path(path)
+        with open(path / "meta.json") as f:
+            meta = json.load(f)
+        if meta["version"] != INDEX_VERSION:
+            raise ValueError(f"Unsupported index version {meta['version']} in {path}")
+        if meta["dictionary_checksum"] != dictionary.checksum:
+            raise ValueError(f"Index in {path} was built for a different dictionary")
+        mmap_mode = "r" if mmap else None
+        return cls(
+            dictionary,
+            np.load(path / "keys.npy", mmap_mode=mmap_mode),
+            np.load(path / "ids.npy", mmap_mode=mmap_mode),
+            max_distance=meta["max_distance"],
+            prefix_length=meta["prefix_length"],
+        )
+
+    @classmethod
+    def load_or_build(cls, dictionary: CompactDictionary, path=None, **kwargs) -> "SymSpellIndex":
+        path = path or cls.default_path(dictionary, **kwargs)
+        try:
+            return cls.load(path, dictionary)
+        except (FileNotFoundError, ValueError):
+            # NOTE: missing or written by an older version
+            pass
+        cls.build(dictionary, **kwargs).save(path)
+        return cls.load(path, dictionary)
+
+    def lookup(self, token: str) -> dict[str, int]:
+        """
+        Returns the dictionary words within `max_distance` of `token`, mapped to their distance.
+        """
+        probes = np.array([delete_key(d) for d in deletes(token[:self.prefix_length], self.max_distance)], dtype=np.uint32)
+        lo = np.searchsorted(self.keys, probes, side="left")
+        hi = np.searchsorted(self.keys, probes, side="right")
+        candidate_ids = np.unique(np.concatenate([self.ids[l:h] for l, h in zip(lo.tolist(), hi.tolist())]))
+        # NOTE: cheap length filter before decoding, a single edit changes the utf-8 length by at most 2 bytes
+        offsets = self.dictionary.offsets
+        lengths = offsets[candidate_ids + 1] - offsets[candidate_ids]
+        near = np.abs(lengths - len(token.encode("utf-8"))) <= 2 * self.max_distance
+        found = {}
+        for i in candidate_ids[near].tolist():
+            word = self.dictionary.word(i)
+            distance = damerau_levenshtein(token, word, self.max_distance)
+            if distance <= self.max_distance:
+                found[word] = distance
+        return found
+
+def closest(found: dict[str, int]) -> Optional[list[str]]:
+    if len(found) == 0:
+        return None
+    best = min(found.values())
+    return [w for w, d in found.items() if d == best]
@@ -0,0 +1,52 @@
+import numpy as np
+
+RANK_COLUMNS = ["page_num", "block_num", "par_num", "line_num", "word_num"]
+
+class TesseractTable:
+    """
+    Columnar view of `pytesseract.image_to_data(..., output_type='dict')`.
+    Rows are sorted once by rank, and nodes keep (start, stop) slices into it.
+    """
+    def __init__(self, data: dict):
+        n = len(data["text"])
+        keys = np.array([data[r] for r in RANK_COLUMNS], dtype=np.int64).reshape(len(RANK_COLUMNS), n)
+        # NOTE: np.lexsort sorts by the last key first and is stable
+        order = np.lexsort(keys[::-1])
+
+        self.columns = {}
+        for k, v in data.items():
+            if k == "text":
+                col = np.empty(n, dtype=object)
+                col[:] = v
+            else:
+                col = np.asarray(v)
+                if col.dtype.kind in "iu":
+                    # NOTE: ranks, coordinates and confidences all fit comfortably in 32 bits
+                    col = col.astype(np.int32)
+            self.columns[k] = col[order]
+        keys = keys[:, order]
+
+        # NOTE: a row opens a new group at rank `r` if any rank up to and including `r` changed
+        changed = np.ones((len(RANK_COLUMNS), n), dtype=bool)
+        if n > 1:
+            changed[:, 1:] = np.logical_or.accumulate(keys[:, 1:] != keys[:, :-1], axis=0)
+
+        self.spans = {}
+        for r, rank_type in enumerate(RANK_COLUMNS):
+            cuts = np.flatnonzero(changed[r])
+            stops = np.append(cuts[1:], n)
+            # rows with rank 0 belong to the parent only (e.g. the page row has block_num == 0)
+            valid = keys[r, cuts] > 0
+            self.spans[rank_type] = (cuts[valid], stops[valid])
+
+    def __len__(self):
+        return len(self.columns["text"])
+
+    def __getitem__(self, column: str):
+        return self.columns[column]
+
+    def split_by_rank(self, start: int, stop: int, rank_type="page_num"):
+        starts, stops = self.spans[rank_type]
+        lo = np.searchsorted(starts, start, side="left")
+        hi = np.searchsorted(starts, stop, side="left")
+        return list(zip(starts[lo:hi].tolist(), stops[lo:hi].tolist()))
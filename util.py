@@ -1,32 +1,48 @@
+import os
+from pathlib import Path
+import numpy as np
 from PIL import Image
 
+CACHE_DIR = Path(os.environ.get("BIRDNEST_CACHE_DIR", Path.home() / ".cache" / "birdnest"))
 INDENT_ROUNDING = 10
 SERIES_INDENTS = "    "
     
-def index_list(list: list, ids: list[int]):
-    return [list[i - 1] for i in ids]
+def indent_multiline(s: str):
+    return "\n".join([ SERIES_INDENTS + i for i in s.split("\n")])
 
-def select_data_by_ids(data, ids):
-    return { k: index_list(v, ids) for k, v in data.items() }
+def next_smaller_or_equal(values: list) -> list[int]:
+    """
+    For every position, the first later position whose value is <= its own (len(values) if none).
+    """
+    result = [len(values)] * len(values)
+    stack = []
+    for i, v in enumerate(values):
+        while stack and values[stack[-1]] >= v:
+            result[stack.pop()] = i
+        stack.append(i)
+    return result
 
-def split_data_by_rank(data, rank_type="page_num"):
-    splits = []
-    if len(data[rank_type]) == 0:
-        return splits
-    
-    max_rank = max(data[rank_type])
-    for rank in range(1, max_rank+1):
-        ids = [i for i in range(len(data[rank_type])) if data[rank_type][i] == rank]
-        # print(rank_type, rank, ids)
-        data_split = select_data_by_ids(data, ids)
-        splits.append(data_split)
-    return splits
-    
-def filter_meta_data(data: dict):
-    return {k:v[1:] for k, v in data.items()}
+class RangeArgmin:
+    """
+    Sparse table answering "leftmost position of the minimum in values[start:stop]" in O(1).
+    """
+    def __init__(self, values: list):
+        self.values = np.asarray(values)
+        n = len(values)
+        self.levels = [np.arange(n)]
+        width = 1
+        while 2 * width <= n:
+            prev = self.levels[-1]
+            left = prev[:n - 2 * width + 1]
+            right = prev[width:n - width + 1]
+            self.levels.append(np.where(self.values[right] < self.values[left], right, left))
+            width *= 2
 
-def indent_multiline(s: str):
-    return "\n".join([ SERIES_INDENTS + i for i in s.split("\n")])
+    def __call__(self, start: int, stop: int) -> int:
+        k = (stop - start).bit_length() - 1
+        left = self.levels[k][start]
+        right = self.levels[k][stop - (1 << k)]
+        return int(right if self.values[right] < self.values[left] else left)
 
 def to_roman(num, lower=False):
     if num < 0:
@@ -88,28 +104,6 @@ def upscale_to_300_dpi(img, target_dpi=300):
     return resized_img
 
 
-alphabet_lower = [chr(i) for i in range(97, 123)]
-alphabet_upper = [chr(i) for i in range(65, 91)]
-numerals = [str(i) for i in range(1, 100)]
-roman_numerals_upper = [to_roman(i, lower=False) for i in range(1, 100)]
-roman_numerals_lower = [to_roman(i, lower=True) for i in range(1, 100)]
-
-alphabet_lower_rank = {v: i for i, v in enumerate(alphabet_lower)}
-alphabet_upper_rank = {v: i for i, v in enumerate(alphabet_upper)}
-numerals_rank = {v: i for i, v in enumerate(numerals)}
-roman_numerals_lower_rank = {v: i for i, v in enumerate(roman_numerals_lower)}
-roman_numerals_upper_rank = {v: i for i, v in enumerate(roman_numerals_upper)}
-
-
-pattern_map = {
-    r"^\((\d+)\).*": (numerals_rank, numerals),
-    r"^\(([xiv]+)\).*": (roman_numerals_lower_rank, roman_numerals_lower),
-    r"^\(([XIV]+)\).*": (roman_numerals_upper_rank, roman_numerals_upper),
-    r"^\(([a-z])\).*": (alphabet_lower_rank, alphabet_lower),
-    r"^\(([A-Z])\).*": (alphabet_upper_rank, alphabet_upper),
-    # r"^(.*)": get_zero_rank, # Default case
-}
-
 error_correction_map = {
     "(©)": "(c)",
 }
\ No newline at end of file
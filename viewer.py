@@ -0,0 +1,180 @@
+from collections import OrderedDict
+import math
+from typing import Optional
+
+import tkinter as tk
+from PIL import Image, ImageTk
+
+from drawing import DrawingBoard
+
+TILE_SIZE = 256
+MAX_CACHED_TILES = 512
+RESIZE_DEBOUNCE_MS = 120
+MIN_ZOOM = 0.25
+MAX_ZOOM = 8.0
+
+class ImagePyramid:
+    """
+    The page at full resolution and then at every halving down to `min_size`.
+    Built once per image; a region at any scale is read from the smallest
+    level that still has enough pixels, so zoomed-out views never touch the
+    full-resolution scan.
+    """
+    def __init__(self, image: Image.Image, min_size=TILE_SIZE):
+        level = image.convert("RGB")
+        self.levels = [level]
+        while max(level.size) > 2 * min_size:
+            level = level.reduce(2)
+            self.levels.append(level)
+
+    @property
+    def size(self) -> tuple[int, int]:
+        return self.levels[0].size
+
+    def level_for(self, scale: float) -> int:
+        if scale >= 1:
+            return 0
+        return min(int(math.log2(1 / scale)), len(self.levels) - 1)
+
+    def region(self, box: tuple[float, float, float, float], size: tuple[int, int]) -> Image.Image:
+        """
+        Page region `box` (left, top, right, bottom in full-resolution pixels) resized to `size`.
+        """
+        level = self.level_for(size[0] / (box[2] - box[0]))
+        f = 2 ** level
+        image = self.levels[level]
+        left, top, right, bottom = (v / f for v in box)
+        # NOTE: levels round odd sizes, so the box can poke a fraction of a pixel outside
+        box = (max(left, 0), max(top, 0), min(right, image.width), min(bottom, image.height))
+        return image.resize(size, Image.BILINEAR, box=box)
+
+class TiledCanvas:
+    """
+    Shows a page and its annotations on a Tk canvas. Only the tiles in the
+    viewport are rendered, at the current zoom, and kept in an LRU cache, so
+    scrolling and zooming stay cheap on very tall pages. Resizes are debounced.
+    Zoom 1 fits the page to the canvas width.
+    """
+    def __init__(self, canvas: tk.Canvas, tile_size=TILE_SIZE):
+        self.canvas = canvas
+        self.tile_size = tile_size
+        self.pyramid = None
+        self.board = None
+        self.zoom = 1.0
+        self.scale = None
+        self._tiles = OrderedDict()
+        self._items = {}
+        self._pending_resize = None
+        canvas.bind("<Configure>", self.on_configure)
+
+    def set_image(self, pyramid: ImagePyramid, board: Optional[DrawingBoard]):
+        self.pyramid = pyramid
+        self.board = board
+        self.zoom = 1.0
+        self._reset()
+        self.canvas.yview_moveto(0)
+        self.canvas.xview_moveto(0)
+        self.refresh()
+
+    def set_board(self, board: Optional[DrawingBoard]):
+        self.board = board
+        self._reset()
+        self.refresh()
+
+    def _reset(self):
+        self._tiles.clear()
+        self.canvas.delete("tile")
+        self._items.clear()
+        self.scale = None
+
+    def fit_scale(self) -> float:
+        return max(self.canvas.winfo_width(), 1) / self.pyramid.size[0]
+
+    def on_configure(self, event=None):
+        if self._pending_resize is not None:
+            self.canvas.after_cancel(self._pending_resize)
+        self._pending_resize = self.canvas.after(RESIZE_DEBOUNCE_MS, self._resized)
+
+    def _resized(self):
+        self._pending_resize = None
+        self.refresh()
+
+    def zoom_by(self, factor: float, x: Optional[int] = None, y: Optional[int] = None):
+        """
+        Zooms around the canvas point (x, y), the viewport center by default.
+        """
+        if self.pyramid is None:
+            return
+        zoom = min(max(self.zoom * factor, MIN_ZOOM), MAX_ZOOM)
+        if zoom == self.zoom:
+            return
+        x = self.canvas.winfo_width() / 2 if x is None else x
+        y = self.canvas.winfo_height() / 2 if y is None else y
+        # NOTE: keep the page point under the cursor in place
+        old_scale = self.scale or self.fit_scale() * self.zoom
+        page_x = self.canvas.canvasx(x) / old_scale
+        page_y = self.canvas.canvasy(y) / old_scale
+        self.zoom = zoom
+        self.refresh(anchor=(page_x, page_y, x, y))
+
+    def refresh(self, anchor=None):
+        if self.pyramid is None:
+            return
+        scale = self.fit_scale() * self.zoom
+        if scale != self.scale:
+            self.canvas.delete("tile")
+            self._items.clear()
+            self.scale = scale
+        width = math.ceil(self.pyramid.size[0] * scale)
+        height = math.ceil(self.pyramid.size[1] * scale)
+        self.canvas.config(scrollregion=(0, 0, width, height))
+        if anchor is not None:
+            page_x, page_y, x, y = anchor
+            if width > 0:
+                self.canvas.xview_moveto((page_x * scale - x) / width)
+            if height > 0:
+                self.canvas.yview_moveto((page_y * scale - y) / height)
+        self.render_visible()
+
+    def render_visible(self):
+        if self.pyramid is None or self.scale is None:
+            return
+        t = self.tile_size
+        left = self.canvas.canvasx(0)
+        top = self.canvas.canvasy(0)
+        right = left + self.canvas.winfo_width()
+        bottom = top + self.canvas.winfo_height()
+        cols = math.ceil(self.pyramid.size[0] * self.scale / t)
+        rows = math.ceil(self.pyramid.size[1] * self.scale / t)
+        visible = set()
+        for j in range(max(int(top // t), 0), min(int(bottom // t) + 1, rows)):
+            for i in range(max(int(left // t), 0), min(int(right // t) + 1, cols)):
+                visible.add((i, j))
+                if (i, j) not in self._items:
+                    # NOTE: the photo is referenced here too, the cache may evict a tile that is still shown
+                    photo = self._tile(i, j)
+                    self._items[(i, j)] = (self.canvas.create_image(i * t, j * t, anchor=tk.NW, image=photo, tags="tile"), photo)
+        # NOTE: tiles that scrolled out of view are dropped from the canvas, their images stay cached
+        for key in [k for k in self._items if k not in visible]:
+            self.canvas.delete(self._items.pop(key)[0])
+
+    def _tile(self, i: int, j: int) -> ImageTk.PhotoImage:
+        key = (self.scale, i, j)
+        photo = self._tiles.get(key)
+        if photo is not None:
+            self._tiles.move_to_end(key)
+            return photo
+        t = self.tile_size
+        page_w, page_h = self.pyramid.size
+        width = min(t, math.ceil(page_w * self.scale) - i * t)
+        height = min(t, math.ceil(page_h * self.scale) - j * t)
+        box = (i * t / self.scale, j * t / self.scale, (i * t + width) / self.scale, (j * t + height) / self.scale)
+        tile = self.pyramid.region(box, (width, height))
+        if self.board is not None:
+            # NOTE: an annotation that can't be drawn is left out, the rest of the tile still shows
+            tile = Image.alpha_composite(tile.convert("RGBA"), self.board.render_overlay((width, height), box=box, skip_bad_items=True))
+        photo = ImageTk.PhotoImage(tile)
+        self._tiles[key] = photo
+        while len(self._tiles) > MAX_CACHED_TILES:
+            self._tiles.popitem(last=False)
+        return photo
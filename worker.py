@@ -0,0 +1,80 @@
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+import queue
+import threading
+
+from components import PipelineCancelled
+
+class Job:
+    __slots__ = ("id", "cancelled", "_events")
+
+    def __init__(self, id: int, events: queue.Queue):
+        self.id = id
+        self.cancelled = threading.Event()
+        self._events = events
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def progress(self, stage: str, index: int, total: int):
+        """
+        Pass as `Pipeline.run(progress=...)`: reports the stage and stops the run once the job is cancelled.
+        """
+        if self.cancelled.is_set():
+            raise PipelineCancelled()
+        self._events.put(("progress", self.id, stage, index, total))
+
+class JobRunner:
+    """
+    Runs jobs one at a time on a background thread. Submitting a job cancels
+    the one that is running (at its next stage) and any that are still queued,
+    so a burst of submissions only processes the last one. Progress and
+    results are put on `events` for the UI thread to poll.
+    """
+    def __init__(self):
+        self.events = queue.Queue()
+        self.latest = None
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="birdnest")
+
+    def submit(self, fn) -> Job:
+        """
+        Schedules `fn(job)`. Its return value is posted as ("done", job id, result).
+        """
+        with self._lock:
+            if self.latest is not None:
+                self.latest.cancel()
+            job = Job(next(self._ids), self.events)
+            self.latest = job
+        self._executor.submit(self._run, job, fn)
+        return job
+
+    def _run(self, job: Job, fn):
+        if job.cancelled.is_set():
+            self.events.put(("cancelled", job.id))
+            return
+        try:
+            result = fn(job)
+        except PipelineCancelled:
+            self.events.put(("cancelled", job.id))
+        except Exception as e:
+            self.events.put(("error", job.id, e))
+        else:
+            self.events.put(("done", job.id, result))
+
+    def is_latest(self, job_id: int) -> bool:
+        return self.latest is not None and self.latest.id == job_id
+
+    def drain(self) -> list[tuple]:
+        found = []
+        while True:
+            try:
+                found.append(self.events.get_nowait())
+            except queue.Empty:
+                return found
+
+    def shutdown(self):
+        if self.latest is not None:
+            self.latest.cancel()
+        self._executor.shutdown(wait=False)